@@ -0,0 +1,252 @@
+## @file allocations.py
+# @package profiler
+# @brief Tracking of the memory allocation sites, with top-N reports and growth diffing
+#
+# The memory sampler tells how much memory the process uses, not who allocates it. The allocation tracker records
+# the source line of every allocation through the tracemalloc module, available in Python 3.4+ and in the Python 2.7
+# builds patched with pytracemalloc (https://pypi.python.org/pypi/pytracemalloc). Only the innermost frame of every
+# allocation is recorded by default, keeping the overhead and the memory used by the traces bounded.\n\n
+# When tracemalloc is not available, the tracker falls back to counting the objects tracked by the garbage collector
+# per type: the allocation sites are replaced by the object types, and the sizes are the shallow sizes of the
+# objects as returned by sys.getsizeof(). In this mode nothing is recorded between two snapshots, the cost is paid
+# only when a snapshot is taken. The garbage collector does not know where the objects have been allocated, so the
+# object types are not linked to the functions and the reports say so.\n\n
+# A snapshot maps every allocation site, a (file name, line number) pair, to the size in bytes and the number of the
+# memory blocks allocated there and still alive. Two snapshots can be compared to find the sites whose memory grows,
+# and every site is linked to the function containing it in the timing statistics of the same profiler.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.\n
+#
+# Copyright NXP PLMA.  All Rights Reserved.\n
+#
+# Licensed under the Apache License, Version 2.0 (the "License");\n
+# you may not use this file except in compliance with the License.\n
+# You may obtain a copy of the License at\n
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+# either express or implied.  See the License for the specific language
+# governing permissions and limitations under the License.
+#
+# @date March 2016
+# @author Enrico Miglino <enrico.miglino@gmail.com>
+# @version 0.1.5
+# @version documentation version 0.5
+
+import sys, os, gc, bisect
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+## Default number of frames recorded for every allocation
+DEFAULT_FRAMES = 1
+
+## Default number of sites in the reports
+DEFAULT_LIMIT = 10
+
+##
+# AllocationTracker class records the allocation sites and takes their snapshots
+class AllocationTracker:
+
+    ##
+    # Constructor
+    #
+    # @param frames The number of frames recorded for every allocation, tracemalloc only
+    def __init__(self, frames = DEFAULT_FRAMES):
+        self.frames = frames
+        ## True if the allocations are traced by tracemalloc, False for the garbage collector fallback
+        self.tracing = tracemalloc is not None
+        self.started = False
+        ## True if the tracemalloc tracing has been started by the tracker, not by the program or the line timer
+        self.started_tracing = False
+
+    ## Start recording the allocations
+    def start(self):
+        if self.tracing and not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+            self.started_tracing = True
+        self.started = True
+
+    ##
+    # Stop recording the allocations
+    #
+    # The tracemalloc tracing is stopped, and the traces recorded so far lost, only if it has been started by the
+    # tracker.
+    def stop(self):
+        if self.started_tracing:
+            self.started_tracing = False
+            tracemalloc.stop()
+        self.started = False
+
+    ##
+    # Return the snapshot of the live allocations
+    #
+    # @return A dictionary mapping every allocation site, a (file name, line number) pair, to a (size in bytes,
+    # number of blocks) pair
+    def snapshot(self):
+        if self.tracing:
+            return self._traced_snapshot()
+        return self._gc_snapshot()
+
+    ## Snapshot of the tracemalloc traces, excluding the allocations of the tracker itself
+    def _traced_snapshot(self):
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, os.path.splitext(__file__)[0] + '.py*'),
+        ))
+        sites = {}
+        for statistic in snapshot.statistics('lineno'):
+            frame = statistic.traceback[0]
+            sites[(frame.filename, frame.lineno)] = (statistic.size, statistic.count)
+        return sites
+
+    ## Snapshot of the objects tracked by the garbage collector, by type
+    def _gc_snapshot(self):
+        sites = {}
+        getsizeof = sys.getsizeof
+        for obj in gc.get_objects():
+            site = ('<%s>' % type(obj).__name__, 0)
+            size, count = sites.get(site, (0, 0))
+            try:
+                size += getsizeof(obj)
+            except TypeError:
+                pass
+            sites[site] = (size, count + 1)
+        return sites
+
+##
+# Return the top allocation sites of a snapshot
+#
+# @param sites The snapshot
+# @param limit The number of sites to return
+# @param key 'size' to sort by size in bytes, 'count' to sort by number of blocks
+# @return A list of (site, size, count) tuples, largest first
+def top(sites, limit = DEFAULT_LIMIT, key = 'size'):
+    column = 0 if key == 'size' else 1
+    rows = sorted(sites.iteritems(), key = lambda item: item[1][column], reverse = True)[:limit]
+    return [(site, size, count) for site, (size, count) in rows]
+
+##
+# Compare two snapshots and return the sites with the largest growth
+#
+# @param old The older snapshot
+# @param new The newer snapshot
+# @param limit The number of sites to return
+# @param key 'size' to sort by growth in bytes, 'count' to sort by growth in number of blocks
+# @return A list of (site, size difference, count difference, size, count) tuples, largest growth first
+def compare(old, new, limit = DEFAULT_LIMIT, key = 'size'):
+    rows = []
+    for site in set(old) | set(new):
+        old_size, old_count = old.get(site, (0, 0))
+        size, count = new.get(site, (0, 0))
+        if size != old_size or count != old_count:
+            rows.append((site, size - old_size, count - old_count, size, count))
+    column = 1 if key == 'size' else 2
+    rows.sort(key = lambda row: row[column], reverse = True)
+    return rows[:limit]
+
+##
+# FunctionIndex class finds the function containing a source line in a timing snapshot
+#
+# The functions of every file are sorted by first line number: the function containing a line is the function
+# with the nearest first line number not after the line.
+class FunctionIndex:
+
+    ##
+    # Constructor
+    #
+    # @param stats The timing snapshot, in the pstats format
+    def __init__(self, stats):
+        self.stats = stats
+        functions = {}
+        for func in stats:
+            functions.setdefault(os.path.normcase(func[0]), []).append((func[1], func))
+        for entries in functions.itervalues():
+            entries.sort()
+        self.lines = dict((filename, [entry[0] for entry in entries]) for filename, entries in functions.iteritems())
+        self.functions = functions
+
+    ##
+    # Return the function containing a source line, or None if not found
+    #
+    # @param filename The source file name
+    # @param lineno The line number
+    def find(self, filename, lineno):
+        filename = os.path.normcase(filename)
+        lines = self.lines.get(filename)
+        if not lines:
+            return None
+        index = bisect.bisect_right(lines, lineno) - 1
+        if index < 0:
+            return None
+        return self.functions[filename][index][1]
+
+## Format a site or a function label for the reports
+def _label(site):
+    if site is None:
+        return '-'
+    if len(site) == 2:
+        return '%s:%d' % (os.path.basename(site[0]), site[1]) if site[1] else site[0]
+    return '%s:%d(%s)' % (os.path.basename(site[0]), site[1], site[2])
+
+## Note printed before the reports of the garbage collector fallback
+NO_SITES = ("tracemalloc is not available: the objects tracked by the garbage collector are counted by type, "
+            "without allocation sites nor functions")
+
+##
+# Print the top allocation sites, with the function containing them and its timing statistics
+#
+# @param stream The output stream
+# @param rows The (site, size, count) rows as returned by top()
+# @param stats The timing snapshot the sites are linked to
+# @param sites False if the rows are the object types of the garbage collector fallback
+def print_top(stream, rows, stats, sites = True):
+    if sites:
+        index = FunctionIndex(stats)
+        print >> stream, "%12s %10s  %-36s %-40s %10s %10s" % (
+            "Size (KiB)", "Blocks", "Allocation site", "Function", "ncalls", "tottime")
+    else:
+        index = None
+        print >> stream, NO_SITES
+        print >> stream, "%12s %10s  %s" % ("Size (KiB)", "Blocks", "Object type")
+    for site, size, count in rows:
+        _print_row(stream, index, site, "%12.1f %10d" % (size / 1024.0, count))
+    print >> stream
+
+##
+# Print the allocation sites with the largest growth, with the function containing them and its timing statistics
+#
+# @param stream The output stream
+# @param rows The (site, size difference, count difference, size, count) rows as returned by compare()
+# @param stats The timing snapshot the sites are linked to
+# @param sites False if the rows are the object types of the garbage collector fallback
+def print_compare(stream, rows, stats, sites = True):
+    if sites:
+        index = FunctionIndex(stats)
+        print >> stream, "%12s %10s %12s  %-36s %-40s %10s %10s" % (
+            "Growth (KiB)", "Blocks", "Size (KiB)", "Allocation site", "Function", "ncalls", "tottime")
+    else:
+        index = None
+        print >> stream, NO_SITES
+        print >> stream, "%12s %10s %12s  %s" % ("Growth (KiB)", "Blocks", "Size (KiB)", "Object type")
+    for site, size_diff, count_diff, size, count in rows:
+        _print_row(stream, index, site, "%+12.1f %+10d %12.1f" % (size_diff / 1024.0, count_diff, size / 1024.0))
+    print >> stream
+
+## Print a report row, linking the allocation site to the timing statistics when the sites are known
+def _print_row(stream, index, site, counters):
+    if index is None:
+        print >> stream, "%s  %s" % (counters, _label(site))
+        return
+    func = index.find(site[0], site[1]) if site[1] else None
+    if func is None:
+        print >> stream, "%s  %-36s %-40s %10s %10s" % (counters, _label(site), '-', '-', '-')
+    else:
+        stat = index.stats[func]
+        print >> stream, "%s  %-36s %-40s %10d %10.3f" % (counters, _label(site), _label(func), stat[1], stat[2])
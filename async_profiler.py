@@ -0,0 +1,328 @@
+## @file async_profiler.py
+# @package profiler
+# @brief Profiler of the asyncio event loop, attributing the time to the tasks and the coroutines
+#
+# The deterministic profiler charges the time spent waiting in an event loop to the frames active while the loop
+# waits, and splits the work of a coroutine among the many resumptions of its generator. The async profiler measures
+# the event loop instead: every callback run by the loop is timed, and the callbacks stepping a task are charged to
+# the task and to its coroutine. For every coroutine the profiler reports the number of tasks, the number of steps,
+# the time the tasks held the loop (running) and the time they were suspended waiting for a future, from the first
+# step to the end of the task or to the report.\n\n
+# A heartbeat callback is scheduled at a fixed interval: the delay between the planned and the actual execution of
+# the heartbeat is the loop lag, the time a ready callback waits for the loop. The lag is recorded in a latency
+# histogram, and the callbacks running longer than a threshold are recorded as slow callbacks blocking the loop.\n\n
+# The statistics are converted to the pstats format so the usual reports work: every coroutine is a function whose
+# calls are the task steps, whose primitive calls are the tasks, whose internal time is the running time and whose
+# cumulative time is the running plus the suspended time. The plain callbacks are reported with their running time.\n\n
+# The asyncio module is used when available, else the trollius package, its port to Python 2
+# (https://pypi.python.org/pypi/trollius).
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.\n
+#
+# Copyright NXP PLMA.  All Rights Reserved.\n
+#
+# Licensed under the Apache License, Version 2.0 (the "License");\n
+# you may not use this file except in compliance with the License.\n
+# You may obtain a copy of the License at\n
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+# either express or implied.  See the License for the specific language
+# governing permissions and limitations under the License.
+#
+# @date March 2016
+# @author Enrico Miglino <enrico.miglino@gmail.com>
+# @version 0.1.5
+# @version documentation version 0.5
+
+import time, types, threading, collections, functools, weakref, marshal
+import cProfile, pstats
+import histogram, regions
+
+try:
+    import asyncio
+except ImportError:
+    try:
+        import trollius as asyncio
+    except ImportError:
+        asyncio = None
+
+## Default interval of the loop heartbeat, in seconds
+DEFAULT_HEARTBEAT = 0.1
+
+## Default duration over which a callback is recorded as slow, in seconds
+DEFAULT_SLOW = 0.1
+
+## Number of slow callbacks retained
+SLOW_CALLBACKS = 100
+
+## Pause state of a thread, see AsyncProfiler.pause_thread()
+class _ThreadState(threading.local):
+    ## The (wall, CPU) times the thread has been paused at, None while the thread is measured
+    paused = None
+    ## The total (wall, CPU) time the thread has been paused, not charged to the callback running meanwhile
+    excluded = (0.0, 0.0)
+
+##
+# AsyncProfiler class is a timing collector with the same interface of cProfile.Profile, measuring the event loop
+class AsyncProfiler:
+
+    ##
+    # Constructor
+    #
+    # @param heartbeat The interval of the loop heartbeat, in seconds
+    # @param slow The duration over which a callback is recorded as slow, in seconds
+    def __init__(self, heartbeat = DEFAULT_HEARTBEAT, slow = DEFAULT_SLOW):
+        if asyncio is None:
+            raise ImportError("The async profiler needs the asyncio module or the trollius package")
+        self.heartbeat = heartbeat
+        self.slow = slow
+        ##
+        # The live tasks: task -> [coroutine label, first step time, steps, running time, CPU time]. The tasks are
+        # removed by their done callback, and the tasks never finished when they are garbage collected
+        self.tasks = weakref.WeakKeyDictionary()
+        ## Totals of the finished tasks by coroutine label: [tasks, steps, running time, CPU time, suspended time]
+        self.coroutines = {}
+        ## Totals of the plain callbacks by label: [calls, running time, CPU time]
+        self.callbacks = {}
+        ## Latency histogram of the loop lag
+        self.lag = histogram.LatencyHistogram()
+        ## The last slow callbacks, as (time, label, duration) tuples
+        self.slow_callbacks = collections.deque(maxlen = SLOW_CALLBACKS)
+        ## Total number of slow callbacks
+        self.slow_count = 0
+        ## Callables invoked with the lag in seconds at every heartbeat
+        self.lag_listeners = []
+        ## The statistics created by the last create_stats() call
+        self.stats = {}
+        self.loop = None
+        self.original = None
+        ## Number of enable() calls, telling the current heartbeat from the heartbeat of a previous enable()
+        self.generation = 0
+        ## The labels of the functions and of the code objects, dropped with them
+        self.labels = weakref.WeakKeyDictionary()
+        self.local = _ThreadState()
+
+    ##
+    # Start measuring the event loop of the calling thread
+    #
+    # The Handle class of the loop is patched to time every callback, and the heartbeat is scheduled.
+    def enable(self):
+        if self.original is not None:
+            return
+        profiler = self
+        # The function defined by the class, put back as it is by disable()
+        original = self.original = vars(asyncio.Handle)['_run']
+        clock = time.time
+        cpu_clock = regions.cpu_clock
+        local = self.local
+
+        def _run(handle):
+            if local.paused is not None:
+                return original(handle)
+            excluded = local.excluded
+            start = clock()
+            cpu = cpu_clock()
+            try:
+                return original(handle)
+            finally:
+                wall = clock() - start
+                cpu = cpu_clock() - cpu
+                if local.excluded is not excluded:
+                    wall -= local.excluded[0] - excluded[0]
+                    cpu -= local.excluded[1] - excluded[1]
+                profiler.record(handle._callback, start, wall, cpu)
+        asyncio.Handle._run = _run
+        self.generation += 1
+        self.loop = asyncio.get_event_loop()
+        self.loop.call_soon(self._beat, self.loop.time(), self.generation)
+
+    ## Stop measuring the event loop. The live tasks are still charged when they run again
+    def disable(self):
+        if self.original is not None:
+            asyncio.Handle._run = self.original
+            self.original = None
+
+    ## Return True if the event loop is measured
+    def is_running(self):
+        return self.original is not None
+
+    ##
+    # Stop measuring the calling thread only, until resume_thread() is called
+    #
+    # The callbacks run meanwhile by the thread are not charged, and the paused time is not charged to the callback
+    # running when the thread is paused.
+    def pause_thread(self):
+        if self.local.paused is None:
+            self.local.paused = time.time(), regions.cpu_clock()
+
+    ## Measure again the calling thread stopped by pause_thread()
+    def resume_thread(self):
+        paused = self.local.paused
+        if paused is not None:
+            wall, cpu = self.local.excluded
+            self.local.excluded = wall + time.time() - paused[0], cpu + regions.cpu_clock() - paused[1]
+            self.local.paused = None
+
+    ##
+    # Heartbeat callback, recording the loop lag and scheduling the next heartbeat
+    #
+    # The heartbeat stops when the profiler is disabled, or when it has been enabled again before the heartbeat ran.
+    def _beat(self, planned, generation):
+        if self.original is None or generation != self.generation:
+            return
+        now = self.loop.time()
+        lag = max(now - planned, 0.0)
+        self.lag.record(lag)
+        for listener in self.lag_listeners:
+            listener(lag)
+        self.loop.call_at(now + self.heartbeat, self._beat, now + self.heartbeat, generation)
+
+    ##
+    # Return the label of a callback or of a code object
+    #
+    # The labels are cached by function with weak references, the bound methods and the partial objects are unwrapped
+    # first so the cache does not keep alive the objects they refer to. The objects not supporting the weak references,
+    # as the builtin functions, are not cached.
+    def label(self, func):
+        while True:
+            if isinstance(func, functools.partial):
+                func = func.func
+            elif getattr(func, '__func__', None) is not None:
+                func = func.__func__
+            else:
+                break
+        try:
+            return self.labels[func]
+        except (KeyError, TypeError):
+            pass
+        code = func if isinstance(func, types.CodeType) else getattr(func, 'func_code', None)
+        if code is None:
+            label = ('~', 0, '<%s>' % getattr(func, '__name__', type(func).__name__))
+        else:
+            label = cProfile.label(code)
+        try:
+            self.labels[func] = label
+        except TypeError:
+            pass
+        return label
+
+    ##
+    # Charge an execution of a callback
+    #
+    # @param callback The callback run by the loop
+    # @param start The time the callback started
+    # @param wall The running time of the callback
+    # @param cpu The CPU time of the callback
+    def record(self, callback, start, wall, cpu):
+        owner = getattr(callback, '__self__', None)
+        if owner is self:
+            return
+        if isinstance(owner, asyncio.Task):
+            entry = self.tasks.get(owner)
+            if entry is None:
+                coro = getattr(owner, '_coro', None)
+                coro = getattr(coro, 'gen', coro)
+                entry = self.tasks[owner] = [self.label(getattr(coro, 'gi_code', coro)), start, 0, 0.0, 0.0]
+                owner.add_done_callback(self._task_done)
+            label = entry[0]
+            entry[2] += 1
+            entry[3] += wall
+            entry[4] += cpu
+            if owner.done():
+                del self.tasks[owner]
+                self._add_task(self.coroutines, entry, start + wall)
+        else:
+            label = self.label(callback)
+            entry = self.callbacks.get(label)
+            if entry is None:
+                entry = self.callbacks[label] = [0, 0.0, 0.0]
+            entry[0] += 1
+            entry[1] += wall
+            entry[2] += cpu
+        if wall >= self.slow:
+            self.slow_count += 1
+            self.slow_callbacks.append((start, label, wall))
+
+    ## Done callback of the tasks, adding to the coroutine totals the tasks finished while the profiler is disabled
+    def _task_done(self, task):
+        entry = self.tasks.pop(task, None)
+        if entry is not None:
+            self._add_task(self.coroutines, entry, time.time())
+
+    ## Add a task entry to the coroutine totals, the task lifetime ending at the given time
+    def _add_task(self, coroutines, entry, end):
+        label, first, steps, running, cpu = entry
+        totals = coroutines.get(label)
+        if totals is None:
+            totals = coroutines[label] = [0, 0, 0.0, 0.0, 0.0]
+        totals[0] += 1
+        totals[1] += steps
+        totals[2] += running
+        totals[3] += cpu
+        totals[4] += max(end - first - running, 0.0)
+
+    ##
+    # Return the coroutine totals, the live tasks included with their lifetime up to now
+    #
+    # @return A dictionary mapping the coroutine labels to [tasks, steps, running time, CPU time, suspended time]
+    def coroutine_totals(self):
+        coroutines = dict((label, list(totals)) for label, totals in self.coroutines.items())
+        now = time.time()
+        for entry in list(self.tasks.values()):
+            self._add_task(coroutines, entry, now)
+        return coroutines
+
+    ## Return the statistics collected so far in the pstats format, without stopping the collector
+    def snapshot(self):
+        stats = {}
+        for label, (tasks, steps, running, cpu, suspended) in self.coroutine_totals().iteritems():
+            stats[label] = tasks, steps, running, running + suspended, {}
+        for label, (calls, running, cpu) in self.callbacks.items():
+            if label not in stats:
+                stats[label] = calls, calls, running, running, {}
+        return stats
+
+    ##
+    # Print the coroutine table and the loop lag
+    #
+    # @param stream The output stream
+    def print_loop(self, stream):
+        print >> stream, "%-48s %8s %10s %12s %12s %14s" % (
+            "Coroutine", "Tasks", "Steps", "Running (s)", "CPU (s)", "Suspended (s)")
+        rows = sorted(self.coroutine_totals().iteritems(), key = lambda item: item[1][2], reverse = True)
+        for label, (tasks, steps, running, cpu, suspended) in rows:
+            print >> stream, "%-48s %8d %10d %12.6f %12.6f %14.6f" % (
+                pstats.func_std_string(pstats.func_strip_path(label)), tasks, steps, running, cpu, suspended)
+        print >> stream
+        p50, p99 = self.lag.percentiles((50, 99))
+        print >> stream, "Loop lag: %d heartbeats, p50 %.3f ms, p99 %.3f ms, max %.3f ms" % (
+            self.lag.count, p50 * 1000, p99 * 1000, self.lag.max * 1000)
+        print >> stream, "Slow callbacks (over %.3f s): %d" % (self.slow, self.slow_count)
+        for start, label, duration in self.slow_callbacks:
+            print >> stream, "  %s %-48s %10.3f s" % (
+                time.strftime('%H:%M:%S', time.localtime(start)), pstats.func_std_string(pstats.func_strip_path(label)),
+                duration)
+        print >> stream
+
+    ## Stop measuring and record the results internally as the current profile
+    def create_stats(self):
+        self.disable()
+        self.stats = self.snapshot()
+
+    ## Create a stats object based on the current profile and print the results to stdout
+    def print_stats(self, sort = -1):
+        pstats.Stats(self).strip_dirs().sort_stats(sort).print_stats()
+
+    ## Write the results of the current profile to file, in the same format of cProfile
+    def dump_stats(self, file):
+        f = open(file, 'wb')
+        try:
+            self.create_stats()
+            marshal.dump(self.stats, f)
+        finally:
+            f.close()
@@ -0,0 +1,228 @@
+## @file benchmark.py
+# @package profiler
+# @brief Benchmarks measuring the cost of the profiler itself
+#
+# The benchmarks measure the time added by the profiler to the profiled program, in two ways:
+# <ul>
+# <li>the micro-benchmarks run a call to a disabled profiler in a tight loop and subtract the time of the same loop
+# with an empty body, so the result is the cost of a single call. The spread of the empty loop repetitions is
+# reported as the noise of the measure</li>
+# <li>the workload suite runs synthetic workloads (a tight loop, a deep recursion, many small calls, allocations
+# and I/O) with no profiler and with the profiler in every mode: disabled, deterministic, sampling, memory sampling
+# and deterministic with memory sampling together. The overhead of every mode is reported as the ratio between the
+# workload time in that mode and the time with no profiler</li>
+# </ul>
+# The best of several repetitions is taken, and the modes are alternated in every repetition so a slow drift of the
+# machine speed affects all of them alike. The results are printed as JSON when the module is run as a script,
+# optionally restricted to some workloads:
+# \code
+# python benchmark.py [workload ...]
+# \endcode
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.\n
+#
+# Copyright NXP PLMA.  All Rights Reserved.\n
+#
+# Licensed under the Apache License, Version 2.0 (the "License");\n
+# you may not use this file except in compliance with the License.\n
+# You may obtain a copy of the License at\n
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+# either express or implied.  See the License for the specific language
+# governing permissions and limitations under the License.
+#
+# @date March 2016
+# @author Enrico Miglino <enrico.miglino@gmail.com>
+# @version 0.1.5
+# @version documentation version 0.5
+
+import sys, os, time, json, platform, tempfile
+import profile
+
+## Default number of loop iterations of a measure
+DEFAULT_NUMBER = 1000000
+
+## Default number of repetitions of a measure
+DEFAULT_REPEAT = 5
+
+## Profiler modes compared by the workload suite, the first one with no profiler
+MODES = ('baseline', 'disabled', 'deterministic', 'sampling', 'memory', 'combined')
+
+## Memory sampling interval of the workload suite, the shortest suggested for the memory sampler
+MEMORY_INTERVAL = 0.01
+
+##
+# Return the times in seconds of the repetitions of a loop executing a statement
+#
+# The loop is compiled as a function so the loop variables are local, as in the profiled code.
+#
+# @param statement The statement to execute, as a string
+# @param namespace The global names used by the statement
+# @param number The number of loop iterations
+# @param repeat The number of repetitions
+def loop_times(statement, namespace, number = DEFAULT_NUMBER, repeat = DEFAULT_REPEAT):
+    source = "def _loop(_number):\n    for _index in xrange(_number):\n        %s\n" % statement
+    namespace = dict(namespace)
+    exec source in namespace
+    loop = namespace['_loop']
+    clock = time.time
+    times = []
+    for repetition in range(repeat):
+        start = clock()
+        loop(number)
+        times.append(clock() - start)
+    return times
+
+##
+# Measure the cost of the calls to a disabled profiler
+#
+# @return A dictionary with the cost in nanoseconds of every measured call, the time of the empty loop iteration and
+# its noise
+def disabled_call_cost(number = DEFAULT_NUMBER, repeat = DEFAULT_REPEAT):
+    namespace = {'profiler': profile.Profile(False)}
+    empty = loop_times('pass', namespace, number, repeat)
+    baseline = min(empty)
+    noise = (max(empty) - baseline) / number * 1e9
+    calls = {}
+    for statement in ('profiler.enable()', 'profiler.disable()', 'profiler.memory_usage()',
+                      'profiler.sample_memory()', 'profiler.profile_module("module")'):
+        calls[statement] = (min(loop_times(statement, namespace, number, repeat)) - baseline) / number * 1e9
+    return {'empty_loop_ns': baseline / number * 1e9, 'noise_ns': noise, 'calls_ns': calls}
+
+## Workload: arithmetic in a tight loop, with no function calls
+def tight_loop():
+    total = 0
+    for index in xrange(300000):
+        total += index * index
+    return total
+
+## Recursive function of the recursion workload
+def _depth(n):
+    if n == 0:
+        return 0
+    return _depth(n - 1) + 1
+
+## Workload: deep recursions
+def recursion():
+    for repetition in xrange(100):
+        _depth(500)
+
+## Small function of the small calls workload
+def _add(a, b):
+    return a + b
+
+## Workload: many calls to a small function
+def small_calls():
+    total = 0
+    for index in xrange(100000):
+        total = _add(total, index)
+    return total
+
+## Workload: allocation of many small objects and containers
+def allocation():
+    for repetition in xrange(20):
+        items = [{'key': index, 'value': [index] * 4} for index in xrange(5000)]
+        del items
+
+## Workload: writes and reads of a temporary file, synced to the disk, and short sleeps
+def io_bound():
+    handle, filename = tempfile.mkstemp()
+    try:
+        block = 'x' * 4096
+        for repetition in xrange(20):
+            os.lseek(handle, 0, os.SEEK_SET)
+            for index in xrange(16):
+                os.write(handle, block)
+            os.fsync(handle)
+            os.lseek(handle, 0, os.SEEK_SET)
+            while os.read(handle, 65536):
+                pass
+            time.sleep(0.001)
+    finally:
+        os.close(handle)
+        os.unlink(filename)
+
+## The workloads of the suite, by name
+WORKLOADS = (('tight_loop', tight_loop), ('recursion', recursion), ('small_calls', small_calls),
+             ('allocation', allocation), ('io_bound', io_bound))
+
+## Create and start a profiler in a mode of the suite, None for the baseline
+def _start(mode):
+    if mode == 'baseline':
+        return None
+    if mode == 'disabled':
+        profiler = profile.Profile(False)
+        profiler.enable()
+        profiler.sample_memory(interval = MEMORY_INTERVAL)
+        return profiler
+    profiler = profile.Profile(True, mode = 'sampling' if mode == 'sampling' else 'deterministic')
+    if mode != 'memory':
+        profiler.enable()
+    if mode in ('memory', 'combined'):
+        profiler.sample_memory(interval = MEMORY_INTERVAL)
+    return profiler
+
+## Stop a profiler started by _start()
+def _stop(profiler):
+    if profiler is not None:
+        profiler.disable()
+        profiler.stop_memory()
+
+##
+# Measure a workload with no profiler and with the profiler in every mode
+#
+# A new profiler is created for every run, so the data collected by the previous runs do not affect the measure.
+#
+# @param workload The workload function
+# @param repeat The number of repetitions
+# @return A dictionary with the best time of every mode, in seconds, and its ratio to the baseline time. The spread
+# of the baseline repetitions, relative to the best time, is reported as the noise of the ratios
+def measure_workload(workload, repeat = DEFAULT_REPEAT):
+    times = dict((mode, []) for mode in MODES)
+    clock = time.time
+    workload()
+    for repetition in range(repeat):
+        for mode in MODES:
+            profiler = _start(mode)
+            start = clock()
+            workload()
+            times[mode].append(clock() - start)
+            _stop(profiler)
+    baseline = min(times['baseline'])
+    results = dict((mode, {'seconds': min(times[mode]), 'ratio': min(times[mode]) / baseline}) for mode in MODES)
+    results['noise'] = (max(times['baseline']) - baseline) / baseline
+    return results
+
+##
+# Run the workload suite
+#
+# @param names The names of the workloads to run, all the workloads if empty
+# @param repeat The number of repetitions of every measure
+# @return A dictionary mapping the workload names to their measures, see measure_workload()
+def workload_suite(names = (), repeat = DEFAULT_REPEAT):
+    return dict((name, measure_workload(workload, repeat)) for name, workload in WORKLOADS if not names or name in names)
+
+## Command line entry point, printing the results as JSON
+def main(argv):
+    unknown = [name for name in argv if name not in dict(WORKLOADS)]
+    if unknown:
+        print >> sys.stderr, "Unknown workloads: %s. Available: %s" % (
+            ', '.join(unknown), ', '.join(name for name, workload in WORKLOADS))
+        return 2
+    results = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'disabled': disabled_call_cost(),
+        'workloads': workload_suite(argv),
+    }
+    json.dump(results, sys.stdout, indent = 2, sort_keys = True)
+    print
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
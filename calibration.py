@@ -0,0 +1,273 @@
+## @file calibration.py
+# @package profiler
+# @brief Calibration of the cProfile overhead and correction of the reported times
+#
+# The times reported by cProfile include the cost of its own hook: every call charges some hook time to the called
+# function and some to the caller. The small functions called very often look slower than they are, and so do the
+# functions calling them. The calibration measures the two costs per call on the running host:
+# <ul>
+# <li>the callee bias: the internal time reported for an empty function, less the real cost of a call measured
+# without the profiler (the real cost of a call is charged to the callee)</li>
+# <li>the caller bias: the internal time reported for a loop calling the empty function, less the real time of the
+# same loop without the calls, per call done</li>
+# </ul>
+# The correction subtracts from the internal time of every function the callee bias for each of its calls and the
+# caller bias for each call it does. The cumulative time is corrected by the bias removed from the function and,
+# proportionally to the call graph edges, from its callees. The corrections are estimates: the adjusted reports show
+# the raw times side by side.\n\n
+# The calibration takes about a second and is cached per host and Python version in a JSON file in the user cache
+# directory.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.\n
+#
+# Copyright NXP PLMA.  All Rights Reserved.\n
+#
+# Licensed under the Apache License, Version 2.0 (the "License");\n
+# you may not use this file except in compliance with the License.\n
+# You may obtain a copy of the License at\n
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+# either express or implied.  See the License for the specific language
+# governing permissions and limitations under the License.
+#
+# @date March 2016
+# @author Enrico Miglino <enrico.miglino@gmail.com>
+# @version 0.1.5
+# @version documentation version 0.5
+
+import sys, os, time, json, socket, platform, tempfile
+import cProfile, pstats, _lsprof
+import snapshot
+
+## Default path of the calibration cache
+CACHE_FILE = os.path.join(os.path.expanduser('~'), '.cache', 'profiler', 'calibration.json')
+
+## Number of calls measured by the calibration
+CALIBRATION_CALLS = 200000
+
+## Number of repetitions of the calibration measures, the best one is taken
+CALIBRATION_REPEAT = 3
+
+## Default number of functions in the adjusted report
+DEFAULT_LIMIT = 30
+
+## Empty function called by the calibration
+def _empty():
+    pass
+
+## Loop calling the empty function
+def _calls(number):
+    call = _empty
+    for index in xrange(number):
+        call()
+
+## The same loop with no calls
+def _loop(number):
+    call = _empty
+    for index in xrange(number):
+        pass
+
+## Return the best time of a function called with a number of calls
+def _best(func, number):
+    clock = time.time
+    times = []
+    for repetition in xrange(CALIBRATION_REPEAT):
+        start = clock()
+        func(number)
+        times.append(clock() - start)
+    return min(times)
+
+##
+# Measure the cProfile bias per call
+#
+# The profile hook of the calling thread is removed while the calls are measured, see _unhooked().
+#
+# @param number The number of calls measured
+# @return A (callee bias, caller bias) pair, in seconds per call
+def measure(number = CALIBRATION_CALLS):
+    return _unhooked(_measure, number)
+
+##
+# Call a function with the profile hook of the calling thread removed, putting it back afterwards
+#
+# A profiler running in the thread does not record the calibration calls. A cProfile collector is hooked back by its
+# enable() method, keeping its pending calls, the other hooks by sys.setprofile().
+def _unhooked(func, *args):
+    hook = sys.getprofile()
+    sys.setprofile(None)
+    try:
+        return func(*args)
+    finally:
+        if isinstance(hook, _lsprof.Profiler):
+            hook.enable()
+        else:
+            sys.setprofile(hook)
+
+## Measure the cProfile bias per call, with no profile hook installed
+def _measure(number):
+    loop = _best(_loop, number)
+    call = (_best(_calls, number) - loop) / number
+    callee = caller = None
+    for repetition in xrange(CALIBRATION_REPEAT):
+        collector = cProfile.Profile()
+        collector.enable()
+        _calls(number)
+        collector.disable()
+        stats = snapshot.take_snapshot(collector)
+        empty = stats[cProfile.label(_empty.func_code)][2] / number - call
+        loops = (stats[cProfile.label(_calls.func_code)][2] - loop) / number
+        callee = empty if callee is None else min(callee, empty)
+        caller = loops if caller is None else min(caller, loops)
+    return max(callee, 0.0), max(caller, 0.0)
+
+## Return the key of the running host and Python version in the calibration cache
+def host_key():
+    return '%s %s %s' % (socket.gethostname(), platform.python_implementation(), platform.python_version())
+
+##
+# Return the cached bias of the running host, None if not cached
+#
+# @param path The path of the cache file
+def load(path = CACHE_FILE):
+    try:
+        source = open(path)
+        try:
+            entry = json.load(source).get(host_key())
+        finally:
+            source.close()
+    except (IOError, OSError, ValueError):
+        return None
+    if not entry:
+        return None
+    return entry['callee'], entry['caller']
+
+##
+# Store the bias of the running host in the cache. The errors are ignored, the cache is optional
+#
+# @param bias The (callee bias, caller bias) pair
+# @param path The path of the cache file
+def save(bias, path = CACHE_FILE):
+    try:
+        try:
+            source = open(path)
+            try:
+                cache = json.load(source)
+            finally:
+                source.close()
+        except (IOError, ValueError):
+            cache = {}
+        cache[host_key()] = {'callee': bias[0], 'caller': bias[1], 'time': time.time()}
+        directory = os.path.dirname(path)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        handle, temporary = tempfile.mkstemp(dir = directory)
+        out = os.fdopen(handle, 'w')
+        try:
+            json.dump(cache, out, indent = 2, sort_keys = True)
+        finally:
+            out.close()
+        os.rename(temporary, path)
+    except (IOError, OSError):
+        pass
+
+##
+# Return the bias of the running host, measuring it only if not cached
+#
+# The profile hook of the calling thread is removed meanwhile, see _unhooked().
+#
+# @param force If true the bias is measured again and the cache updated
+# @param path The path of the cache file
+# @return A (callee bias, caller bias) pair, in seconds per call
+def calibrate(force = False, path = CACHE_FILE):
+    return _unhooked(_calibrate, force, path)
+
+## Return the bias of the running host, with no profile hook installed
+def _calibrate(force, path):
+    bias = None if force else load(path)
+    if bias is None:
+        bias = measure()
+        save(bias, path)
+    return bias
+
+##
+# Return the statistics with the times corrected by the bias
+#
+# The internal times are corrected first. The bias removed from every function subtree is then computed in post
+# order along the call graph, the recursive edges excluded, and subtracted from the cumulative times. The edge
+# times are scaled as the times of the callee.
+#
+# @param stats The statistics in the pstats format
+# @param bias The (callee bias, caller bias) pair
+# @return The corrected statistics in the pstats format
+def adjust(stats, bias):
+    callee_bias, caller_bias = bias
+    calls_done = {}
+    callees = {}
+    for func, (cc, nc, tt, ct, callers) in stats.iteritems():
+        for caller, edge in callers.iteritems():
+            calls_done[caller] = calls_done.get(caller, 0) + edge[0]
+            if caller != func and caller in stats:
+                callees.setdefault(caller, []).append((func, edge[3]))
+
+    internal = {}
+    for func, (cc, nc, tt, ct, callers) in stats.iteritems():
+        internal[func] = max(tt - nc * callee_bias - calls_done.get(func, 0) * caller_bias, 0.0)
+
+    # Bias removed from the subtree of every function, by an iterative post order visit
+    removed = {}
+    active = set()
+    for root in stats:
+        if root in removed:
+            continue
+        pending = [(root, False)]
+        while pending:
+            func, expanded = pending.pop()
+            if expanded:
+                active.discard(func)
+                total = stats[func][2] - internal[func]
+                for callee, edge_time in callees.get(func, ()):
+                    callee_time = stats[callee][3]
+                    if callee in removed and callee_time > 0:
+                        total += removed[callee] * edge_time / callee_time
+                removed[func] = total
+            elif func not in removed and func not in active:
+                active.add(func)
+                pending.append((func, True))
+                for callee, edge_time in callees.get(func, ()):
+                    if callee not in removed and callee not in active:
+                        pending.append((callee, False))
+
+    adjusted = {}
+    for func, (cc, nc, tt, ct, callers) in stats.iteritems():
+        adjusted_ct = max(ct - removed[func], internal[func])
+        tt_ratio = internal[func] / tt if tt > 0 else 1.0
+        ct_ratio = adjusted_ct / ct if ct > 0 else 1.0
+        edges = dict((caller, (edge[0], edge[1], edge[2] * tt_ratio, edge[3] * ct_ratio))
+                     for caller, edge in callers.iteritems())
+        adjusted[func] = cc, nc, internal[func], adjusted_ct, edges
+    return adjusted
+
+##
+# Print the raw and the adjusted times side by side, sorted by adjusted internal time
+#
+# @param stream The output stream
+# @param stats The raw statistics in the pstats format
+# @param bias The (callee bias, caller bias) pair
+# @param limit The number of functions printed
+def print_adjusted(stream, stats, bias, limit = DEFAULT_LIMIT):
+    adjusted = adjust(stats, bias)
+    print >> stream, "Times adjusted for the profiler overhead: %.1f ns per call to the callee, %.1f ns to the caller" % (
+        bias[0] * 1e9, bias[1] * 1e9)
+    print >> stream, "%10s %12s %12s %12s %12s  %s" % (
+        "ncalls", "tottime", "adj tottime", "cumtime", "adj cumtime", "filename:lineno(function)")
+    rows = sorted(adjusted.iteritems(), key = lambda item: item[1][2], reverse = True)[:limit]
+    for func, (cc, nc, tt, ct, callers) in rows:
+        raw = stats[func]
+        print >> stream, "%10d %12.6f %12.6f %12.6f %12.6f  %s" % (
+            nc, raw[2], tt, raw[3], ct, pstats.func_std_string(pstats.func_strip_path(func)))
+    print >> stream
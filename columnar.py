@@ -0,0 +1,330 @@
+## @file columnar.py
+# @package profiler
+# @brief Compact columnar storage of the profiler statistics
+#
+# The pstats format keeps every function as a tuple of strings mapping to a tuple of counters and a dictionary of
+# callers: loading and merging many profile dumps through pstats.Stats.add() creates millions of small objects. The
+# columnar format stores the same data in a few flat arrays:
+# <ul>
+# <li>a string table, where every file and function name is stored once</li>
+# <li>the function table, with the file name index, the line number and the function name index of every
+# function</li>
+# <li>the counters of the functions, one array per counter</li>
+# <li>the call edges, with the caller and callee function indexes and one array per counter</li>
+# </ul>
+# The file starts with a fixed size header followed by the string table and the arrays, all aligned to 8 bytes and
+# stored little endian, so every column can be located from the header and read directly from a memory mapped file.
+# The counters are stored as doubles, exact up to 2^53 calls.\n\n
+# The merge_files() function combines any number of columnar files and cProfile dumps reading one file at a time,
+# so the memory used depends on the number of distinct functions and not on the number of files. The merged data can
+# be exported back to the pstats format for the usual reports. The module can also be run as a command line tool:
+# \code
+# python columnar.py merge merged.prfc worker1.prof worker2.prof ...
+# python columnar.py print merged.prfc [sort key]
+# \endcode
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.\n
+#
+# Copyright NXP PLMA.  All Rights Reserved.\n
+#
+# Licensed under the Apache License, Version 2.0 (the "License");\n
+# you may not use this file except in compliance with the License.\n
+# You may obtain a copy of the License at\n
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+# either express or implied.  See the License for the specific language
+# governing permissions and limitations under the License.
+#
+# @date March 2016
+# @author Enrico Miglino <enrico.miglino@gmail.com>
+# @version 0.1.5
+# @version documentation version 0.5
+
+import sys, os, mmap, marshal, struct, pstats
+from array import array
+import snapshot
+
+## Marker at the beginning of the columnar files
+MAGIC = 'PRFC'
+
+## Version of the columnar format
+VERSION = 1
+
+## File header: marker, version, number of strings, size of the string table, number of functions, number of edges
+HEADER = struct.Struct('<4sIIIII')
+
+## Names of the function columns, in file order, with their array type codes
+FUNCTION_COLUMNS = (('file', 'i'), ('line', 'i'), ('name', 'i'),
+                    ('cc', 'd'), ('nc', 'd'), ('tt', 'd'), ('ct', 'd'))
+
+## Names of the edge columns, in file order, with their array type codes. The counters follow the pstats callers order
+EDGE_COLUMNS = (('caller', 'i'), ('callee', 'i'),
+                ('e_nc', 'd'), ('e_cc', 'd'), ('e_tt', 'd'), ('e_ct', 'd'))
+
+## Return the padding needed to align a size to 8 bytes
+def _padding(size):
+    return -size % 8
+
+##
+# ColumnarStats class keeps the profiler statistics in interned tables and flat arrays
+class ColumnarStats:
+
+    ##
+    # Constructor, creating an empty table
+    def __init__(self):
+        ## The string table
+        self.strings = []
+        self.string_index = {}
+        ## Function label (file name, line number, function name) -> function index
+        self.functions = {}
+        ## (caller index, callee index) -> edge index
+        self.edges = {}
+        ## The columns, by name
+        self.columns = {}
+        for name, code in FUNCTION_COLUMNS + EDGE_COLUMNS:
+            self.columns[name] = array(code)
+
+    ## Return the index of a string, adding it to the string table when needed
+    def _string(self, value):
+        index = self.string_index.get(value)
+        if index is None:
+            index = self.string_index[value] = len(self.strings)
+            self.strings.append(value)
+        return index
+
+    ## Return the index of a function, adding it to the function table when needed
+    def _function(self, func):
+        index = self.functions.get(func)
+        if index is None:
+            index = self.functions[func] = len(self.functions)
+            columns = self.columns
+            columns['file'].append(self._string(func[0]))
+            columns['line'].append(func[1])
+            columns['name'].append(self._string(func[2]))
+            for name in ('cc', 'nc', 'tt', 'ct'):
+                columns[name].append(0.0)
+        return index
+
+    ## Return the index of a call edge, adding it to the edge table when needed
+    def _edge(self, caller, callee):
+        key = (caller, callee)
+        index = self.edges.get(key)
+        if index is None:
+            index = self.edges[key] = len(self.edges)
+            columns = self.columns
+            columns['caller'].append(caller)
+            columns['callee'].append(callee)
+            for name in ('e_nc', 'e_cc', 'e_tt', 'e_ct'):
+                columns[name].append(0.0)
+        return index
+
+    ## Return the number of functions in the table
+    def __len__(self):
+        return len(self.functions)
+
+    ##
+    # Add the statistics in the pstats format, summing the counters of the functions already in the table
+    #
+    # @param stats The statistics dictionary, as found in pstats.Stats.stats or in a cProfile dump
+    def add_stats(self, stats):
+        columns = self.columns
+        cc, nc, tt, ct = columns['cc'], columns['nc'], columns['tt'], columns['ct']
+        e_nc, e_cc, e_tt, e_ct = columns['e_nc'], columns['e_cc'], columns['e_tt'], columns['e_ct']
+        for func, stat in stats.iteritems():
+            index = self._function(func)
+            cc[index] += stat[0]
+            nc[index] += stat[1]
+            tt[index] += stat[2]
+            ct[index] += stat[3]
+            for caller, value in stat[4].iteritems():
+                edge = self._edge(self._function(caller), index)
+                # The profile module stores the number of calls only
+                if isinstance(value, tuple):
+                    e_nc[edge] += value[0]
+                    e_cc[edge] += value[1]
+                    e_tt[edge] += value[2]
+                    e_ct[edge] += value[3]
+                else:
+                    e_nc[edge] += value
+                    e_cc[edge] += value
+
+    ##
+    # Add another columnar table, summing the counters of the functions already in the table
+    #
+    # The tables are combined column by column through an index translation, without creating the pstats tuples.
+    def add(self, other):
+        columns = self.columns
+        source = other.columns
+        translation = array('i', [0]) * len(other.functions)
+        files, lines, names = source['file'], source['line'], source['name']
+        strings = other.strings
+        for index in xrange(len(translation)):
+            translation[index] = self._function((strings[files[index]], lines[index], strings[names[index]]))
+        for name in ('cc', 'nc', 'tt', 'ct'):
+            target, values = columns[name], source[name]
+            for index in xrange(len(translation)):
+                target[translation[index]] += values[index]
+        callers, callees = source['caller'], source['callee']
+        edge_translation = array('i', [0]) * len(callers)
+        for index in xrange(len(callers)):
+            edge_translation[index] = self._edge(translation[callers[index]], translation[callees[index]])
+        for name in ('e_nc', 'e_cc', 'e_tt', 'e_ct'):
+            target, values = columns[name], source[name]
+            for index in xrange(len(edge_translation)):
+                target[edge_translation[index]] += values[index]
+
+    ##
+    # Export the table to the pstats format
+    #
+    # The counters stored as doubles are converted back to integers.
+    def to_stats(self):
+        columns = self.columns
+        strings = self.strings
+        files, lines, names = columns['file'], columns['line'], columns['name']
+        cc, nc, tt, ct = columns['cc'], columns['nc'], columns['tt'], columns['ct']
+        labels = [(strings[files[index]], lines[index], strings[names[index]]) for index in xrange(len(files))]
+        callers = [{} for label in labels]
+        e_nc, e_cc, e_tt, e_ct = columns['e_nc'], columns['e_cc'], columns['e_tt'], columns['e_ct']
+        for edge, callee in enumerate(columns['callee']):
+            callers[callee][labels[columns['caller'][edge]]] = (int(e_nc[edge]), int(e_cc[edge]), e_tt[edge], e_ct[edge])
+        stats = {}
+        for index, label in enumerate(labels):
+            stats[label] = int(cc[index]), int(nc[index]), tt[index], ct[index], callers[index]
+        return stats
+
+    ## Return a pstats.Stats object with the table content, for the pstats reports
+    def to_pstats(self, stream = None):
+        if stream is None:
+            return pstats.Stats(snapshot.StatsSnapshot(self.to_stats()))
+        return pstats.Stats(snapshot.StatsSnapshot(self.to_stats()), stream = stream)
+
+    ## Write the table to a columnar file
+    def save(self, filename):
+        strings = '\0'.join(self.strings)
+        out = open(filename, 'wb')
+        try:
+            out.write(HEADER.pack(MAGIC, VERSION, len(self.strings), len(strings),
+                                  len(self.functions), len(self.edges)))
+            out.write('\0' * _padding(HEADER.size))
+            out.write(strings)
+            out.write('\0' * _padding(len(strings)))
+            for name, code in FUNCTION_COLUMNS + EDGE_COLUMNS:
+                column = self.columns[name]
+                if sys.byteorder == 'big':
+                    column = array(code, column)
+                    column.byteswap()
+                data = column.tostring()
+                out.write(data)
+                out.write('\0' * _padding(len(data)))
+        finally:
+            out.close()
+
+##
+# Load a columnar file
+#
+# The file is memory mapped and the columns are copied directly from the mapped pages to the arrays.
+#
+# @param filename The name of the file to load
+def load(filename):
+    source = open(filename, 'rb')
+    try:
+        data = mmap.mmap(source.fileno(), 0, access = mmap.ACCESS_READ)
+    finally:
+        source.close()
+    try:
+        magic, version, nstrings, string_bytes, nfunctions, nedges = HEADER.unpack(data[:HEADER.size])
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("%s is not a columnar profile file" % filename)
+        table = ColumnarStats()
+        offset = HEADER.size + _padding(HEADER.size)
+        table.strings = data[offset:offset + string_bytes].split('\0') if nstrings else []
+        table.string_index = dict((value, index) for index, value in enumerate(table.strings))
+        offset += string_bytes + _padding(string_bytes)
+        for columns, count in ((FUNCTION_COLUMNS, nfunctions), (EDGE_COLUMNS, nedges)):
+            for name, code in columns:
+                column = array(code)
+                size = column.itemsize * count
+                column.fromstring(data[offset:offset + size])
+                if sys.byteorder == 'big':
+                    column.byteswap()
+                table.columns[name] = column
+                offset += size + _padding(size)
+    finally:
+        data.close()
+
+    columns = table.columns
+    strings = table.strings
+    files, lines, names = columns['file'], columns['line'], columns['name']
+    for index in xrange(nfunctions):
+        table.functions[(strings[files[index]], lines[index], strings[names[index]])] = index
+    callers, callees = columns['caller'], columns['callee']
+    for index in xrange(nedges):
+        table.edges[(callers[index], callees[index])] = index
+    return table
+
+## Return True if the file is a columnar file
+def is_columnar(filename):
+    source = open(filename, 'rb')
+    try:
+        return source.read(len(MAGIC)) == MAGIC
+    finally:
+        source.close()
+
+## Load the statistics from a profile dump written by the cProfile dump_stats() method
+def load_dump(filename):
+    source = open(filename, 'rb')
+    try:
+        return marshal.load(source)
+    finally:
+        source.close()
+
+##
+# Load a columnar file or a profile dump written by the cProfile dump_stats() method
+#
+# @param filename The name of the file to load
+def load_any(filename):
+    if is_columnar(filename):
+        return load(filename)
+    table = ColumnarStats()
+    table.add_stats(load_dump(filename))
+    return table
+
+##
+# Merge columnar files and profile dumps one at a time
+#
+# @param filenames The names of the files to merge
+# @param output The (optional) name of the columnar file where the merged data are written
+# @return The merged table
+def merge_files(filenames, output = None):
+    merged = ColumnarStats()
+    for filename in filenames:
+        if is_columnar(filename):
+            merged.add(load(filename))
+        else:
+            merged.add_stats(load_dump(filename))
+    if output is not None:
+        merged.save(output)
+    return merged
+
+## Command line entry point
+def main(argv):
+    if len(argv) >= 3 and argv[0] == 'merge':
+        merge_files(argv[2:], argv[1])
+    elif len(argv) in (2, 3) and argv[0] == 'print':
+        stats = load_any(argv[1]).to_pstats()
+        stats.strip_dirs()
+        stats.sort_stats(argv[2] if len(argv) == 3 else 'cumulative')
+        stats.print_stats()
+    else:
+        print >> sys.stderr, "Usage: %s merge <output> <file>...\n       %s print <file> [sort key]" % (
+            os.path.basename(sys.argv[0]), os.path.basename(sys.argv[0]))
+        return 2
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,258 @@
+## @file control.py
+# @package profiler
+# @brief Local control channel to start, stop and query the profiler of a running process
+#
+# The control server listens on a Unix socket owned by the user running the process. Every line received is a
+# command and gets a single line reply, starting with "ok" or "error":
+# <ul>
+# <li>status: the profiler state</li>
+# <li>start: enable the profiler and start the timing collector</li>
+# <li>stop: stop the timing collector, the periodic snapshots, the triggers and the line timing</li>
+# <li>memory [interval]: start the memory sampling, every interval seconds</li>
+# <li>memory-stop: stop the memory sampling</li>
+# <li>rate hz: set the sampling rate of the sampling mode</li>
+# <li>snapshot [file]: write the timing data collected so far to file, in the cProfile dump format</li>
+# </ul>
+# When both the timing collector and the memory sampling are stopped the profiler is disabled again, so its methods
+# cost as much as in a profiler created disabled.\n\n
+# The deterministic collector profiles the thread enabling it, so the commands are executed by the main thread: the
+# control thread queues the command and sends a signal to the process, and the signal handler runs the queued
+# commands. The signal handler is installed with siginterrupt() off, so the blocking system calls of the main thread
+# are restarted instead of failing with EINTR. The handler runs when the main thread is back in the interpreter:
+# a main thread blocked longer than COMMAND_TIMEOUT makes the command time out, and the command is then discarded.
+# In the sampling mode the control channel can be started with no signal, and the server thread runs the commands
+# itself. From the command line the commands are sent with:
+# \code
+# python control.py /tmp/profiler-1234.sock start
+# \endcode
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.\n
+#
+# Copyright NXP PLMA.  All Rights Reserved.\n
+#
+# Licensed under the Apache License, Version 2.0 (the "License");\n
+# you may not use this file except in compliance with the License.\n
+# You may obtain a copy of the License at\n
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+# either express or implied.  See the License for the specific language
+# governing permissions and limitations under the License.
+#
+# @date March 2016
+# @author Enrico Miglino <enrico.miglino@gmail.com>
+# @version 0.1.5
+# @version documentation version 0.5
+
+import sys, os, stat, socket, signal, threading, tempfile, time, marshal, Queue
+import SocketServer
+import sampling_profiler
+
+## Signal used to run the commands in the main thread
+DEFAULT_SIGNAL = getattr(signal, 'SIGUSR2', None)
+
+## Seconds the control thread waits for the main thread to run a command
+COMMAND_TIMEOUT = 10.0
+
+## States of a command queued for the main thread
+PENDING, RUNNING, CANCELLED = range(3)
+
+## Return the default address of the control socket of the current process
+def default_address():
+    return os.path.join(tempfile.gettempdir(), 'profiler-%d.sock' % os.getpid())
+
+##
+# ControlServer class serves the control socket of a profiler
+class ControlServer:
+
+    ##
+    # Constructor, starting the server thread. Must be called by the main thread when a signal is used
+    #
+    # @param profile The Profile instance to control
+    # @param address The path of the Unix socket, created readable and writable by the owner only
+    # @param signum The signal used to run the commands in the main thread, None to run them in the server thread
+    def __init__(self, profile, address = None, signum = DEFAULT_SIGNAL):
+        self.profile = profile
+        self.address = address or default_address()
+        self.signum = signum
+        self.commands = Queue.Queue()
+        ## Lock protecting the state of the queued requests
+        self.lock = threading.Lock()
+        if os.path.exists(self.address) and stat.S_ISSOCK(os.stat(self.address).st_mode):
+            os.unlink(self.address)
+        if signum is not None:
+            self.previous = signal.signal(signum, self._handle_signal)
+            signal.siginterrupt(signum, False)
+        umask = os.umask(0o077)
+        try:
+            self.server = _Server(self.address, _Handler)
+        finally:
+            os.umask(umask)
+        self.server.control = self
+        thread = threading.Thread(target = self.server.serve_forever, name = 'profiler-control')
+        thread.daemon = True
+        thread.start()
+        sampling_profiler.ignore_thread(thread)
+
+    ## Stop the server and remove the socket
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+        if os.path.exists(self.address):
+            os.unlink(self.address)
+        if self.signum is not None:
+            signal.signal(self.signum, self.previous)
+
+    ##
+    # Run a command line and return the reply line
+    #
+    # Called by the server thread: the command is run in the main thread when a signal is used. A command not
+    # started by the main thread within COMMAND_TIMEOUT is cancelled, a command already started is waited for.
+    def submit(self, line):
+        if self.signum is None:
+            return self.execute(line)
+        # Command line, completion event, reply, state: PENDING, RUNNING or CANCELLED
+        request = [line, threading.Event(), None, PENDING]
+        self.commands.put(request)
+        os.kill(os.getpid(), self.signum)
+        if not request[1].wait(COMMAND_TIMEOUT):
+            with self.lock:
+                if request[3] == PENDING:
+                    request[3] = CANCELLED
+                    return "error timeout waiting for the main thread"
+            request[1].wait()
+        return request[2]
+
+    ## Signal handler running the queued commands, the cancelled ones excepted
+    def _handle_signal(self, signum, frame):
+        while True:
+            try:
+                request = self.commands.get_nowait()
+            except Queue.Empty:
+                return
+            with self.lock:
+                if request[3] == CANCELLED:
+                    continue
+                request[3] = RUNNING
+            request[2] = self.execute(request[0])
+            request[1].set()
+
+    ## Run a command line and return the reply line
+    def execute(self, line):
+        words = line.split()
+        if not words:
+            return "error empty command"
+        command = getattr(self, 'do_' + words[0].replace('-', '_'), None)
+        if command is None:
+            return "error unknown command %s" % words[0]
+        try:
+            return command(*words[1:])
+        except TypeError:
+            return "error wrong arguments for %s" % words[0]
+        except Exception as exc:
+            return "error %s" % exc
+
+    ## Disable the profiler when nothing is being collected
+    def _update(self):
+        profiler = self.profile.enabled_profiler
+        if not profiler.is_timing and not (profiler.is_sammpling_memory and profiler.memoryProf.is_running()):
+            self.profile.set_enabled(False)
+
+    def do_status(self):
+        profiler = self.profile.enabled_profiler
+        if not self.profile.is_enabled() or profiler is None:
+            return "ok enabled=0"
+        memory = profiler.is_sammpling_memory and profiler.memoryProf.is_running()
+        return "ok enabled=1 mode=%s timing=%d memory=%d hz=%s" % (profiler.mode, profiler.is_timing, memory,
+                                                                   profiler.hz)
+
+    def do_start(self):
+        self.profile.set_enabled(True)
+        self.profile.enable()
+        return "ok"
+
+    def do_stop(self):
+        if self.profile.is_enabled():
+            self.profile.stop_periodic()
+            self.profile.stop_triggers()
+            self.profile.stop_line_timing()
+            self.profile.disable()
+            self._update()
+        return "ok"
+
+    def do_memory(self, interval = 1):
+        self.profile.set_enabled(True)
+        self.profile.sample_memory(interval = float(interval))
+        return "ok"
+
+    def do_memory_stop(self):
+        if self.profile.is_enabled():
+            self.profile.stop_memory()
+            self._update()
+        return "ok"
+
+    def do_rate(self, hz):
+        # Validated before enabling, so a wrong rate leaves the profiler as it is
+        rate = float(hz)
+        if rate <= 0:
+            return "error the rate must be positive"
+        if self.profile.options[1] != 'sampling':
+            return "error the rate applies to the sampling mode only"
+        self.profile.set_enabled(True)
+        self.profile.profiler.set_rate(rate)
+        return "ok"
+
+    def do_snapshot(self, filename = None):
+        if self.profile.enabled_profiler is None:
+            return "error no data collected"
+        if filename is None:
+            filename = os.path.join(tempfile.gettempdir(), 'profiler-%d-%d.prof' % (os.getpid(), time.time()))
+        out = open(filename, 'wb')
+        try:
+            marshal.dump(self.profile.enabled_profiler.snapshot(), out)
+        finally:
+            out.close()
+        return "ok %s" % filename
+
+## Unix socket server running every connection in its own thread
+class _Server(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+    daemon_threads = True
+
+## Handler of a control connection, replying to every command line
+class _Handler(SocketServer.StreamRequestHandler):
+
+    def handle(self):
+        for line in self.rfile:
+            self.wfile.write(self.server.control.submit(line.strip()) + '\n')
+            self.wfile.flush()
+
+##
+# Send a command to the control socket of a process and return the reply
+#
+# @param address The path of the control socket
+# @param command The command line
+def send_command(address, command):
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        connection.connect(address)
+        connection.sendall(command + '\n')
+        connection.shutdown(socket.SHUT_WR)
+        return connection.makefile().readline().strip()
+    finally:
+        connection.close()
+
+## Command line entry point, sending a command to a running process
+def main(argv):
+    if len(argv) < 2:
+        print >> sys.stderr, "Usage: %s <socket> <command> [arguments]" % os.path.basename(sys.argv[0])
+        return 2
+    reply = send_command(argv[0], ' '.join(argv[1:]))
+    print reply
+    return 0 if reply.startswith('ok') else 1
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -25,6 +25,46 @@
 # @version 0.1.5
 # @version documentation version 0.5
 
+##
+# Shared no-op bound directly to the methods of a disabled Profile instance, accepting any argument
+def null_method(*args, **kwargs):
+    pass
+
+##
+# Shared C-level no-op bound to the methods of a disabled Profile instance without arguments
+#
+# It is the clear() method of a private dictionary that is always empty: being a builtin method, calling it does not
+# create a Python frame and costs about as much as an empty loop iteration.
+null_call = {}.clear
+
+##
+# NullRegion class is the context manager replacing the timed regions when the profiler is disabled
+class NullRegion:
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+## The shared null region
+NULL_REGION = NullRegion()
+
+## Return the shared null region, whatever the region is
+def null_region(name = None, deep = False):
+    return NULL_REGION
+
+## Return the decorated function unchanged, so the disabled profiled functions have no overhead at all
+def null_decorator(name = None, deep = False):
+    return _undecorated
+
+def _undecorated(func):
+    return func
+
+## Call the function without profiling it, replacing the runcall() method of a disabled Profile instance
+def null_runcall(func, *args, **kwargs):
+    return func(*args, **kwargs)
+
 class DisabledProfiler:
     ##
     # The disabledProfiler class exposes null methos for the case the profiling is not enabled by
@@ -33,13 +73,94 @@ class DisabledProfiler:
     def __init__(self):
         pass
 
-    def mem_used(self):
+    def mem_used(self, as_json = False):
+        return None
+
+    def memory(self, interval = 1, comment = '', size = None):
+        pass
+
+    def stop_memory(self):
+        pass
+
+    def set_rate(self, hz):
+        pass
+
+    def enable(self, all_threads = False):
         pass
 
-    def memory(self, interval = 1, comment = ''):
+    def attach_thread(self):
         pass
 
-    def enable(self):
+    def detach_thread(self):
+        pass
+
+    def thread_snapshots(self):
+        return []
+
+    def thread_statistics(self, name = None):
+        pass
+
+    def open_snapshots(self, filename = None, max_bytes = None, max_age = None, backups = None):
+        pass
+
+    def write_snapshot(self):
+        pass
+
+    def close(self):
+        pass
+
+    def start_periodic(self, interval = None, windows = None):
+        pass
+
+    def stop_periodic(self):
+        pass
+
+    def windows(self):
+        return []
+
+    def window_statistics(self, index = -1):
+        pass
+
+    def collect_children(self):
+        pass
+
+    def after_fork(self):
+        pass
+
+    def process_statistics(self):
+        pass
+
+    def process_reports(self):
+        return []
+
+    def region(self, name = None, deep = False):
+        return NULL_REGION
+
+    def profiled(self, name = None, deep = False):
+        return _undecorated
+
+    def region_statistics(self):
+        pass
+
+    def latencies(self):
+        return {}
+
+    def dump_latencies(self, fname = None):
+        pass
+
+    def track_allocations(self, frames = None):
+        pass
+
+    def stop_allocations(self):
+        pass
+
+    def allocation_snapshot(self):
+        return None
+
+    def allocation_statistics(self, limit = None, key = None):
+        pass
+
+    def allocation_diff(self, limit = None, key = None, baseline = None):
         pass
 
     def disable(self):
@@ -54,15 +175,80 @@ class DisabledProfiler:
     def dump_stats(self):
         pass
 
-    def run(self, command = None):
+    def dump_columnar(self, fname = None):
+        pass
+
+    def dump_flamegraph(self, fname = None, threshold = None):
+        pass
+
+    def calibrate(self, force = False):
+        return None
+
+    def background_reports(self, enabled = True):
+        pass
+
+    def wait_reports(self):
+        pass
+
+    def stats_index(self, max_age = 0):
+        return None
+
+    def top_functions(self, metric = None, k = None, module = None, function = None, filename = None, max_age = 0):
+        return None
+
+    def group_statistics(self, by = None, metric = None, k = None, module = None, max_age = 0):
+        return None
+
+    def trigger_on_latency(self, threshold, name = None):
+        pass
+
+    def trigger_on_memory(self, growth, window, interval = None):
+        pass
+
+    def trigger_on_lag(self, threshold):
         pass
 
-    def runctx(self, command = None, globals = None, locals = None):
+    def configure_triggers(self, duration = None, hz = None, cooldown = None, keep = None):
+        pass
+
+    def trigger_captures(self):
+        return []
+
+    def stop_triggers(self):
+        pass
+
+    def line_profiled(self, func):
+        return func
+
+    def line_profile(self, names):
         pass
 
-    def runcall(self, func = None, args = None, kwargs = None):
+    def stop_line_timing(self):
         pass
 
+    def line_memory(self, enabled = True):
+        pass
+
+    def line_stats(self):
+        return {}
+
+    def print_line_timings(self, restriction = None):
+        pass
+
+    def run(self, command):
+        import __main__
+        exec command in __main__.__dict__
+
+    def runctx(self, command, globals = None, locals = None):
+        exec command in globals, locals
+
+    def runcall(self, func, *args, **kwargs):
+        return func(*args, **kwargs)
+
+    def runcall_many(self, func, number, args = (), kwargs = None, profile = False):
+        for index in xrange(number):
+            func(*args, **(kwargs or {}))
+
     def statistics(self):
         pass
 
@@ -72,5 +258,8 @@ class DisabledProfiler:
     def statistics_calls(self):
         pass
 
+    def merged_statistics(self, names = None):
+        pass
+
     def module_stats_calls(self, module = None):
         pass
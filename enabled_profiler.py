@@ -10,8 +10,8 @@
 # For details on how the cProfile Python component works, theck the Python documentation "The Pythong Profilers"
 # (link: https://docs.python.org/2/library/profile.html#module-cProfile)
 #
-# In addition to the time profiler the memory profile is also available as an option. For more information on the
-# memory_profile package works see the package details on pythong.org: https://pypi.python.org/pypi/memory_profiler
+# In addition to the time profiler the memory profile is also available as an option. The memory usage is sampled by a
+# background daemon thread (see the memory_sampler module) so the sampling runs alongside the profiled program.
 #
 # This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the
 # implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.\n
@@ -35,101 +35,823 @@
 # @version 0.1.5
 # @version documentation version 0.5
 
-import cProfile, pstats
-from memory_profiler import memory_usage
+import sys, os, time, threading, json, atexit, tempfile, collections, cProfile, pstats
+import multiprocessing.util
+import memory_sampler, snapshot, sampling_profiler, stream_writer, periodic, columnar, multiprocess, regions, histogram
+import allocations, memory_report, filtered_profiler, flamegraph, thread_profiler, async_profiler, calibration
+import report_worker, query, triggers, line_timing
+from registry import registry
 
-## The timing profiler class instance
-timingProf = cProfile.Profile()
+## Timing collector modes
+DETERMINISTIC = 'deterministic'
+SAMPLING = 'sampling'
+FILTERED = 'filtered'
+ASYNC = 'async'
 
 ##
 # EnabledProfiler class exposes the methods for the profiling when the Profiling is enabled
 #
+# Every instance owns its timing collector, so more components of the same process can be profiled independently.
+# The instances are registered in the process wide registry, where their data can be merged on demand.\n\n
+# The timing collector is the deterministic cProfile or, in the sampling mode, the statistical sampling profiler, or
+# in the filtered mode the deterministic profiler of the selected modules only, or in the async mode the profiler of
+# the asyncio event loop. All the collectors expose the same interface so all the reports are available in all the
+# modes.
+#
 class EnabledProfiler:
 
     ##
     # Constructor
-    def __init__(self, outFilename = None):
+    #
+    # @param outFilename The (optional) name of the file where the reports are written
+    # @param name The (optional) name the profiler is registered with
+    # @param mode The timing collector, DETERMINISTIC, SAMPLING, FILTERED or ASYNC
+    # @param hz The sampling rate in samples per second, used in the SAMPLING mode only
+    # @param include The modules and functions profiled in the FILTERED mode, see the filtered_profiler module
+    # @param exclude The modules and functions not profiled in the FILTERED mode
+    # @param calibrate If true the overhead of the DETERMINISTIC mode is calibrated by the constructor, see calibrate()
+    def __init__(self, outFilename = None, name = None, mode = DETERMINISTIC, hz = sampling_profiler.DEFAULT_RATE,
+                 include = (), exclude = (), calibrate = False):
+        ## The timing collector mode
+        self.mode = mode
+        ## The sampling rate of the SAMPLING mode
+        self.hz = hz
+        ## The modules and functions profiled in the FILTERED mode
+        self.include = include
+        ## The modules and functions not profiled in the FILTERED mode
+        self.exclude = exclude
+        ## The timing profiler class instance
+        self.timingProf = self.create_collector()
+        ## Flag set while the timing collector is enabled
+        self.is_timing = False
+        ## The name of the profiler in the registry
+        self.name = registry.register(self, name)
+
         ## Initialises the flag to avoid multiple instances of the memory sampling class
         self.is_sammpling_memory = False
+        ## The background memory sampler, created by the first memory() call
+        self.memoryProf = None
+        ## The incremental statistics of the memory samples, updated by the memory sampler
+        self.memoryReport = None
 
         # Check for filename if reqiored
-        if outFilename is not None:
+        if outFilename:
             self.streamFile = outFilename
             self.streaming = True
         else:
             self.streaming = False
+        ## The report stream, opened by the first report and kept open until close()
+        self.streamStats = None
+        ## The binary snapshots writer, created by open_snapshots()
+        self.snapshotWriter = None
+        ## The periodic snapshotter, created by start_periodic()
+        self.periodicProf = None
+        ## The aggregator of the child processes data, created by collect_children() in the parent process
+        self.aggregator = None
+        ## The address of the parent aggregator, inherited by the child processes
+        self.parentAddress = None
+        self.reported = False
+        ## The timings of the named regions
+        self.regions = regions.RegionTable()
+        ## The allocation sites tracker, created by track_allocations()
+        self.allocationProf = None
+        ## The allocation snapshots taken so far
+        self.allocationSnapshots = []
+        ## The (callee, caller) overhead per call of the DETERMINISTIC mode, set by calibrate()
+        self.bias = None
+        ## The background report worker, created by background_reports()
+        self.reportWorker = None
+        ## The last index of the statistics built by stats_index()
+        self.statsIndex = None
+        ## The triggered captures manager, created by the first trigger
+        self.triggers = None
+        ## The line timer, created when the first function is selected for the line timing
+        self.lineTimer = None
+        ## The prefix of the capture dump files
+        self.capturePrefix = outFilename or os.path.join(tempfile.gettempdir(), 'profiler-%d' % os.getpid())
+        if calibrate:
+            self.calibrate()
+
+    ## Create a new timing collector for the profiler mode
+    def create_collector(self):
+        if self.mode == DETERMINISTIC:
+            return cProfile.Profile()
+        elif self.mode == SAMPLING:
+            return sampling_profiler.SamplingProfiler(self.hz)
+        elif self.mode == FILTERED:
+            return filtered_profiler.FilteredProfiler(self.include, self.exclude)
+        elif self.mode == ASYNC:
+            return async_profiler.AsyncProfiler()
+        raise ValueError("Unknown profiler mode %r" % (self.mode,))
+
+    ##
+    # Return the stream where the reports are written
+    #
+    # When a file name has been specified the file is opened in append mode by the first report and the same buffered
+    # handle is used by all the following reports, until close() is called.
+    def report_stream(self):
+        if not self.streaming:
+            return sys.stdout
+        if self.streamStats is None:
+            self.streamStats = open(self.streamFile, 'a')
+        return self.streamStats
+
+    ## Flush the report stream at the end of a report
+    def flush_reports(self):
+        if self.streamStats is not None:
+            self.streamStats.flush()
+
+    ##
+    # Start writing binary snapshots of the timing data to a rotating file
+    #
+    # The snapshots are written by a background thread, see the stream_writer module for the file format.
+    #
+    # @param filename The name of the snapshots file
+    # @param max_bytes The file is rotated when it grows over this size
+    # @param max_age The file is rotated when it gets older than this number of seconds
+    # @param backups The number of rotated files to keep
+    def open_snapshots(self, filename, max_bytes = stream_writer.DEFAULT_MAX_BYTES,
+                       max_age = stream_writer.DEFAULT_MAX_AGE, backups = stream_writer.DEFAULT_BACKUPS):
+        if self.snapshotWriter is None:
+            self.snapshotWriter = stream_writer.SnapshotWriter(filename, max_bytes, max_age, backups)
+
+    ##
+    # Queue a snapshot of the timing data collected so far to the snapshots file. The collector is not stopped
+    # If the snapshots file has not been opened the call has no effect
+    def write_snapshot(self):
+        if self.snapshotWriter is not None:
+            self.snapshotWriter.write(self.snapshot())
+
+    ##
+    # Start computing the per-window deltas of the timing data in background
+    #
+    # The collector is read at every interval without stopping nor resetting it. If the snapshots file has been
+    # opened every window is also written to it, as a window record.
+    #
+    # @param interval The length of the windows, in seconds
+    # @param windows The number of windows retained in memory
+    def start_periodic(self, interval, windows = periodic.DEFAULT_WINDOWS):
+        if self.periodicProf is not None:
+            self.periodicProf.stop()
+        self.periodicProf = periodic.PeriodicSnapshotter(self.snapshot, interval, windows, self.snapshotWriter)
+        self.periodicProf.start()
+
+    ## Stop computing the per-window deltas. The retained windows are kept
+    def stop_periodic(self):
+        if self.periodicProf is not None:
+            self.periodicProf.stop()
+
+    ## Return the retained (start time, end time, delta) windows, oldest first
+    def windows(self):
+        if self.periodicProf is None:
+            return []
+        return self.periodicProf.get_windows()
+
+    ##
+    # Generate a satistics report of a single window
+    #
+    # @param index The index of the window in the retained windows, the last closed window by default
+    def window_statistics(self, index = -1):
+        windows = self.windows()
+        if not windows:
+            return
+        start, end, delta = windows[index]
+        stream = self.report_stream()
+        print >> stream, "Window %s - %s (%.3f s)" % (time.ctime(start), time.ctime(end), end - start)
+        if delta:
+            stats = pstats.Stats(snapshot.StatsSnapshot(delta), stream=stream)
+            stats.strip_dirs()
+            stats.sort_stats('time', 'module', 'name')
+            stats.print_stats()
+        else:
+            print >> stream, "No timing data collected"
+        self.flush_reports()
+
+    ##
+    # Start collecting the profiling data of the child processes
+    #
+    # The children created by the multiprocessing module from now on restart the profiler automatically. When a child
+    # exits normally its data are sent to this process.
+    def collect_children(self):
+        if self.aggregator is None:
+            self.aggregator = multiprocess.Aggregator()
+            self.parentAddress = self.aggregator.address
+            multiprocessing.util.register_after_fork(self, EnabledProfiler.after_fork)
+
+    ##
+    # Restart the profiler in a child process
+    #
+    # Called automatically in the children created by the multiprocessing module, it should be called by the
+    # applications creating the children directly with os.fork(), as the first thing in the child. The data
+    # inherited from the parent are discarded, the timing collector and the memory sampler are restarted if they
+    # were running in the parent, and the data are sent to the parent when the child exits.
+    def after_fork(self):
+        # The background threads of the parent do not exist in the child
+        self.aggregator = None
+        self.periodicProf = None
+        self.snapshotWriter = None
+        self.streamStats = None
+        self.reported = False
+        if self.reportWorker is not None:
+            self.reportWorker = report_worker.ReportWorker()
+        if self.triggers is not None:
+            self.triggers.reset()
+
+        if self.mode == FILTERED:
+            # The wrappers inherited from the parent still refer to the same collector
+            self.timingProf.reset()
+        else:
+            if self.is_timing:
+                self.timingProf.disable()
+            # A thread aware profiler stays thread aware, the threads started by the child are profiled too
+            if isinstance(self.timingProf, thread_profiler.ThreadProfiler):
+                self.timingProf = thread_profiler.ThreadProfiler()
+            else:
+                self.timingProf = self.create_collector()
+            if self.is_timing:
+                self.timingProf.enable()
+
+        if self.is_sammpling_memory:
+            sampler = self.memoryProf
+            self.start_memory_report(sampler.interval, sampler.size)
+            if sampler.is_running():
+                self.memoryProf.start()
+        self.attach_triggers()
+
+        if self.parentAddress is not None:
+            # multiprocessing children exit without running the atexit functions, but run the finalizers
+            multiprocessing.util.Finalize(self, EnabledProfiler.send_to_parent, args = (self,), exitpriority = 10)
+            atexit.register(self.send_to_parent)
+
+    ##
+    # Send the data collected in a child process to the parent process
+    #
+    # Called automatically when the child exits. It has no effect in the parent process, or if the data have
+    # already been sent.
+    def send_to_parent(self):
+        if self.parentAddress is None or self.reported:
+            return
+        self.reported = True
+        memory = []
+        if self.is_sammpling_memory:
+            timestamps, memory = self.memoryProf.samples()
+        try:
+            multiprocess.send_report(self.parentAddress, self.name, self.snapshot(), memory)
+        except (IOError, OSError, EOFError):
+            # The parent is not collecting the data anymore
+            pass
+
+    ##
+    # Generate a satistics report of the child processes, with a per-process breakdown followed by the merged
+    # statistics of all the processes, this one included
+    def process_statistics(self):
+        if self.aggregator is None:
+            return
+        reports = self.aggregator.get_reports()
+        stream = self.report_stream()
+        print >> stream, "------------------------------------------------"
+        print >> stream, "Processes profile"
+        print >> stream, "%8s %8s %12s %12s %12s" % ("PID", "Parent", "Calls", "Time (s)", "Peak (Mb)")
+        for report in reports:
+            calls = sum(stat[1] for stat in report['stats'].itervalues())
+            total = sum(stat[2] for stat in report['stats'].itervalues())
+            peak = "%.3f" % max(report['memory']) if report['memory'] else "-"
+            print >> stream, "%8d %8d %12d %12.3f %12s" % (report['pid'], report['parent'], calls, total, peak)
+        print >> stream, "------------------------------------------------"
+
+        merged = snapshot.merge_snapshots([self.snapshot()] + [report['stats'] for report in reports])
+        if merged:
+            stats = pstats.Stats(snapshot.StatsSnapshot(merged), stream=stream)
+            stats.strip_dirs()
+            stats.sort_stats('module', 'name', 'time')
+            stats.print_stats()
+        else:
+            print >> stream, "No timing data collected"
+        self.flush_reports()
+
+    ## Return the reports received from the child processes, see the multiprocess module for the content
+    def process_reports(self):
+        if self.aggregator is None:
+            return []
+        return self.aggregator.get_reports()
+
+    ## Close the report stream and the snapshots file, writing the pending snapshots
+    def close(self):
+        self.stop_periodic()
+        self.stop_line_timing()
+        self.stop_triggers()
+        self.background_reports(False)
+        if self.aggregator is not None:
+            self.aggregator.close()
+        if self.snapshotWriter is not None:
+            self.snapshotWriter.close()
+            self.snapshotWriter = None
+        if self.streamStats is not None:
+            self.streamStats.close()
+            self.streamStats = None
+
+    ##
+    # Start profiling the code execution.
+    #
+    # In the deterministic mode only the calling thread is profiled, unless all_threads is set: in this case the
+    # collector is replaced by the thread profiler, keeping the data collected so far, and the profiler stays thread
+    # aware from now on. The sampling and the filtered modes always profile all the threads.
+    #
+    # @param all_threads If true the threads started from now on are profiled too, each one with its own collector
+    def enable(self, all_threads = False):
+        if all_threads and self.mode == DETERMINISTIC and not isinstance(self.timingProf,
+                                                                         thread_profiler.ThreadProfiler):
+            self.timingProf = thread_profiler.ThreadProfiler(self.timingProf)
+        self.is_timing = True
+        self.timingProf.enable()
+        if self.lineTimer is not None:
+            self.lineTimer.enabled = True
+
+    ##
+    # Start profiling the calling thread, started before the profiler was enabled for all the threads
+    #
+    # Has no effect if the profiler is not thread aware.
+    def attach_thread(self):
+        if isinstance(self.timingProf, thread_profiler.ThreadProfiler):
+            self.timingProf.attach_thread()
+
+    ## Stop profiling the calling thread. Has no effect if the profiler is not thread aware
+    def detach_thread(self):
+        if isinstance(self.timingProf, thread_profiler.ThreadProfiler):
+            self.timingProf.detach_thread()
+
+    ##
+    # Return the timing data of every thread collected so far, without stopping the collectors
+    #
+    # @return A list of (thread name, thread ident, statistics) tuples, empty if the profiler is not thread aware
+    def thread_snapshots(self):
+        if not isinstance(self.timingProf, thread_profiler.ThreadProfiler):
+            return []
+        return self.timingProf.thread_snapshots()
+
+    ##
+    # Generate the per-thread breakdown of the timing data, without stopping the collectors
+    #
+    # Without a thread name a table with the calls and the time of every thread is generated, else the statistics
+    # report of the named thread. The combined statistics of all the threads are reported by statistics().
+    #
+    # @param name The name of the thread to report
+    def thread_statistics(self, name = None):
+        threads = self.thread_snapshots()
+        if not threads:
+            return
+        stream = self.report_stream()
+        if name is None:
+            print >> stream, "------------------------------------------------"
+            print >> stream, "Threads profile"
+            print >> stream, "%-24s %16s %12s %12s" % ("Thread", "Ident", "Calls", "Time (s)")
+            for thread_name, ident, stats in threads:
+                calls = sum(stat[1] for stat in stats.itervalues())
+                total = sum(stat[2] for stat in stats.itervalues())
+                print >> stream, "%-24s %16d %12d %12.3f" % (thread_name, ident, calls, total)
+            print >> stream, "------------------------------------------------"
+        else:
+            for thread_name, ident, stats in threads:
+                if thread_name == name:
+                    print >> stream, "Thread %s (%d)" % (thread_name, ident)
+                    if not stats:
+                        print >> stream, "No timing data collected"
+                        continue
+                    stats = pstats.Stats(snapshot.StatsSnapshot(stats), stream=stream)
+                    stats.strip_dirs()
+                    stats.sort_stats('module', 'name', 'time')
+                    stats.print_stats()
+        self.flush_reports()
+
+    ##
+    # Calibrate the overhead per call of the DETERMINISTIC mode, then subtracted from the times of the reports
+    #
+    # The calibration is cached per host, see the calibration module. The other modes have no calibration. The
+    # calibration calls are not recorded when the profiler is timing the calling thread.
+    #
+    # @param force If true the overhead is measured again, also when cached
+    # @return The (callee, caller) overhead per call in seconds, None in the other modes
+    def calibrate(self, force = False):
+        if self.mode == DETERMINISTIC:
+            self.bias = calibration.calibrate(force)
+        return self.bias
+
+    ## Return a snapshot of the timing data collected so far, without stopping the collector
+    def snapshot(self):
+        return snapshot.take_snapshot(self.timingProf)
+
+    ##
+    # Return an index of the timing data collected so far, for the queries, without stopping the collector
+    #
+    # @param max_age The last index is returned if built less than max_age seconds ago, else a new one is built
+    def stats_index(self, max_age = 0):
+        index = self.statsIndex
+        if index is None or time.time() - index.created > max_age:
+            index = self.statsIndex = query.StatsIndex(self.snapshot())
+        return index
+
+    ##
+    # Return the functions with the highest value of a metric, see query.StatsIndex.top()
+    #
+    # @param max_age The maximum age of the index queried, in seconds
+    def top_functions(self, metric = 'tottime', k = 10, module = None, function = None, filename = None,
+                      max_age = 0):
+        return self.stats_index(max_age).top(metric, k, module, function, filename)
+
+    ##
+    # Return the totals of the functions grouped by file, module or package, see query.StatsIndex.groups()
+    #
+    # @param max_age The maximum age of the index queried, in seconds
+    def group_statistics(self, by = 'module', metric = 'tottime', k = None, module = None, max_age = 0):
+        return self.stats_index(max_age).groups(by, metric, k, module)
+
+    ## Return the line timer, creating it at the first call
+    def line_timer(self):
+        if self.lineTimer is None:
+            self.lineTimer = line_timing.LineTimer()
+        return self.lineTimer
+
+    ##
+    # Return the line timing wrapper of a function, see the line_timing module
+    #
+    # @param func The function to time line by line
+    def line_profiled(self, func):
+        return self.line_timer().wrap(func)
+
+    ##
+    # Select functions for the line timing by name, replacing them with their line timing wrapper
+    #
+    # @param names The dotted names of the functions, as 'package.module.function' or 'module.Class.method'
+    def line_profile(self, names):
+        self.line_timer().add_names(names)
+
+    ##
+    # Stop the line timing, putting back the functions selected by name. The timings are kept
+    #
+    # The decorated functions are timed again when the profiler is enabled again.
+    def stop_line_timing(self):
+        if self.lineTimer is not None:
+            self.lineTimer.enabled = False
+            self.lineTimer.restore()
+            self.lineTimer.stop_memory()
+
+    ##
+    # Start or stop measuring the memory increments of the lines of the functions selected for the line timing
+    #
+    # See the line_timing module for the allocation counters used.
+    #
+    # @param enabled If false the memory increments are not measured anymore, the increments measured are kept
+    def line_memory(self, enabled = True):
+        if enabled:
+            self.line_timer().start_memory()
+        elif self.lineTimer is not None:
+            self.lineTimer.stop_memory()
+
+    ##
+    # Return the line timings collected so far
+    #
+    # @return A dictionary mapping the function labels to dictionaries mapping the line numbers to (hits, time,
+    # memory increment) tuples
+    def line_stats(self):
+        if self.lineTimer is None:
+            return {}
+        return self.lineTimer.snapshot()
+
+    ## Return the triggered captures manager, creating it at the first call
+    def trigger_manager(self):
+        if self.triggers is None:
+            self.triggers = triggers.TriggerManager(self.capturePrefix)
+            self.triggers.region_names = self.regions.names
+        return self.triggers
+
+    ## Register the triggers listeners on the sources of the measures, when not already registered
+    def attach_triggers(self):
+        manager = self.triggers
+        if manager is None:
+            return
+        sources = []
+        if manager.region_thresholds or manager.any_region is not None:
+            sources.append((self.regions.listeners, manager.region_sample))
+        if manager.memory_triggers and self.memoryProf is not None:
+            sources.append((self.memoryProf.listeners, manager.memory_sample))
+        if manager.lag_threshold is not None and self.mode == ASYNC:
+            sources.append((self.timingProf.lag_listeners, manager.lag_sample))
+        for listeners, listener in sources:
+            if listener not in listeners:
+                listeners.append(listener)
+
+    ##
+    # Start a capture when a region runs longer than a threshold
+    #
+    # @param threshold The wall time of the region, in seconds
+    # @param name The name of the region, any region if not specified
+    def trigger_on_latency(self, threshold, name = None):
+        manager = self.trigger_manager()
+        if name is None:
+            manager.any_region = threshold
+        else:
+            manager.region_thresholds[self.regions.slot(name)] = threshold
+        self.attach_triggers()
+
+    ##
+    # Start a capture when the memory usage grows more than a threshold within a time window
+    #
+    # The memory sampling is started if needed.
+    #
+    # @param growth The memory growth, in Mb
+    # @param window The time window, in seconds
+    # @param interval The memory sampling interval, used if the memory is not sampled yet: a tenth of the window, up
+    # to one second, if not specified
+    def trigger_on_memory(self, growth, window, interval = None):
+        self.trigger_manager().memory_triggers.append((growth, window, collections.deque()))
+        if interval is None:
+            interval = min(window / 10.0, 1.0)
+        self.memory(interval)
+        self.attach_triggers()
+
+    ##
+    # Start a capture when the lag of the event loop exceeds a threshold, in the ASYNC mode only
+    #
+    # @param threshold The lag, in seconds
+    def trigger_on_lag(self, threshold):
+        if self.mode != ASYNC:
+            raise ValueError("The event loop lag is measured in the %s mode only" % ASYNC)
+        self.trigger_manager().lag_threshold = threshold
+        self.attach_triggers()
+
+    ##
+    # Change the captures settings, see triggers.TriggerManager.configure()
+    def configure_triggers(self, duration = triggers.DEFAULT_DURATION, hz = triggers.DEFAULT_RATE,
+                           cooldown = triggers.DEFAULT_COOLDOWN, keep = triggers.DEFAULT_KEEP):
+        self.trigger_manager().configure(duration, hz, cooldown, keep)
 
-    ## Start profiling the code execution.
-    def enable(self):
-        timingProf.enable()
-
-    ##
-    # Start memory usage sampling instantiating the memory usage class
-    #
-    # In the low level function memory_usage from the same module the timout
-    # is set to none, allowing the memory profiling in long execution time
-    # functions. In this last case the default sample frequency of 1 second
-    # returns a good indication of the memory usage along the time.\n\n
-    # Accordingly with the source method definition in the memory_usage module as shown below
-    # \code
-    #    memory_usage(proc=-1, interval=.1, timeout=None, timestamps=False,
-    #                 include_children=False, max_usage=False, retval=False,
-    #                 stream=None)
-    #\endcode
-    # the \b memory_usage call preset values:\n
-    # <ul>
-    # <li>\e Process: always refers to the current calling process</li>
-    # <li>\e Timeout: set to false, no limit for the sampling period</li>
-    # <li>\e Timestamp: set to false. Need to be true for having the time of every sample</li>
-    # <li>\e Include \e Childrens: the associted childern functions. Set to false</li>
-    # <li>\e Max \e Usage: set to false, no limit of max usage memory to sample</li>
-    # <li>\e Return \e Value: set to true, to get the total sampled value as the return call</li>
-    # <li>\e Stream: set to false, data are not streamed on an opene file channel</li>
-    # </ul>
-    #
-    # @todo Implement a parsing of the memory data array for better reporting
+    ## Return the completed captures, see triggers.TriggerManager.capture_list()
+    def trigger_captures(self):
+        if self.triggers is None:
+            return []
+        return self.triggers.capture_list()
+
+    ## Remove all the triggers. A running capture is completed
+    def stop_triggers(self):
+        manager = self.triggers
+        if manager is None:
+            return
+        for listeners, listener in ((self.regions.listeners, manager.region_sample),
+                                    (getattr(self.memoryProf, 'listeners', []), manager.memory_sample),
+                                    (getattr(self.timingProf, 'lag_listeners', []), manager.lag_sample)):
+            if listener in listeners:
+                listeners.remove(listener)
+        manager.region_thresholds = {}
+        manager.any_region = None
+        manager.memory_triggers = []
+        manager.lag_threshold = None
+
+    ##
+    # Start memory usage sampling in background
+    #
+    # The call returns immediately: the memory usage of the current process is sampled by a daemon thread with
+    # no limit for the sampling period, until stop_memory() is called. The default sample frequency of 1 second
+    # returns a good indication of the memory usage along the time in long execution time functions, while shorter
+    # intervals (down to 10 ms) can be used for short runs.\n\n
+    # The samples are retained in a fixed-size ring buffer: when the buffer is full the oldest samples are
+    # overwritten, keeping constant the memory used by the sampler. The statistics of all the samples are updated
+    # at every sample by the memory report, see the memory_report module.
     #
     # @param interval The frequency the amount of memory should be sampled
     # @param comment An optional comment stamped when the memory usage is shown
-    def memory(self, interval = 1, comment = ''):
+    # @param size The number of samples retained
+    def memory(self, interval = 1, comment = '', size = memory_sampler.DEFAULT_BUFFER_SIZE):
         if not self.is_sammpling_memory:
             self.is_sammpling_memory = True
             self.comment = comment
-            self.memoryProf = memory_usage(-1, interval, None, False, False, False, True, None)
+            self.start_memory_report(interval, size)
+            self.memoryProf.start()
+        elif not self.memoryProf.is_running():
+            self.memoryProf.interval = interval
+            self.memoryProf.start()
+
+    ## Create the memory sampler and the memory report it feeds
+    def start_memory_report(self, interval, size):
+        self.memoryReport = memory_report.MemoryReport(self.comment)
+        self.memoryProf = memory_sampler.MemorySampler(interval, size)
+        self.memoryProf.listeners.append(self.memoryReport.add)
+        self.attach_triggers()
+
+    ##
+    # Change the sampling rate of the SAMPLING mode
+    #
+    # @param hz The sampling rate in samples per second
+    def set_rate(self, hz):
+        if self.mode != SAMPLING:
+            raise ValueError("The sampling rate applies to the %s mode only" % SAMPLING)
+        self.hz = hz
+        self.timingProf.set_rate(hz)
+
+    ## Stop the background memory sampling. The samples collected so far are still available to mem_used()
+    def stop_memory(self):
+        if self.is_sammpling_memory:
+            self.memoryProf.stop()
 
-    ## Stop collecting data
+    ## Stop collecting data. The line timing of the decorated functions is stopped too, until enable() is called
     def disable(self):
-        timingProf.disable()
+        self.is_timing = False
+        self.timingProf.disable()
+        if self.lineTimer is not None:
+            self.lineTimer.enabled = False
+
+    ##
+    # Return a context manager timing a named region
+    #
+    # @param name The name of the region
+    # @param deep If true the timing collector is enabled while the region is executed
+    def region(self, name, deep = False):
+        return regions.Region(self.regions, self.regions.slot(name), self if deep else None)
+
+    ##
+    # Return a decorator timing every call of the decorated function as a named region
+    #
+    # @param name The name of the region, the function name if not specified
+    # @param deep If true the timing collector is enabled while the function is executed
+    def profiled(self, name = None, deep = False):
+        return regions.profiled(self.regions, name, self if deep else None)
+
+    ## Generate the report of the named regions timings
+    def region_statistics(self):
+        self.regions.print_table(self.report_stream())
+        self.flush_reports()
+
+    ##
+    # Return the latency summaries of the named regions and of the profiled functions
+    #
+    # @return A dictionary mapping the region names to their number of calls, total CPU time and minimum, mean, 50th,
+    # 90th, 95th, 99th percentiles and maximum wall time, in seconds
+    def latencies(self):
+        return self.regions.latencies()
+
+    ## Write the latency summaries to fname file, as JSON
+    def dump_latencies(self, fname):
+        out = open(fname, 'w')
+        try:
+            json.dump(self.latencies(), out, indent = 2, sort_keys = True)
+        finally:
+            out.close()
 
     ## Stop collecting data and record the results internally as the current profile.
     def create_stats(self):
-        timingProf.create_stats()
+        self.timingProf.create_stats()
 
     ## Create a stats object based on the current profile and print the results to stdout.
     def print_stats(self):
-        timingProf.print_stats()
+        self.timingProf.print_stats()
 
     ## Write the results of the current profile to fname file
     def dump_stats(self, fname):
-        timingProf.dump_stats(fname)
+        self.timingProf.dump_stats(fname)
+
+    ##
+    # Write the timing data collected so far to fname file in the columnar format, without stopping the collector
+    #
+    # See the columnar module for the format and the merge tool.
+    def dump_columnar(self, fname):
+        table = columnar.ColumnarStats()
+        table.add_stats(self.snapshot())
+        table.save(fname)
 
-    ## Profile the command via exec()
-    # Not used, for cProfile full compatibility only
-    # @todo Method not implemented yet
+    ##
+    # Export the timing data collected so far to fname file as a flame graph, without stopping the collector
+    #
+    # The stacks counted by the sampling profiler are exported as they are, the stacks of the deterministic profilers
+    # are rebuilt from the call graph, see the flamegraph module. When the profiler is calibrated the times are
+    # adjusted for the profiler overhead.
+    #
+    # @param fname The name of the file: .svg or .html for the flame graph, any other extension for the collapsed
+    # stacks
+    # @param threshold The fraction of the total time under which the branches of the call graph are pruned
+    def dump_flamegraph(self, fname, threshold = flamegraph.DEFAULT_THRESHOLD):
+        if self.mode == SAMPLING:
+            flamegraph.export(flamegraph.collapsed_stacks(self.timingProf.stacks), fname, 'samples', self.name)
+        else:
+            stats = self.snapshot()
+            if self.bias is not None:
+                stats = calibration.adjust(stats, self.bias)
+            flamegraph.export(flamegraph.collapsed_graph(stats, threshold), fname, 's', self.name)
+
+    ##
+    # Profile the command via exec() in the __main__ module environment
+    #
+    # @param command The Python statements to execute, as a string
     def run(self, command):
-        pass
+        import __main__
+        namespace = __main__.__dict__
+        self.runctx(command, namespace, namespace)
 
-    ## Profile the command via exec() with the specified global and local environment.
-    # Not used, for cProfile full compatibility only
-    # @todo Method not implemented yet
+    ##
+    # Profile the command via exec() with the specified global and local environment.
+    #
+    # The timing collector is enabled while the command is executed, unless it was already enabled, and is left in
+    # its previous state also when the command raises an exception.
+    #
+    # @param command The Python statements to execute, as a string
+    # @param globals The global environment of the command
+    # @param locals The local environment of the command
     def runctx(self, command, globals, locals):
-        pass
+        was_timing = self.is_timing
+        if not was_timing:
+            self.enable()
+        try:
+            exec command in globals, locals
+        finally:
+            if not was_timing:
+                self.disable()
 
     ##
-    # Profile a function call. Not used, for cProfile full compatibility only
-    # @todo Method not implemented yet
-    def runcall(self, func, args, kwargs):
-        pass
+    # Profile a function call and return its result
+    #
+    # The timing collector is enabled while the function is executed, unless it was already enabled, and is left in
+    # its previous state also when the function raises an exception.
+    #
+    # @param func The function to call
+    # @param args The positional arguments of the function
+    # @param kwargs The keyword arguments of the function
+    def runcall(self, func, *args, **kwargs):
+        was_timing = self.is_timing
+        if not was_timing:
+            self.enable()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            if not was_timing:
+                self.disable()
+
+    ##
+    # Call a function repeatedly and return the latency percentiles of the calls
+    #
+    # Every call is timed individually and accumulated in the region named as the function. By default the timing
+    # collector is stopped for the calling thread during the batch, so the latencies do not include the profiler
+    # overhead and the calls are not added to the statistics of the session. With profile set the batch is profiled
+    # by the timing collector as runcall() does, and the latencies include the profiler overhead.
+    #
+    # @param func The function to call
+    # @param number The number of calls
+    # @param args The positional arguments of the function
+    # @param kwargs The keyword arguments of the function
+    # @param profile If true the calls are added to the statistics of the session
+    # @return A dictionary with the number of calls and the minimum, mean, 50th, 90th, 95th, 99th percentiles and
+    # maximum latency of this batch, in seconds
+    def runcall_many(self, func, number, args = (), kwargs = None, profile = False):
+        if kwargs is None:
+            kwargs = {}
+        latencies = histogram.LatencyHistogram()
+        slot = self.regions.slot(func.__name__)
+        record = self.regions.record
+        wall_clock = regions.wall_clock
+        cpu_clock = regions.cpu_clock
+        was_timing = self.is_timing
+        if profile and not was_timing:
+            self.enable()
+        elif not profile and was_timing:
+            self.pause_thread()
+        try:
+            for index in xrange(number):
+                cpu = cpu_clock()
+                wall = wall_clock()
+                func(*args, **kwargs)
+                wall = wall_clock() - wall
+                record(slot, wall, cpu_clock() - cpu)
+                latencies.record(wall)
+        finally:
+            if profile and not was_timing:
+                self.disable()
+            elif not profile and was_timing:
+                self.resume_thread()
+        return latencies.summary()
+
+    ##
+    # Stop timing the calling thread, until resume_thread() is called
+    #
+    # The sampling collector skips the thread, the thread aware collector detaches it, and the filtered and the async
+    # collectors skip it through a per-thread flag: the other threads are still profiled. The collectors profiling
+    # the calling thread only are stopped.
+    def pause_thread(self):
+        if isinstance(self.timingProf, thread_profiler.ThreadProfiler):
+            self.timingProf.detach_thread()
+        elif self.mode == SAMPLING:
+            self.timingProf.ignored.add(threading.current_thread().ident)
+        elif self.mode in (FILTERED, ASYNC):
+            self.timingProf.pause_thread()
+        else:
+            self.timingProf.disable()
+
+    ## Start timing again the calling thread stopped by pause_thread()
+    def resume_thread(self):
+        if isinstance(self.timingProf, thread_profiler.ThreadProfiler):
+            self.timingProf.attach_thread()
+        elif self.mode == SAMPLING:
+            self.timingProf.ignored.discard(threading.current_thread().ident)
+        elif self.mode in (FILTERED, ASYNC):
+            self.timingProf.resume_thread()
+        else:
+            self.timingProf.enable()
 
     ## Stop collecting profiling data and generates a satistics report
     #
@@ -138,23 +860,106 @@ class EnabledProfiler:
     # long directory names are stripped from the modules (file names)\n
     # statistics are sorted based on the followind keys (from left to right, by level sorting)\n\n
     #
-    # Module name, Function name, Internal time
+    # Module name, Function name, Internal time\n\n
+    #
+    # When the profiler is calibrated the report is followed by the raw and adjusted times side by side.
     def statistics(self):
-        # Check for alternative out than stdout
-        if self.streaming:
-            # Open stream for writing
-            self.streamStats = open(self.streamFile, 'a')
-            stats = pstats.Stats(timingProf, stream=self.streamStats)
-        else:
-            stats = pstats.Stats(timingProf)
+        if self.reportWorker is not None:
+            self.submit_report(('module', 'name', 'time'), ('print_stats',), (), True)
+            return
+        # Output on the report stream, stdout by default
+        stats = self._report_stats()
 
-        timingProf.create_stats()
-        stats.strip_dirs()
-        stats.sort_stats('module', 'name', 'time')
-        stats.print_stats()
+        if stats is not None:
+            self.timingProf.create_stats()
+            stats.strip_dirs()
+            stats.sort_stats('module', 'name', 'time')
+            stats.print_stats()
+        self.print_extras(self.timingProf.stats)
+        self.flush_reports()
+
+    ##
+    # Stop the timing collector and return its statistics on the report stream
+    #
+    # pstats can not build the statistics of a collector with no data, as when only the regions or the line timings
+    # have been used: a line saying so is printed instead and None is returned.
+    def _report_stats(self):
+        self.timingProf.create_stats()
+        if not self.timingProf.stats:
+            print >> self.report_stream(), "No timing data collected"
+            return None
+        return pstats.Stats(self.timingProf, stream=self.report_stream())
 
-        # close the streaming
-        self.streamStats.close()
+    ##
+    # Print the reports following the statistics
+    #
+    # @param raw The reported statistics, with the full names
+    def print_extras(self, raw):
+        # Raw and adjusted times side by side when the overhead is calibrated
+        if self.bias is not None and raw:
+            calibration.print_adjusted(self.report_stream(), raw, self.bias)
+        # Tasks and loop lag of the asyncio event loop
+        if self.mode == ASYNC:
+            self.timingProf.print_loop(self.report_stream())
+        # Latency percentiles of the regions and of the profiled functions
+        if self.regions.names:
+            self.regions.print_table(self.report_stream())
+        self.print_line_timings()
+
+    ##
+    # Print the line timings of the functions selected for the line timing
+    #
+    # @param restriction A regular expression: only the functions whose file:line(function) name matches are printed
+    def print_line_timings(self, restriction = None):
+        if self.lineTimer is not None:
+            self.lineTimer.print_lines(self.report_stream(), restriction)
+
+    ##
+    # Render the reports in a background thread from now on, or in the calling thread again
+    #
+    # With the background reports statistics(), statistics_calls(), module_stats() and module_stats_calls() stop
+    # the collector and queue the report, returning immediately. The reports are written in the order they are
+    # requested, wait_reports() waits until they are all written. See the report_worker module.
+    #
+    # @param enabled If false the queued reports are written and the worker stopped
+    def background_reports(self, enabled = True):
+        if enabled and self.reportWorker is None:
+            self.reportWorker = report_worker.ReportWorker()
+        elif not enabled and self.reportWorker is not None:
+            self.reportWorker.close()
+            self.reportWorker = None
+
+    ## Wait until the reports queued so far have been written
+    def wait_reports(self):
+        if self.reportWorker is not None:
+            self.reportWorker.wait()
+
+    ##
+    # Stop the collector and queue a report to the worker
+    #
+    # @param keys The pstats sort keys
+    # @param methods The names of the pstats.Stats methods printing the report
+    # @param restrictions The restrictions passed to the printing methods
+    # @param extras If true the reports following the statistics are printed too
+    def submit_report(self, keys, methods, restrictions, extras = False):
+        self.reportWorker.submit(self._render_report, report_worker.freeze(self.timingProf), keys, methods,
+                                 restrictions, extras)
+
+    ## Write a queued report, called by the report worker
+    def _render_report(self, cache, frozen, keys, methods, restrictions, extras):
+        raw = report_worker.thaw(frozen)
+        cache.update(raw)
+        if raw:
+            stats = report_worker.CachedStats(cache, keys, self.report_stream())
+            for method in methods:
+                getattr(stats, method)(*restrictions)
+        else:
+            print >> self.report_stream(), "No timing data collected"
+        if extras:
+            self.print_extras(raw)
+        elif methods == ('print_stats',) and restrictions:
+            self.print_line_timings(restrictions[0])
+        self.flush_reports()
 
     ##
     # Stop collecting profiling data and generates a satistics graphic report for callers and callees
@@ -166,31 +971,117 @@ class EnabledProfiler:
     #
     # Module name, Function name, Internal time
     def statistics_calls(self):
+        if self.reportWorker is not None:
+            self.submit_report(('module', 'name', 'time'), ('print_callers', 'print_callees'), ())
+            return
 
-        # Check for alternative out than stdout
-        if self.streaming:
-            # Open stream for writing
-            self.streamStats = open(self.streamFile, 'a')
-            stats = pstats.Stats(timingProf, stream=self.streamStats)
-        else:
-            stats = pstats.Stats(timingProf)
+        # Output on the report stream, stdout by default
+        stats = self._report_stats()
+
+        if stats is not None:
+            self.timingProf.create_stats()
+            stats.strip_dirs()
+            stats.sort_stats('module', 'name', 'time')
+            stats.print_callers()
+            stats.print_callees()
+        self.flush_reports()
+
+    ##
+    # Generate a satistics report merging the data of the registered profilers
+    #
+    # Differently from statistics(), the merged profilers are not stopped.
+    #
+    # @param names The names of the profilers to merge. If not specified all the registered profilers are merged
+    def merged_statistics(self, names = None):
+        merged = snapshot.StatsSnapshot(registry.merge(names))
+        if not merged.stats:
+            print >> self.report_stream(), "No timing data collected"
+            self.flush_reports()
+            return
+        # Output on the report stream, stdout by default
+        stats = pstats.Stats(merged, stream=self.report_stream())
 
-        timingProf.create_stats()
         stats.strip_dirs()
         stats.sort_stats('module', 'name', 'time')
-        stats.print_callers()
-        stats.print_callees()
+        stats.print_stats()
+        self.flush_reports()
 
     ##
-    # Generate the output of the acquired memory usage
-    # If the memory sampling is not active any output is generated
-    def mem_used(self):
-        if self.is_sammpling_memory:
-            print "------------------------------------------------"
-            print "Memory usage (in Mb)"
-            print self.comment
-            print self.memoryProf
-            print "------------------------------------------------"
+    # Start tracking the memory allocation sites
+    #
+    # See the allocations module for the tracking modes.
+    #
+    # @param frames The number of frames recorded for every allocation
+    def track_allocations(self, frames = allocations.DEFAULT_FRAMES):
+        if self.allocationProf is None:
+            self.allocationProf = allocations.AllocationTracker(frames)
+        self.allocationProf.start()
+
+    ## Stop tracking the memory allocation sites. The snapshots already taken are kept
+    def stop_allocations(self):
+        if self.allocationProf is not None:
+            self.allocationProf.stop()
+
+    ##
+    # Take a snapshot of the live allocations and keep it for the following comparisons
+    #
+    # @return The index of the snapshot, or None if the allocations are not tracked
+    def allocation_snapshot(self):
+        if self.allocationProf is None:
+            return None
+        self.allocationSnapshots.append(self.allocationProf.snapshot())
+        return len(self.allocationSnapshots) - 1
+
+    ##
+    # Generate the report of the top allocation sites, linked to the timing statistics
+    #
+    # @param limit The number of sites reported
+    # @param key 'size' to sort the sites by size, 'count' to sort them by number of allocated blocks
+    def allocation_statistics(self, limit = allocations.DEFAULT_LIMIT, key = 'size'):
+        if self.allocationProf is None:
+            return
+        stream = self.report_stream()
+        print >> stream, "Top %d allocation sites by %s" % (limit, key)
+        allocations.print_top(stream, allocations.top(self.allocationProf.snapshot(), limit, key), self.snapshot(),
+                              self.allocationProf.tracing)
+        self.flush_reports()
+
+    ##
+    # Generate the report of the allocation sites grown since a previous snapshot, linked to the timing statistics
+    #
+    # A new snapshot is taken and compared with the baseline snapshot. If no snapshot has been taken yet the new
+    # snapshot becomes the baseline and no report is generated.
+    #
+    # @param limit The number of sites reported
+    # @param key 'size' to sort the sites by growth in size, 'count' to sort them by growth in number of blocks
+    # @param baseline The index of the baseline snapshot, the first one by default
+    def allocation_diff(self, limit = allocations.DEFAULT_LIMIT, key = 'size', baseline = 0):
+        if self.allocationProf is None:
+            return
+        if not self.allocationSnapshots:
+            self.allocation_snapshot()
+            return
+        current = self.allocationProf.snapshot()
+        stream = self.report_stream()
+        print >> stream, "Top %d allocation sites by %s growth since snapshot %d" % (limit, key, baseline)
+        allocations.print_compare(stream, allocations.compare(self.allocationSnapshots[baseline], current, limit, key),
+                                  self.snapshot(), self.allocationProf.tracing)
+        self.flush_reports()
+
+    ##
+    # Return the report of the acquired memory usage
+    # If the memory sampling is not active None is returned. The sampling is not stopped.
+    #
+    # @param as_json If true the report is returned as a JSON string
+    # @return A dictionary with the memory statistics, see the memory_report module, and the sampling overhead
+    def mem_used(self, as_json = False):
+        if not self.is_sammpling_memory:
+            return None
+        report = self.memoryReport.to_dict()
+        report['overhead'] = self.memoryProf.overhead()
+        if as_json:
+            return json.dumps(report, sort_keys = True)
+        return report
 
     ##
     #   Stop collecting profiling data and generates a satistics report for a specific module
@@ -209,20 +1100,20 @@ class EnabledProfiler:
 
         if module == None:
             self.statistics()
+        elif self.reportWorker is not None:
+            self.submit_report(('name', 'ncalls', 'time'), ('print_stats',), (module,))
         else:
-            # Check for alternative out than stdout
-            if self.streaming:
-                # Open stream for writing
-                self.streamStats = open(self.streamFile, 'a')
-                stats = pstats.Stats(timingProf, stream=self.streamStats)
-            else:
-                stats = pstats.Stats(timingProf)
+            # Output on the report stream, stdout by default
+            stats = self._report_stats()
 
             # Generate the statistics output
-            timingProf.create_stats()
-            stats.strip_dirs()
-            stats.sort_stats('name', 'ncalls', 'time')
-            stats.print_stats(module)
+            if stats is not None:
+                self.timingProf.create_stats()
+                stats.strip_dirs()
+                stats.sort_stats('name', 'ncalls', 'time')
+                stats.print_stats(module)
+            self.print_line_timings(module)
+            self.flush_reports()
 
     ##
     #   Stop collecting profiling data and generates a satistics report for a specific module if needed.
@@ -241,16 +1132,15 @@ class EnabledProfiler:
 
         if module == None:
             self.statistics()
+        elif self.reportWorker is not None:
+            self.submit_report(('name', 'ncalls', 'time'), ('print_callees',), (module,))
         else:
-            # Check for alternative out than stdout
-            if self.streaming:
-                # Open stream for writing
-                self.streamStats = open(self.streamFile, 'a')
-                stats = pstats.Stats(timingProf, stream=self.streamStats)
-            else:
-                stats = pstats.Stats(timingProf)
+            # Output on the report stream, stdout by default
+            stats = self._report_stats()
 
-            timingProf.create_stats()
-            stats.strip_dirs()
-            stats.sort_stats('name', 'ncalls', 'time')
-            stats.print_callees(module)
+            if stats is not None:
+                self.timingProf.create_stats()
+                stats.strip_dirs()
+                stats.sort_stats('name', 'ncalls', 'time')
+                stats.print_callees(module)
+            self.flush_reports()
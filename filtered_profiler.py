@@ -0,0 +1,319 @@
+## @file filtered_profiler.py
+# @package profiler
+# @brief Deterministic profiler recording only the functions of selected modules
+#
+# The cProfile collector hooks every call of the program and the module reports only filter the results, so the hot
+# paths still pay the profiling cost of every library function they call. The filtered profiler selects the functions
+# to profile every time it is enabled: the functions and the class methods of the included modules, or the included
+# functions and code objects, less the excluded ones. The selected functions are replaced by timing wrappers in the
+# namespaces of all the loaded modules and in their classes, while all the other functions are left untouched and
+# run at full speed. The profiling overhead is then proportional to the number of calls of the selected functions.
+# A wrapper is written in Python and costs several times the cProfile hook, so this mode pays off when most of the
+# calls of the program are done by the code not selected, as the libraries. A profile hook filtering the calls by
+# file name would cost a Python call for every call of the program, the libraries included.\n\n
+# The times are recorded as cProfile does: the internal time of a function excludes the time of the selected
+# functions it calls, the recursive calls are counted once in the cumulative time, and the calls between the selected
+# functions are recorded as caller edges. The statistics have the same format produced by cProfile, so the pstats
+# based reports work the same way.\n\n
+# Only the references reachable from the module namespaces and the classes when the profiler is enabled are
+# replaced: the modules imported while the profiler is enabled, the functions referenced elsewhere (bound methods,
+# callbacks, closures) and the generator functions, whose body runs after the wrapper returns, are not profiled.
+# When the profiler is disabled the original functions are put back, so the functions have their identity again and
+# the modules imported in the meantime are selected at the next enable(). The wrappers still referenced elsewhere only
+# check a flag.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.\n
+#
+# Copyright NXP PLMA.  All Rights Reserved.\n
+#
+# Licensed under the Apache License, Version 2.0 (the "License");\n
+# you may not use this file except in compliance with the License.\n
+# You may obtain a copy of the License at\n
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+# either express or implied.  See the License for the specific language
+# governing permissions and limitations under the License.
+#
+# @date March 2016
+# @author Enrico Miglino <enrico.miglino@gmail.com>
+# @version 0.1.5
+# @version documentation version 0.5
+
+import sys, os, types, threading, time, functools, marshal
+import cProfile, pstats
+
+## Code flag of the generator functions
+CO_GENERATOR = 0x20
+
+## Directory of the profiler package, whose functions are never profiled
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+## Class types whose methods can be replaced
+CLASS_TYPES = (type, types.ClassType)
+
+## Profiling state of a thread: the call stack and the statistics are created at its first profiled call
+class _ThreadState(threading.local):
+    ## True while the thread is not profiled, see FilteredProfiler.pause_thread()
+    paused = False
+
+##
+# FilteredProfiler class is a timing collector with the same interface of cProfile.Profile
+class FilteredProfiler:
+
+    ##
+    # Constructor
+    #
+    # Every item of the include and exclude lists is a module name, matching the module and its submodules, a
+    # module, a function, a method or a code object. The functions are selected among the modules loaded when the
+    # profiler is enabled, and the generator functions are never profiled.
+    #
+    # @param include The modules and functions to profile
+    # @param exclude The modules and functions not to profile, also when included
+    def __init__(self, include = (), exclude = ()):
+        self.include_modules, self.include_codes = _split(include)
+        self.exclude_modules, self.exclude_codes = _split(exclude)
+        ## The code objects of the profiled functions, computed by the first enable() call
+        self.codes = None
+        ## The statistics created by the last create_stats() call
+        self.stats = {}
+        ## Flag checked by the wrappers, True while the profiler is enabled
+        self.enabled = False
+        self.timer = time.time
+        self.local = _ThreadState()
+        ## The statistics of every thread that called a profiled function
+        self.thread_stats = []
+        self.lock = threading.Lock()
+        # The replaced references, as (namespace, name, original, wrapper) tuples
+        self.patches = []
+
+    ## Start profiling, replacing the selected functions of the modules loaded so far
+    def enable(self):
+        if self.codes is None:
+            self.install()
+        self.enabled = True
+
+    ## Stop profiling and put back the original functions, see restore()
+    def disable(self):
+        self.restore()
+
+    ## Return True if the profiler is enabled
+    def is_running(self):
+        return self.enabled
+
+    ## Stop profiling the calling thread only, the wrappers stay in place for the other threads
+    def pause_thread(self):
+        self.local.paused = True
+
+    ## Profile again the calling thread stopped by pause_thread()
+    def resume_thread(self):
+        self.local.paused = False
+
+    ## Return True if a function defined in a module with the given name should be profiled
+    def selected(self, module, code):
+        if code.co_flags & CO_GENERATOR or os.path.dirname(os.path.abspath(code.co_filename)) == PACKAGE_DIR:
+            return False
+        if code in self.exclude_codes or _matches(module, self.exclude_modules):
+            return False
+        return code in self.include_codes or _matches(module, self.include_modules)
+
+    ##
+    # Replace the selected functions with the timing wrappers
+    #
+    # All the loaded modules are scanned, so a selected function is replaced also where it has been imported by
+    # another module.
+    def install(self):
+        self.codes = set()
+        wrappers = {}
+        classes = set()
+        for module in sys.modules.values():
+            if module is None:
+                continue
+            namespace = module.__dict__
+            for name, value in namespace.items():
+                if isinstance(value, types.FunctionType):
+                    wrapper = self._wrapper(value, value.__module__, wrappers)
+                    if wrapper is not None:
+                        self.patches.append((namespace, name, value, wrapper))
+                        namespace[name] = wrapper
+                elif isinstance(value, CLASS_TYPES) and id(value) not in classes:
+                    classes.add(id(value))
+                    self._install_class(value, wrappers)
+
+    ## Replace the selected methods of a class
+    def _install_class(self, cls, wrappers):
+        module = getattr(cls, '__module__', None)
+        if not isinstance(module, str):
+            return
+        for name, value in vars(cls).items():
+            if isinstance(value, types.FunctionType):
+                wrapper = self._wrapper(value, module, wrappers)
+            elif isinstance(value, (staticmethod, classmethod)):
+                wrapper = self._wrapper(value.__func__, module, wrappers)
+                if wrapper is not None:
+                    wrapper = type(value)(wrapper)
+            else:
+                continue
+            if wrapper is not None:
+                self.patches.append((cls, name, value, wrapper))
+                setattr(cls, name, wrapper)
+
+    ## Return the timing wrapper of a function, None if the function is not selected
+    def _wrapper(self, func, module, wrappers):
+        wrapper = wrappers.get(id(func))
+        if wrapper is not None:
+            return wrapper
+        code = func.func_code
+        if getattr(func, '_filtered_original', None) is not None or not self.selected(module, code):
+            return None
+        self.codes.add(code)
+        wrapper = wrappers[id(func)] = self._wrap(func, cProfile.label(code))
+        return wrapper
+
+    ## Create the timing wrapper of a function
+    def _wrap(self, func, key):
+        profiler = self
+        local = self.local
+        timer = self.timer
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not profiler.enabled or local.paused:
+                return func(*args, **kwargs)
+            try:
+                stack, stats = local.state
+            except AttributeError:
+                stack, stats = profiler._thread_state()
+            # Entry: primitive calls, calls, internal time, cumulative time, callers, active calls of the thread
+            entry = stats.get(key)
+            if entry is None:
+                entry = stats[key] = [0, 0, 0.0, 0.0, {}, 0]
+            depth = entry[5]
+            entry[5] = depth + 1
+            frame = [key, 0.0]
+            stack.append(frame)
+            start = timer()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = timer() - start
+                stack.pop()
+                entry[5] = depth
+                entry[1] += 1
+                entry[2] += elapsed - frame[1]
+                if not depth:
+                    entry[0] += 1
+                    entry[3] += elapsed
+                if stack:
+                    caller = stack[-1]
+                    caller[1] += elapsed
+                    edge = entry[4].get(caller[0])
+                    if edge is None:
+                        edge = entry[4][caller[0]] = [0, 0, 0.0, 0.0]
+                    edge[0] += 1
+                    edge[2] += elapsed - frame[1]
+                    if not depth:
+                        edge[1] += 1
+                        edge[3] += elapsed
+        wrapper._filtered_original = func
+        return wrapper
+
+    ## Create the profiling state of the current thread: the call stack and the statistics
+    def _thread_state(self):
+        state = self.local.state = ([], {})
+        with self.lock:
+            self.thread_stats.append(state[1])
+        return state
+
+    ##
+    # Discard the statistics collected so far, keeping the wrappers
+    #
+    # Used in the child processes, where the wrappers inherited from the parent are still in place.
+    def reset(self):
+        with self.lock:
+            for stats in self.thread_stats:
+                stats.clear()
+        self.stats = {}
+
+    ##
+    # Stop profiling and put back the original functions. The profiler can be enabled again, selecting the functions
+    # again
+    #
+    # The references changed by the program since the wrappers have been installed are left alone.
+    def restore(self):
+        self.enabled = False
+        for namespace, name, original, wrapper in reversed(self.patches):
+            if isinstance(namespace, dict):
+                if namespace.get(name) is wrapper:
+                    namespace[name] = original
+            elif vars(namespace).get(name) is wrapper:
+                setattr(namespace, name, original)
+        self.patches = []
+        self.codes = None
+
+    ## Return the statistics collected so far in the pstats format, merging all the threads, without stopping
+    def snapshot(self):
+        with self.lock:
+            thread_stats = list(self.thread_stats)
+        stats = {}
+        for entries in thread_stats:
+            for func, entry in entries.items():
+                cc, nc, tt, ct, callers = entry[:5]
+                callers = dict((caller, tuple(edge)) for caller, edge in callers.items())
+                if func in stats:
+                    pcc, pnc, ptt, pct, pcallers = stats[func]
+                    cc, nc, tt, ct = cc + pcc, nc + pnc, tt + ptt, ct + pct
+                    for caller, edge in pcallers.iteritems():
+                        if caller in callers:
+                            callers[caller] = tuple(a + b for a, b in zip(edge, callers[caller]))
+                        else:
+                            callers[caller] = edge
+                stats[func] = cc, nc, tt, ct, callers
+        return stats
+
+    ## Stop profiling and record the results internally as the current profile
+    def create_stats(self):
+        self.disable()
+        self.stats = self.snapshot()
+
+    ## Create a stats object based on the current profile and print the results to stdout
+    def print_stats(self, sort = -1):
+        pstats.Stats(self).strip_dirs().sort_stats(sort).print_stats()
+
+    ## Write the results of the current profile to file, in the same format of cProfile
+    def dump_stats(self, file):
+        f = open(file, 'wb')
+        try:
+            self.create_stats()
+            marshal.dump(self.stats, f)
+        finally:
+            f.close()
+
+## Split the items of an include or exclude list into a tuple of module names and a set of code objects
+def _split(items):
+    modules = []
+    codes = set()
+    for item in items or ():
+        if isinstance(item, basestring):
+            modules.append(item)
+        elif isinstance(item, types.ModuleType):
+            modules.append(item.__name__)
+        elif isinstance(item, types.CodeType):
+            codes.add(item)
+        else:
+            func = getattr(item, 'im_func', item)
+            codes.add(getattr(func, '_filtered_original', func).func_code)
+    return tuple(modules), codes
+
+## Return True if the module name is one of the names or a submodule of one of them
+def _matches(module, names):
+    if not module:
+        return False
+    for name in names:
+        if module == name or module.startswith(name + '.'):
+            return True
+    return False
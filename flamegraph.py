@@ -0,0 +1,264 @@
+## @file flamegraph.py
+# @package profiler
+# @brief Export of the profiled stacks as collapsed stacks and flame graphs
+#
+# A flame graph shows all the stacks of the profiled program in a single picture: every frame is a box as wide as the
+# time spent in the function and in its callees along that stack, with the callees stacked on top of their callers.
+# The stacks are first converted to the collapsed format, one line per distinct stack with the frames separated by
+# semicolons followed by the stack weight, the same format read by the FlameGraph tools
+# (https://github.com/brendangregg/FlameGraph). Then the collapsed stacks are drawn as a self-contained SVG image,
+# optionally wrapped in an HTML page, with no external scripts or styles.\n\n
+# The stacks come straight from the collectors data, with no pstats report formatting:
+# <ul>
+# <li>the sampling profiler keeps the count of every distinct stack, exported as is with the weights in samples</li>
+# <li>the deterministic profilers keep the call graph only, the time of every caller-callee edge. The stacks are
+# rebuilt by expanding the graph from the root functions and splitting the time of every function among its callees
+# proportionally to the edge times. The branches under a fraction of the total time are pruned, so the number of
+# exported stacks is bounded whatever the size of the graph, and building the graph is linear in the number of
+# edges. The weights are in microseconds.</li>
+# </ul>
+# The collapsed stacks and the SVG rectangles are written to the output stream while they are produced. From the
+# command line a profile dump or a columnar file is exported by extension of the output file (.svg, .html, or any
+# other for the collapsed stacks):
+# \code
+# python flamegraph.py profile.prof profile.svg
+# \endcode
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.\n
+#
+# Copyright NXP PLMA.  All Rights Reserved.\n
+#
+# Licensed under the Apache License, Version 2.0 (the "License");\n
+# you may not use this file except in compliance with the License.\n
+# You may obtain a copy of the License at\n
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+# either express or implied.  See the License for the specific language
+# governing permissions and limitations under the License.
+#
+# @date March 2016
+# @author Enrico Miglino <enrico.miglino@gmail.com>
+# @version 0.1.5
+# @version documentation version 0.5
+
+import sys, os, zlib, cProfile
+from xml.sax.saxutils import escape
+import columnar
+
+## Default fraction of the total time under which the branches of the call graph are pruned
+DEFAULT_THRESHOLD = 0.001
+
+## Default maximum depth of the stacks rebuilt from the call graph
+DEFAULT_MAX_DEPTH = 256
+
+## Default width of the flame graph, in pixels
+DEFAULT_WIDTH = 1200
+
+## Height of a frame, in pixels
+FRAME_HEIGHT = 16
+
+## Frames narrower than this width, in pixels, are not drawn
+MIN_FRAME_WIDTH = 0.1
+
+## Average width of a character of the frame labels, in pixels
+CHAR_WIDTH = 7
+
+##
+# Return the name of a frame in the collapsed stacks
+#
+# @param label The (file name, line number, function name) label of the function
+def frame_name(label):
+    filename, line, name = label
+    if filename == '~':
+        return name.replace(';', ':')
+    return ('%s (%s:%d)' % (name, os.path.basename(filename), line)).replace(';', ':')
+
+##
+# Return the collapsed stacks of a sampling profiler stack table
+#
+# @param stacks The stack count table: stack tuple of code objects, outermost first -> number of samples
+# @return A generator of (frames tuple, number of samples) pairs
+def collapsed_stacks(stacks):
+    names = {}
+    label = cProfile.label
+    for stack, count in stacks.items():
+        frames = []
+        for code in stack:
+            name = names.get(code)
+            if name is None:
+                name = names[code] = frame_name(label(code))
+            frames.append(name)
+        if frames:
+            yield tuple(frames), count
+
+##
+# Return the collapsed stacks rebuilt from a call graph
+#
+# Every function is a root for the part of its cumulative time not coming from the known callers. From every root
+# the time is split among the callees proportionally to the edge cumulative times, and the internal time of every
+# function is emitted as the weight of the stack ending there. The recursive calls are not expanded.
+#
+# @param stats The statistics in the pstats format
+# @param threshold The fraction of the total time under which a branch is pruned
+# @param max_depth The maximum depth of the stacks
+# @return A generator of (frames tuple, time in seconds) pairs
+def collapsed_graph(stats, threshold = DEFAULT_THRESHOLD, max_depth = DEFAULT_MAX_DEPTH):
+    callees = {}
+    roots = []
+    total = 0.0
+    for func, (cc, nc, tt, ct, callers) in stats.iteritems():
+        total += tt
+        called = 0.0
+        for caller, edge in callers.iteritems():
+            if caller != func and caller in stats:
+                callees.setdefault(caller, []).append((func, edge[3]))
+                called += edge[3]
+        if ct - called > 0:
+            roots.append((func, ct - called))
+    minimum = total * threshold
+    names = {}
+
+    pending = [((), func, weight) for func, weight in roots if weight >= minimum]
+    while pending:
+        path, func, weight = pending.pop()
+        name = names.get(func)
+        if name is None:
+            name = names[func] = frame_name(func)
+        path = path + (name,)
+        cc, nc, tt, ct = stats[func][:4]
+        scale = weight / ct if ct > 0 else 0.0
+        own = tt * scale
+        if len(path) < max_depth:
+            for callee, edge_time in callees.get(func, ()):
+                child = edge_time * scale
+                if child >= minimum and names.get(callee) not in path:
+                    pending.append((path, callee, child))
+        if own >= minimum:
+            yield path, own
+
+##
+# Write the collapsed stacks, one line per stack
+#
+# @param items The (frames tuple, weight) pairs
+# @param stream The output stream
+# @param scale The factor applied to the weights, which are written as integers
+def write_collapsed(items, stream, scale = 1):
+    write = stream.write
+    for frames, weight in items:
+        value = int(round(weight * scale))
+        if value > 0:
+            write('%s %d\n' % (';'.join(frames), value))
+
+## Return the fill colour of a frame, a warm colour chosen by the hash of the function name
+def _colour(name):
+    value = zlib.crc32(name) & 0xffffffff
+    return 'rgb(%d,%d,%d)' % (205 + value % 50, (value >> 8) % 180, (value >> 16) % 55)
+
+##
+# Draw the collapsed stacks as a flame graph
+#
+# The stacks are merged in a tree, whose frames are then written as SVG rectangles with the function name and the
+# weight as tooltip.
+#
+# @param items The (frames tuple, weight) pairs
+# @param stream The output stream
+# @param title The title of the graph
+# @param unit The unit of the weights shown in the tooltips
+# @param width The width of the graph, in pixels
+# @param html If true an HTML page containing the graph is written
+def write_svg(items, stream, title = 'Flame graph', unit = 'samples', width = DEFAULT_WIDTH, html = False):
+    # Tree node: [weight, children by name]
+    root = [0.0, {}]
+    depth = 0
+    for frames, weight in items:
+        node = root
+        node[0] += weight
+        for name in frames:
+            child = node[1].get(name)
+            if child is None:
+                child = node[1][name] = [0.0, {}]
+            child[0] += weight
+            node = child
+        depth = max(depth, len(frames))
+
+    total = root[0]
+    height = (depth + 3) * FRAME_HEIGHT
+    write = stream.write
+    if html:
+        write('<!DOCTYPE html>\n<html><head><meta charset="utf-8"><title>%s</title></head><body>\n' % escape(title))
+    else:
+        write('<?xml version="1.0" encoding="utf-8" standalone="no"?>\n')
+    write('<svg version="1.1" xmlns="http://www.w3.org/2000/svg" width="%d" height="%d" viewBox="0 0 %d %d">\n'
+          % (width, height, width, height))
+    write('<style>text { font-family: Verdana, sans-serif; font-size: 12px; } rect:hover { stroke: black; }</style>\n')
+    write('<rect x="0" y="0" width="%d" height="%d" fill="rgb(248,248,248)"/>\n' % (width, height))
+    write('<text x="%d" y="%d" text-anchor="middle" font-size="16">%s</text>\n'
+          % (width / 2, FRAME_HEIGHT + 4, escape(title)))
+
+    if total > 0:
+        ratio = float(width) / total
+        pending = [(root[1], 0.0, 0)]
+        while pending:
+            children, x, level = pending.pop()
+            y = height - (level + 1) * FRAME_HEIGHT
+            for name in sorted(children):
+                weight, grandchildren = children[name]
+                frame_width = weight * ratio
+                if frame_width >= MIN_FRAME_WIDTH:
+                    tooltip = '%s (%s %s, %.2f%%)' % (name, _number(weight), unit, weight * 100.0 / total)
+                    write('<g><title>%s</title><rect x="%.1f" y="%d" width="%.1f" height="%d" fill="%s" rx="2"/>'
+                          % (escape(tooltip), x, y, frame_width, FRAME_HEIGHT - 1, _colour(name)))
+                    chars = int(frame_width / CHAR_WIDTH) - 1
+                    if chars >= 3:
+                        text = name if len(name) <= chars else name[:chars - 2] + '..'
+                        write('<text x="%.1f" y="%d">%s</text>' % (x + 3, y + FRAME_HEIGHT - 4, escape(text)))
+                    write('</g>\n')
+                    if grandchildren:
+                        pending.append((grandchildren, x, level + 1))
+                x += frame_width
+
+    write('</svg>\n')
+    if html:
+        write('</body></html>\n')
+
+## Format a weight for the tooltips
+def _number(weight):
+    if weight == int(weight):
+        return '%d' % weight
+    return '%.6f' % weight
+
+##
+# Export a profile to a file, choosing the format by the file extension: .svg, .html, or collapsed stacks otherwise
+#
+# @param items The (frames tuple, weight) pairs
+# @param filename The name of the output file
+# @param unit The unit of the weights, 'samples' or 's' for seconds, written in microseconds in the collapsed stacks
+# @param title The title of the graph
+def export(items, filename, unit = 'samples', title = 'Flame graph'):
+    extension = os.path.splitext(filename)[1].lower()
+    out = open(filename, 'w')
+    try:
+        if extension in ('.svg', '.html', '.htm'):
+            write_svg(items, out, title, unit, html = extension != '.svg')
+        else:
+            write_collapsed(items, out, 1e6 if unit == 's' else 1)
+    finally:
+        out.close()
+
+## Command line entry point, exporting a profile dump or a columnar file
+def main(argv):
+    if len(argv) != 2:
+        print >> sys.stderr, "Usage: %s <profile file> <output file (.svg, .html, .txt)>" % (
+            os.path.basename(sys.argv[0]))
+        return 2
+    stats = columnar.load_any(argv[0]).to_stats()
+    export(collapsed_graph(stats), argv[1], 's', os.path.basename(argv[0]))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
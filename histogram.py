@@ -0,0 +1,153 @@
+## @file histogram.py
+# @package profiler
+# @brief Log-bucketed latency histograms with constant memory and recording time
+#
+# The totals and averages of the profiler reports hide the tail latency. The latency histogram records every
+# measured duration in a bucket of a fixed logarithmic scale, as the HDR histograms do: every power of two between
+# the minimum and the maximum trackable values is divided in a fixed number of linear sub-buckets, so the relative
+# error of a percentile does not depend on the magnitude of the values.\n\n
+# With the default settings durations from about 60 ns to more than one hour are tracked with a relative error under
+# 1.6% (half of a sub-bucket), using a preallocated array of 1152 counters per histogram. Recording a value costs a
+# call to math.frexp() and a few arithmetic operations whatever the number of recorded values.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.\n
+#
+# Copyright NXP PLMA.  All Rights Reserved.\n
+#
+# Licensed under the Apache License, Version 2.0 (the "License");\n
+# you may not use this file except in compliance with the License.\n
+# You may obtain a copy of the License at\n
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+# either express or implied.  See the License for the specific language
+# governing permissions and limitations under the License.
+#
+# @date March 2016
+# @author Enrico Miglino <enrico.miglino@gmail.com>
+# @version 0.1.5
+# @version documentation version 0.5
+
+import math
+from array import array
+
+## Number of linear sub-buckets in every power of two
+SUB_BUCKETS = 32
+
+## Exponent of the first power of two tracked, covering the values from 2^-24 s (about 60 ns) to 2^-23 s
+MIN_EXPONENT = -23
+
+## Exponent of the largest trackable value: 2^13 s, more than two hours
+MAX_EXPONENT = 13
+
+## Total number of buckets
+BUCKETS = (MAX_EXPONENT - MIN_EXPONENT) * SUB_BUCKETS
+
+## Percentiles reported by the summaries
+PERCENTILES = (50, 90, 95, 99)
+
+##
+# Return the value representing a bucket, the middle of its range
+#
+# @param index The bucket index
+def bucket_value(index):
+    exponent = index // SUB_BUCKETS + MIN_EXPONENT
+    sub = index % SUB_BUCKETS
+    return math.ldexp(0.5 + (sub + 0.5) / (2.0 * SUB_BUCKETS), exponent)
+
+##
+# LatencyHistogram class counts the recorded durations in logarithmic buckets
+class LatencyHistogram:
+
+    ##
+    # Constructor, creating an empty histogram
+    def __init__(self):
+        ## The bucket counters
+        self.counts = array('d', [0.0]) * BUCKETS
+        ## Number of recorded values
+        self.count = 0
+        ## Sum of the recorded values
+        self.total = 0.0
+        ## Smallest recorded value
+        self.min = None
+        ## Largest recorded value
+        self.max = 0.0
+
+    ##
+    # Record a duration
+    #
+    # Values under the smallest trackable value are counted in the first bucket, values over the largest one in
+    # the last bucket. The exact minimum and maximum are tracked anyway.
+    #
+    # @param value The duration, in seconds
+    def record(self, value):
+        mantissa, exponent = math.frexp(value)
+        index = (exponent - MIN_EXPONENT) * SUB_BUCKETS + int((mantissa - 0.5) * 2 * SUB_BUCKETS)
+        if index < 0 or value <= 0:
+            index = 0
+        elif index >= BUCKETS:
+            index = BUCKETS - 1
+        self.counts[index] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+        if self.min is None or value < self.min:
+            self.min = value
+
+    ## Add the values recorded by another histogram
+    def add(self, other):
+        counts = self.counts
+        for index, count in enumerate(other.counts):
+            if count:
+                counts[index] += count
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+
+    ##
+    # Return the values at the requested percentiles, scanning the buckets once
+    #
+    # The value of a bucket is clipped to the exact minimum and maximum recorded values.
+    #
+    # @param percentiles The requested percentiles, between 0 and 100, in increasing order
+    def percentiles(self, percentiles):
+        values = []
+        if self.count == 0:
+            return [0.0] * len(percentiles)
+        targets = [max(1, int(math.ceil(percentile / 100.0 * self.count))) for percentile in percentiles]
+        cumulative = 0
+        position = 0
+        for index, count in enumerate(self.counts):
+            if not count:
+                continue
+            cumulative += count
+            while position < len(targets) and cumulative >= targets[position]:
+                values.append(min(max(bucket_value(index), self.min), self.max))
+                position += 1
+            if position == len(targets):
+                break
+        return values
+
+    ## Return the value at a percentile, between 0 and 100
+    def percentile(self, percentile):
+        return self.percentiles((percentile,))[0]
+
+    ##
+    # Return the summary of the histogram
+    #
+    # @return A dictionary with the number of values and the minimum, mean, 50th, 90th, 95th, 99th percentiles and
+    # maximum values
+    def summary(self):
+        if self.count == 0:
+            return {'calls': 0}
+        summary = {'calls': self.count, 'min': self.min, 'max': self.max, 'mean': self.total / self.count}
+        for percentile, value in zip(PERCENTILES, self.percentiles(PERCENTILES)):
+            summary['p%d' % percentile] = value
+        return summary
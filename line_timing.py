@@ -0,0 +1,312 @@
+## @file line_timing.py
+# @package profiler
+# @brief Line level timing and memory increments of a selected set of functions
+#
+# The timing collectors resolve the time to the functions. For the large functions where the time goes in one loop
+# out of many, the line timer measures every line of a selected set of functions: the number of times the line has
+# been executed (hits) and the time from the start of the line to the start of the next line executed in the same
+# frame, the callees included.\n\n
+# The functions are selected by decorating them or by name: the selected functions are replaced by a wrapper which
+# installs the trace function with sys.settrace() on entry to the outermost selected call of the thread, and removes
+# it on exit. The trace function returns the line tracer only for the frames of the selected code objects, so the
+# other functions are not traced and run at full speed out of the selected functions, and pay a single check per
+# call inside them. A thread already traced by another tool, as a debugger or a coverage tool, is not timed, and the
+# generator functions are not timed as their body runs after the wrapper returns.\n\n
+# In the memory mode the memory increment of every line is also measured, as the difference of an allocation counter
+# between the start of the line and the start of the next line. Reading the process memory at every line would cost
+# a system call per line, so the cheapest counter available is used instead:
+# <ul>
+# <li>the memory traced by the tracemalloc module, in bytes, when available (Python 3.4+ or the Python 2.7 builds
+# patched with pytracemalloc). The tracing is started if needed</li>
+# <li>sys.getallocatedblocks(), the number of memory blocks allocated by the interpreter, in Python 3.4+ when
+# tracemalloc is not available</li>
+# <li>the net number of objects tracked by the garbage collector, from the counters of gc.get_count(). The objects
+# without references to other objects, as strings and numbers, are not counted</li>
+# </ul>
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.\n
+#
+# Copyright NXP PLMA.  All Rights Reserved.\n
+#
+# Licensed under the Apache License, Version 2.0 (the "License");\n
+# you may not use this file except in compliance with the License.\n
+# You may obtain a copy of the License at\n
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+# either express or implied.  See the License for the specific language
+# governing permissions and limitations under the License.
+#
+# @date March 2016
+# @author Enrico Miglino <enrico.miglino@gmail.com>
+# @version 0.1.5
+# @version documentation version 0.5
+
+import sys, gc, time, functools, inspect, linecache, re
+import cProfile, pstats
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+##
+# The column header and the function summary of the increments in the reports, by unit of the allocation counter.
+# The garbage collector fallback counts objects, whatever their size, so its increments are not reported as memory
+INCREMENT_LABELS = {
+    'bytes': ("Mem (bytes)", "memory increment %d bytes"),
+    'blocks': ("Mem (blocks)", "memory increment %d blocks"),
+    'objects': ("Objects", "objects increment %d (objects tracked by the garbage collector, not bytes)"),
+}
+
+##
+# LineTimer class collects the line timings of the selected functions
+class LineTimer:
+
+    def __init__(self):
+        ## The line timings by code object: line number -> [hits, time, memory increment]
+        self.lines = {}
+        ## The functions replaced by name, as (owner, attribute name, original value) tuples
+        self.patches = []
+        ## Flag checked by the wrappers, the selected functions are timed while True
+        self.enabled = True
+        self.timer = time.time
+        ## The allocation counter of the memory mode, None when the memory increments are not measured
+        self.memory = None
+        ## The unit of the memory increments, None if the memory mode has never been started
+        self.memory_unit = None
+        ## True if the tracemalloc tracing has been started by the memory mode
+        self.started_tracing = False
+
+    ## Start measuring the memory increments of the lines, in the frames of the selected functions started from now
+    def start_memory(self):
+        if self.memory is None:
+            self.memory, self.memory_unit, self.started_tracing = memory_counter()
+
+    ## Stop measuring the memory increments of the lines
+    def stop_memory(self):
+        self.memory = None
+        if self.started_tracing:
+            self.started_tracing = False
+            tracemalloc.stop()
+
+    ##
+    # Return the timing wrapper of a function, selecting its code object
+    #
+    # @param func The function to time
+    def wrap(self, func):
+        if getattr(func, '_line_timed', None) is not None:
+            return func
+        self.lines.setdefault(func.func_code, {})
+        timer = self
+        trace = self._trace
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not timer.enabled or sys.gettrace() is not None:
+                return func(*args, **kwargs)
+            sys.settrace(trace)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                sys.settrace(None)
+        wrapper._line_timed = func
+        return wrapper
+
+    ##
+    # Select the functions by name, replacing them with their timing wrapper
+    #
+    # @param names The dotted names of the functions, as 'package.module.function' or 'module.Class.method'
+    def add_names(self, names):
+        for name in names:
+            owner, attribute = _resolve(name)
+            # The value defined by the owner itself, not the unbound method nor the value inherited from a base class
+            defined = attribute in vars(owner)
+            value = vars(owner).get(attribute)
+            if isinstance(value, (staticmethod, classmethod)):
+                wrapper = type(value)(self.wrap(value.__func__))
+            else:
+                function = getattr(owner, attribute)
+                wrapper = self.wrap(getattr(function, 'im_func', function))
+            self.patches.append((owner, attribute, value, defined, wrapper))
+            setattr(owner, attribute, wrapper)
+
+    ##
+    # Put back the functions replaced by name
+    #
+    # The wrappers of the functions inherited from a base class are deleted, and the references changed by the
+    # program since the wrappers have been installed are left alone.
+    def restore(self):
+        while self.patches:
+            owner, attribute, value, defined, wrapper = self.patches.pop()
+            if vars(owner).get(attribute) is not wrapper:
+                continue
+            if defined:
+                setattr(owner, attribute, value)
+            else:
+                delattr(owner, attribute)
+
+    ## Trace function of the calls in the traced threads, returning the line tracer of the selected frames only
+    def _trace(self, frame, event, arg):
+        lines = self.lines.get(frame.f_code)
+        if lines is None:
+            return None
+        clock = self.timer
+        memory = self.memory
+        # The entry of the line executed, the time and the allocation counter since its time is being counted
+        state = [None, 0.0, 0]
+
+        # A hit is counted when a line starts. The time of the line is counted up to every event, as an exception
+        # event is followed by the next line or by the return of the frame
+        def trace_lines(frame, event, arg):
+            now = clock()
+            entry = state[0]
+            if entry is not None:
+                entry[1] += now - state[1]
+            if event == 'line':
+                entry = lines.get(frame.f_lineno)
+                if entry is None:
+                    entry = lines[frame.f_lineno] = [0, 0.0, 0]
+                entry[0] += 1
+                state[0] = entry
+            elif event == 'return':
+                state[0] = None
+            state[1] = clock()
+            return trace_lines
+
+        def trace_lines_memory(frame, event, arg):
+            now = clock()
+            allocated = memory()
+            entry = state[0]
+            if entry is not None:
+                entry[1] += now - state[1]
+                entry[2] += allocated - state[2]
+            if event == 'line':
+                entry = lines.get(frame.f_lineno)
+                if entry is None:
+                    entry = lines[frame.f_lineno] = [0, 0.0, 0]
+                entry[0] += 1
+                state[0] = entry
+            elif event == 'return':
+                state[0] = None
+            state[2] = memory()
+            state[1] = clock()
+            return trace_lines_memory
+        return trace_lines if memory is None else trace_lines_memory
+
+    ##
+    # Return the line timings collected so far
+    #
+    # @return A dictionary mapping the (file name, line number, function name) labels of the functions to
+    # dictionaries mapping the line numbers to (hits, time, memory increment) tuples, the increments in the
+    # memory_unit
+    def snapshot(self):
+        stats = {}
+        for code, lines in self.lines.items():
+            stats[cProfile.label(code)] = dict((line, tuple(entry)) for line, entry in lines.items())
+        return stats
+
+    ##
+    # Print the line timings of every selected function, with the source lines
+    #
+    # @param stream The output stream
+    # @param restriction A regular expression: only the functions whose file:line(function) name matches are printed
+    def print_lines(self, stream, restriction = None):
+        for code, lines in sorted(self.lines.items(), key = lambda item: cProfile.label(item[0])):
+            label = cProfile.label(code)
+            if restriction is not None and not re.search(restriction, pstats.func_std_string(label)):
+                continue
+            lines = dict(lines)
+            total = sum(entry[1] for entry in lines.itervalues())
+            unit = self.memory_unit
+            print >> stream, "Function %s at %s:%d, total time %.6f s" % (label[2], label[0], label[1], total),
+            if unit is not None:
+                header, summary = INCREMENT_LABELS[unit]
+                print >> stream, summary % sum(entry[2] for entry in lines.itervalues()),
+            print >> stream
+            print >> stream, "%8s %10s %12s %12s %8s" % ("Line", "Hits", "Time (s)", "Per hit (us)", "% Time"),
+            if unit is not None:
+                print >> stream, "%14s" % header,
+            print >> stream, " Line contents"
+            for number, text in _source(code, lines):
+                entry = lines.get(number)
+                if entry is None:
+                    print >> stream, "%8d %10s %12s %12s %8s" % (number, '', '', '', ''),
+                    if unit is not None:
+                        print >> stream, "%14s" % '',
+                else:
+                    hits, elapsed, allocated = entry
+                    print >> stream, "%8d %10d %12.6f %12.3f %8.1f" % (
+                        number, hits, elapsed, elapsed / hits * 1e6, elapsed * 100.0 / total if total else 0.0),
+                    if unit is not None:
+                        print >> stream, "%+14d" % allocated,
+                print >> stream, "", text
+            print >> stream
+
+##
+# Return the cheapest allocation counter available
+#
+# @return A (counter function, unit, tracing started) tuple: the counter function returns a number growing with the
+# allocations, in the unit, and the flag is True if the tracemalloc tracing has been started
+def memory_counter():
+    if tracemalloc is not None:
+        started = not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start()
+        traced = tracemalloc.get_traced_memory
+        return (lambda: traced()[0]), 'bytes', started
+    blocks = getattr(sys, 'getallocatedblocks', None)
+    if blocks is not None:
+        return blocks, 'blocks', False
+    # The generation 0 counter counts the allocations less the deallocations, and is reset by every collection
+    # started when it exceeds its threshold. The collections since the last reading are deduced from the counters of
+    # the older generations, and the allocations before every reset are added back: the frees of the cyclic garbage
+    # and the resets by the full collections are not counted
+    threshold0, threshold1, threshold2 = gc.get_threshold()
+    get_count = gc.get_count
+    # Total, generation counters at the last reading
+    state = [0] + list(get_count())
+
+    def objects():
+        count0, count1, count2 = get_count()
+        total, last0, last1, last2 = state
+        if count2 == last2 and count1 >= last1:
+            collections = count1 - last1
+        elif count2 > last2:
+            collections = threshold1 + 2 - last1 + (count2 - last2 - 1) * (threshold1 + 2) + count1
+        else:
+            collections = count1 + 1
+        total += count0 - last0 + collections * (threshold0 + 1)
+        state[:] = total, count0, count1, count2
+        return total
+    return objects, 'objects', False
+
+## Return the numbered source lines of a code object, or the timed line numbers when the source is not available
+def _source(code, lines):
+    try:
+        source, first = inspect.getsourcelines(code)
+    except (IOError, TypeError):
+        linecache.checkcache(code.co_filename)
+        return [(number, linecache.getline(code.co_filename, number).rstrip()) for number in sorted(lines)]
+    return [(first + index, text.rstrip()) for index, text in enumerate(source)]
+
+## Return the (owner, attribute name) pair of a dotted function name, importing the longest module prefix
+def _resolve(name):
+    parts = name.split('.')
+    for index in range(len(parts) - 1, 0, -1):
+        module_name = '.'.join(parts[:index])
+        try:
+            __import__(module_name)
+        except ImportError:
+            continue
+        owner = sys.modules[module_name]
+        for part in parts[index:-1]:
+            owner = getattr(owner, part)
+        if not hasattr(owner, parts[-1]):
+            break
+        return owner, parts[-1]
+    raise ValueError("Function %s not found" % name)
@@ -0,0 +1,211 @@
+## @file memory_report.py
+# @package profiler
+# @brief Incremental statistics of the memory samples
+#
+# The memory report is updated by the memory sampler at every sample, so producing the report never scans the
+# samples and the memory used by the statistics does not depend on the duration of the run. The report includes:
+# <ul>
+# <li>the number of samples and the minimum, maximum, mean and last memory usage</li>
+# <li>the slope of the memory usage in Mb per hour, from the least squares fit of all the samples</li>
+# <li>the peak windows: the fixed length time windows with the highest memory usage</li>
+# <li>a downsampled series of the memory usage along the whole run, with a fixed maximum number of points: when the
+# series is full adjacent points are merged, halving the resolution</li>
+# </ul>
+# The report is returned as a dictionary, ready to be serialized as JSON.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.\n
+#
+# Copyright NXP PLMA.  All Rights Reserved.\n
+#
+# Licensed under the Apache License, Version 2.0 (the "License");\n
+# you may not use this file except in compliance with the License.\n
+# You may obtain a copy of the License at\n
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+# either express or implied.  See the License for the specific language
+# governing permissions and limitations under the License.
+#
+# @date March 2016
+# @author Enrico Miglino <enrico.miglino@gmail.com>
+# @version 0.1.5
+# @version documentation version 0.5
+
+import threading, heapq
+from array import array
+
+## Default length of the peak windows, in seconds
+DEFAULT_WINDOW = 60.0
+
+## Default number of peak windows retained
+DEFAULT_PEAKS = 5
+
+## Default maximum number of points of the downsampled series
+DEFAULT_POINTS = 256
+
+##
+# MemoryReport class accumulates the statistics of the memory samples
+#
+# The add() method is meant to be registered as a listener of the memory sampler.
+class MemoryReport:
+
+    ##
+    # Constructor
+    #
+    # @param comment An optional comment stamped in the report
+    # @param window The length of the peak windows, in seconds
+    # @param peaks The number of peak windows retained
+    # @param points The maximum number of points of the downsampled series, an even number
+    def __init__(self, comment = '', window = DEFAULT_WINDOW, peaks = DEFAULT_PEAKS, points = DEFAULT_POINTS):
+        self.comment = comment
+        self.window = window
+        self.peaks = peaks
+        self.points = points
+        self.lock = threading.Lock()
+
+        self.count = 0
+        self.min = None
+        self.max = None
+        self.total = 0.0
+        self.last = None
+        self.first_time = None
+        self.last_time = None
+        # Least squares sums, with the times relative to the first sample
+        self.sum_t = 0.0
+        self.sum_tt = 0.0
+        self.sum_v = 0.0
+        self.sum_tv = 0.0
+
+        # Current peak window and min-heap of the highest closed windows, as (peak, start) pairs
+        self.window_start = None
+        self.window_peak = None
+        self.peak_windows = []
+
+        # Downsampled series: every point covers the same number of samples
+        self.series_time = array('d')
+        self.series_mean = array('d')
+        self.series_max = array('d')
+        self.point_samples = 1
+        self.pending = 0
+        self.pending_time = 0.0
+        self.pending_sum = 0.0
+        self.pending_max = 0.0
+
+    ##
+    # Add a sample
+    #
+    # @param timestamp The time of the sample, in seconds since the epoch
+    # @param value The memory usage, in Mb
+    def add(self, timestamp, value):
+        with self.lock:
+            if self.count == 0:
+                self.first_time = timestamp
+                self.min = self.max = value
+            elif value < self.min:
+                self.min = value
+            elif value > self.max:
+                self.max = value
+            self.count += 1
+            self.total += value
+            self.last = value
+            self.last_time = timestamp
+
+            t = timestamp - self.first_time
+            self.sum_t += t
+            self.sum_tt += t * t
+            self.sum_v += value
+            self.sum_tv += t * value
+
+            self._add_to_window(timestamp, value)
+            self._add_to_series(timestamp, value)
+
+    ## Update the current peak window, closing it when the sample falls after its end
+    def _add_to_window(self, timestamp, value):
+        if self.window_start is None:
+            self.window_start = timestamp
+            self.window_peak = value
+        elif timestamp - self.window_start >= self.window:
+            self._close_window()
+            self.window_start = timestamp
+            self.window_peak = value
+        elif value > self.window_peak:
+            self.window_peak = value
+
+    ## Move the current window to the retained peak windows if it is one of the highest
+    def _close_window(self):
+        entry = (self.window_peak, self.window_start)
+        if len(self.peak_windows) < self.peaks:
+            heapq.heappush(self.peak_windows, entry)
+        elif entry > self.peak_windows[0]:
+            heapq.heapreplace(self.peak_windows, entry)
+
+    ## Accumulate the sample in the pending point of the series, halving the series resolution when it is full
+    def _add_to_series(self, timestamp, value):
+        if self.pending == 0:
+            self.pending_time = timestamp
+            self.pending_max = value
+        elif value > self.pending_max:
+            self.pending_max = value
+        self.pending += 1
+        self.pending_sum += value
+        if self.pending < self.point_samples:
+            return
+
+        self.series_time.append(self.pending_time)
+        self.series_mean.append(self.pending_sum / self.pending)
+        self.series_max.append(self.pending_max)
+        self.pending = 0
+        self.pending_sum = 0.0
+
+        if len(self.series_time) == self.points:
+            self.series_time = self.series_time[::2]
+            self.series_mean = array('d', [(self.series_mean[index] + self.series_mean[index + 1]) / 2
+                                           for index in xrange(0, self.points, 2)])
+            self.series_max = array('d', [max(self.series_max[index], self.series_max[index + 1])
+                                          for index in xrange(0, self.points, 2)])
+            self.point_samples *= 2
+
+    ## Return the slope of the memory usage in Mb per hour, or None with less than two samples
+    def slope(self):
+        n = self.count
+        denominator = n * self.sum_tt - self.sum_t * self.sum_t
+        if n < 2 or denominator <= 0:
+            return None
+        return (n * self.sum_tv - self.sum_t * self.sum_v) / denominator * 3600
+
+    ##
+    # Return the report as a dictionary
+    #
+    # The peak windows are sorted by peak, highest first. The window being filled is included.
+    def to_dict(self):
+        with self.lock:
+            if self.count == 0:
+                return {'comment': self.comment, 'samples': 0}
+            windows = list(self.peak_windows)
+            if self.window_start is not None:
+                windows.append((self.window_peak, self.window_start))
+            windows = heapq.nlargest(self.peaks, windows)
+            series = zip(self.series_time, self.series_mean, self.series_max)
+            if self.pending:
+                series.append((self.pending_time, self.pending_sum / self.pending, self.pending_max))
+            return {
+                'comment': self.comment,
+                'samples': self.count,
+                'start': self.first_time,
+                'end': self.last_time,
+                'min_mb': self.min,
+                'max_mb': self.max,
+                'mean_mb': self.total / self.count,
+                'last_mb': self.last,
+                'slope_mb_per_hour': self.slope(),
+                'peak_windows': [{'start': start, 'end': start + self.window, 'peak_mb': peak}
+                                 for peak, start in windows],
+                'series': {'samples_per_point': self.point_samples,
+                           'time': [point[0] for point in series],
+                           'mean_mb': [point[1] for point in series],
+                           'max_mb': [point[2] for point in series]},
+            }
@@ -0,0 +1,219 @@
+## @file memory_sampler.py
+# @package profiler
+# @brief Background sampler of the process resident memory
+#
+# The memory sampler runs in a daemon thread alongside the profiled program, reading the resident set size (RSS) of
+# the current process at a fixed interval. Samples are stored in a fixed-size ring buffer so a sampling session can
+# last for days with a constant memory footprint: when the buffer is full the oldest samples are overwritten.\n\n
+# On Linux the RSS is read from /proc/self/statm through a file descriptor kept open for the whole session, that is
+# the cheapest source available. On the other platforms the psutil package is used instead (see the package
+# documentation for the installation details).\n\n
+# The sampler measures the time it spends reading and storing the samples, so the overhead of the memory sampling on
+# the profiled program can be checked at any moment with the overhead() method.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.\n
+#
+# Copyright NXP PLMA.  All Rights Reserved.\n
+#
+# Licensed under the Apache License, Version 2.0 (the "License");\n
+# you may not use this file except in compliance with the License.\n
+# You may obtain a copy of the License at\n
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+# either express or implied.  See the License for the specific language
+# governing permissions and limitations under the License.
+#
+# @date March 2016
+# @author Enrico Miglino <enrico.miglino@gmail.com>
+# @version 0.1.5
+# @version documentation version 0.5
+
+import os, threading, time, atexit, weakref
+from array import array
+import sampling_profiler
+
+## Number of bytes in a Mb, the unit of the memory samples
+MEGABYTE = float(1 << 20)
+
+## Default number of samples retained in the ring buffer
+DEFAULT_BUFFER_SIZE = 4096
+
+## The samplers created so far, stopped at exit
+_samplers = weakref.WeakSet()
+
+##
+# Stop all the samplers, at exit
+#
+# The daemon threads may wake up while the interpreter clears the modules: tell them the exit is expected. A single
+# hook is registered for all the samplers, the samplers created after a fork() included.
+def _stop_all():
+    for sampler in list(_samplers):
+        sampler.stop()
+
+atexit.register(_stop_all)
+
+##
+# Reader of the resident set size of the current process
+#
+# The /proc/self/statm file is opened once and read again from the beginning on every sample. If the file is not
+# available the psutil package is used. The reader is bound to the process that created it: after a fork() a new
+# reader should be created in the child process.
+class RssReader:
+
+    ##
+    # Constructor
+    def __init__(self):
+        ## Process id the reader is bound to
+        self.pid = os.getpid()
+        self.fd = None
+        self.process = None
+        try:
+            self.fd = os.open('/proc/self/statm', os.O_RDONLY)
+            self.page_size = os.sysconf('SC_PAGE_SIZE') / MEGABYTE
+        except (OSError, AttributeError, ValueError):
+            self.fd = None
+            import psutil
+            self.process = psutil.Process(self.pid)
+
+    ## Return the current resident set size in Mb
+    def read(self):
+        if self.fd is not None:
+            os.lseek(self.fd, 0, os.SEEK_SET)
+            return int(os.read(self.fd, 64).split()[1]) * self.page_size
+        return self.process.memory_info().rss / MEGABYTE
+
+    ## Release the file descriptor
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+##
+# MemorySampler class samples the process memory in a background daemon thread
+#
+# Samples are written in two parallel ring buffers of doubles, one with the sampling timestamps (seconds since the
+# epoch) and one with the resident memory in Mb. The buffers are allocated once when the sampler is created.
+# Reading the samples never stops nor locks the sampling thread.
+class MemorySampler:
+
+    ##
+    # Constructor
+    #
+    # @param interval The time in seconds between two samples
+    # @param size The number of samples retained in the ring buffer
+    def __init__(self, interval = 1, size = DEFAULT_BUFFER_SIZE):
+        ## Sampling interval in seconds
+        self.interval = interval
+        ## Capacity of the ring buffer
+        self.size = size
+        ## Ring buffer of the sampled memory values, in Mb
+        self.values = array('d', [0.0]) * size
+        ## Ring buffer of the sampling timestamps
+        self.timestamps = array('d', [0.0]) * size
+        ## Total number of samples taken since the sampler was created, the samples kept across stop() included
+        self.count = 0
+        ## Time spent by the sampling thread doing actual work since the last start(), in seconds
+        self.busy = 0.0
+        ## Time when the sampling started
+        self.started = None
+        ## Callables invoked from the sampling thread with (timestamp, value) for every new sample
+        self.listeners = []
+        ## Event set to stop the current sampling thread, None when the sampler is not running
+        self.stop_event = None
+        _samplers.add(self)
+
+    ## Start the sampling thread. Has no effect if the sampler is already running
+    def start(self):
+        if self.stop_event is not None:
+            return
+        self.stop_event = threading.Event()
+        self.started = time.time()
+        self.busy = 0.0
+        thread = threading.Thread(target = self._run, args = (RssReader(), self.stop_event),
+                                  name = 'profiler-memory-sampler')
+        thread.daemon = True
+        thread.start()
+        sampling_profiler.ignore_thread(thread)
+
+    ## Return True if the sampling thread is active
+    def is_running(self):
+        return self.stop_event is not None
+
+    ##
+    # Stop the sampling thread. The samples already collected are kept.
+    #
+    # The thread exits at its next wake up, so the call returns without waiting for the sampling interval.
+    def stop(self):
+        if self.stop_event is not None:
+            self.stop_event.set()
+            self.stop_event = None
+
+    ##
+    # Sampling loop executed by the daemon thread
+    #
+    # The stop event is polled instead of waited on: the timed wait of the Python 2 threading module wakes up
+    # several times per interval, while a plain sleep costs a single wake up per sample.
+    def _run(self, reader, stop_event):
+        read = reader.read
+        values = self.values
+        timestamps = self.timestamps
+        size = self.size
+        listeners = self.listeners
+        clock = time.time
+        sleep = time.sleep
+        interval = self.interval
+
+        try:
+            while not stop_event.is_set():
+                now = clock()
+                value = read()
+                index = self.count % size
+                values[index] = value
+                timestamps[index] = now
+                self.count += 1
+                for listener in listeners:
+                    listener(now, value)
+                self.busy += clock() - now
+                sleep(interval)
+
+            reader.close()
+        except (IOError, OSError, ValueError):
+            # The reader may fail while the interpreter shuts down: the exit is expected once the stop event is set
+            if not stop_event.is_set():
+                raise
+
+    ##
+    # Return the retained samples in chronological order
+    #
+    # @return A pair of arrays (timestamps, values) with the same length
+    def samples(self):
+        count = self.count
+        if count <= self.size:
+            return self.timestamps[:count], self.values[:count]
+        first = count % self.size
+        return (self.timestamps[first:] + self.timestamps[:first],
+                self.values[first:] + self.values[:first])
+
+    ## Return the last sampled value in Mb, or None if no samples have been taken yet
+    def last(self):
+        count = self.count
+        if count == 0:
+            return None
+        return self.values[(count - 1) % self.size]
+
+    ##
+    # Return the fraction of time spent by the sampler doing actual work since it was last started
+    #
+    # At the 10 ms sampling interval the overhead is expected to stay well under 1% (0.01).
+    def overhead(self):
+        if self.started is None:
+            return 0.0
+        elapsed = time.time() - self.started
+        if elapsed <= 0:
+            return 0.0
+        return self.busy / elapsed
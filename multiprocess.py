@@ -0,0 +1,115 @@
+## @file multiprocess.py
+# @package profiler
+# @brief Aggregation of the profiling data of the child processes
+#
+# When the collection of the child processes data is started, the parent process listens on a local Unix socket
+# (created through the multiprocessing.connection module and protected by the process authentication key). The
+# children created by the multiprocessing module, pools included, restart the profiler automatically after the fork,
+# while the children created directly with os.fork() should call the after_fork() method of the profiler.\n\n
+# When a child process exits normally it sends its timing snapshot and its memory samples to the parent and waits
+# for the acknowledgement, so the data of a child are available in the parent as soon as the child has been joined.
+# A child terminated by a signal (e.g. by Pool.terminate()) does not send its data.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.\n
+#
+# Copyright NXP PLMA.  All Rights Reserved.\n
+#
+# Licensed under the Apache License, Version 2.0 (the "License");\n
+# you may not use this file except in compliance with the License.\n
+# You may obtain a copy of the License at\n
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+# either express or implied.  See the License for the specific language
+# governing permissions and limitations under the License.
+#
+# @date March 2016
+# @author Enrico Miglino <enrico.miglino@gmail.com>
+# @version 0.1.5
+# @version documentation version 0.5
+
+import os, threading
+import multiprocessing
+from multiprocessing.connection import Listener, Client
+import sampling_profiler
+
+## Acknowledgement sent by the parent when the data of a child have been stored
+ACK = 'ok'
+
+##
+# Aggregator class receives the profiling data sent by the child processes
+#
+# Every child report is a dictionary with the keys:
+# <ul>
+# <li>\e pid: the process id of the child</li>
+# <li>\e parent: the process id of the parent of the child</li>
+# <li>\e name: the name of the profiler in the child</li>
+# <li>\e stats: the timing snapshot, in the pstats format</li>
+# <li>\e memory: the list of the memory samples in Mb, empty if the memory was not sampled</li>
+# </ul>
+class Aggregator:
+
+    ##
+    # Constructor. The listening socket is created and the receiving thread started
+    def __init__(self):
+        self.listener = Listener(family = 'AF_UNIX', authkey = multiprocessing.current_process().authkey)
+        ## The address the children connect to
+        self.address = self.listener.address
+        ## The received reports, by process id
+        self.reports = {}
+        self.lock = threading.Lock()
+        thread = threading.Thread(target = self._run, name = 'profiler-aggregator')
+        thread.daemon = True
+        thread.start()
+        sampling_profiler.ignore_thread(thread)
+
+    ## Receiving loop executed by the daemon thread, one child connection at a time
+    def _run(self):
+        while True:
+            try:
+                connection = self.listener.accept()
+            except (IOError, OSError, EOFError):
+                # The listener has been closed
+                return
+            except Exception:
+                # Authentication failures and similar errors of a single connection
+                continue
+            try:
+                report = connection.recv()
+                with self.lock:
+                    self.reports[report['pid']] = report
+                connection.send(ACK)
+            except (IOError, OSError, EOFError):
+                pass
+            finally:
+                connection.close()
+
+    ## Return the received reports, sorted by process id
+    def get_reports(self):
+        with self.lock:
+            return [self.reports[pid] for pid in sorted(self.reports)]
+
+    ## Stop receiving the reports. The received reports are kept
+    def close(self):
+        self.listener.close()
+
+##
+# Send a report to the parent process and wait for the acknowledgement
+#
+# @param address The address of the parent aggregator
+# @param name The name of the profiler in the child
+# @param stats The timing snapshot
+# @param memory The memory samples in Mb
+# @return True if the parent acknowledged the report
+def send_report(address, name, stats, memory):
+    connection = Client(address, authkey = multiprocessing.current_process().authkey)
+    try:
+        connection.send({'pid': os.getpid(), 'parent': os.getppid(), 'name': name,
+                         'stats': stats, 'memory': list(memory)})
+        return connection.recv() == ACK
+    finally:
+        connection.close()
@@ -0,0 +1,127 @@
+## @file periodic.py
+# @package profiler
+# @brief Periodic snapshots of a running collector and per-window deltas
+#
+# In a long running service the cumulative statistics hide the changes of behaviour along the time: a regression
+# starting after hours of execution is buried in the totals. The periodic snapshotter reads the collector at a fixed
+# interval, without stopping nor resetting it, and computes the difference with the previous reading. Every
+# difference is a window reporting the calls, the internal time and the cumulative time spent by every function in
+# the interval.\n\n
+# The counters of the previous reading are the only state kept between two windows and only the functions whose
+# counters changed are stored in a window, so an idle interval costs almost nothing. The last windows are retained in
+# memory and can also be streamed to a snapshots file (see the stream_writer module).
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.\n
+#
+# Copyright NXP PLMA.  All Rights Reserved.\n
+#
+# Licensed under the Apache License, Version 2.0 (the "License");\n
+# you may not use this file except in compliance with the License.\n
+# You may obtain a copy of the License at\n
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+# either express or implied.  See the License for the specific language
+# governing permissions and limitations under the License.
+#
+# @date March 2016
+# @author Enrico Miglino <enrico.miglino@gmail.com>
+# @version 0.1.5
+# @version documentation version 0.5
+
+import threading, time
+from collections import deque
+import snapshot, sampling_profiler, stream_writer
+
+## Default number of windows retained in memory
+DEFAULT_WINDOWS = 60
+
+##
+# PeriodicSnapshotter class computes the per-window deltas of a collector in a background daemon thread
+#
+# Every window is a (start time, end time, delta) tuple, where delta is a snapshot in the pstats format with the
+# counters accumulated in the window by the functions called in it.
+class PeriodicSnapshotter:
+
+    ##
+    # Constructor
+    #
+    # @param source The callable returning the current snapshot of the collector
+    # @param interval The length of the windows, in seconds
+    # @param windows The number of windows retained in memory
+    # @param writer The (optional) snapshot writer where every window is streamed
+    def __init__(self, source, interval, windows = DEFAULT_WINDOWS, writer = None):
+        self.source = source
+        self.interval = interval
+        self.writer = writer
+        ## The last windows, oldest first
+        self.windows = deque(maxlen = windows)
+        ## The counters of the previous reading: function -> (primitive calls, calls, internal time, cumulative time)
+        self.previous = {}
+        self.previous_time = None
+        self.lock = threading.Lock()
+        ## Event set to stop the current thread, None when the snapshotter is not running
+        self.stop_event = None
+
+    ##
+    # Start taking the snapshots
+    #
+    # The first reading is taken immediately, so the first window covers the first interval after the call.
+    def start(self):
+        if self.stop_event is not None:
+            return
+        self.stop_event = threading.Event()
+        self.previous = self._counters(self.source())
+        self.previous_time = time.time()
+        thread = threading.Thread(target = self._run, args = (self.stop_event,), name = 'profiler-periodic')
+        thread.daemon = True
+        thread.start()
+        sampling_profiler.ignore_thread(thread)
+
+    ## Stop taking the snapshots. The retained windows are kept
+    def stop(self):
+        if self.stop_event is not None:
+            self.stop_event.set()
+            self.stop_event = None
+
+    ## Return True if the snapshotter thread is active
+    def is_running(self):
+        return self.stop_event is not None
+
+    ## Snapshot loop executed by the daemon thread
+    def _run(self, stop_event):
+        while True:
+            time.sleep(self.interval)
+            if stop_event.is_set():
+                return
+            self.step()
+
+    ##
+    # Take a snapshot and close the current window
+    #
+    # Called by the background thread at every interval, it can also be called directly to close a window on demand.
+    # @return The new window
+    def step(self):
+        with self.lock:
+            current = self.source()
+            now = time.time()
+            delta = snapshot.diff_snapshots(self.previous, current)
+            window = (self.previous_time, now, delta)
+            self.windows.append(window)
+            self.previous = self._counters(current)
+            self.previous_time = now
+        if self.writer is not None:
+            self.writer.write(delta, now, stream_writer.WINDOW)
+        return window
+
+    ## Keep only the counters of a snapshot, dropping the callers
+    def _counters(self, stats):
+        return dict((func, stat[:4]) for func, stat in stats.iteritems())
+
+    ## Return the retained windows, oldest first
+    def get_windows(self):
+        return list(self.windows)
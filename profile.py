@@ -11,20 +11,16 @@
 #	Any of these methods are working only when the Profiler package instance has been called with the enable flag
 #   is_enabled set to True else have no effect.
 #
-#   @note The profile methods integrates the memory profiling package memory_profiler. The memory profiling methods
+#   @note The profile methods integrates a background memory sampler. The memory profiling methods
 #   can be used together or independently by the timing profiling as well. Take in account that the memory usage profiling
 #   consumes its own minimal resources so it is suggested that the better timing profile is reached when the memory
-#   profiling methods are not used.
+#   profiling methods are not used. The sampler measures its own overhead, reported together with the memory usage.
 #
 #   @section extra_memory_profiler Memory profiler extra packages
-#   The profiles packge needs the memory_profiler 0.41 package (documentation is here: https://pypi.python.org/pypi/memory_profiler
-#   To run properly the Profiler package you should install memory_profiler with the following command:
-#   \code
-#   pip install -U memory_profiler
-#   \endcode
-#   Memory profiler sources are available on GitHub: https://github.com/fabianp/memory_profiler
+#   On Linux the memory sampler reads the process memory from /proc/self/statm and needs no extra packages.
 #
-#   To run under the Windows environment, also the psutil module should be installed. Psutil (python system and process
+#   To run under the Windows environment, and any other platform without the /proc filesystem, the psutil module
+#   should be installed. Psutil (python system and process
 #   utilities) is a cross-platform library for retrieving information on running processes and system utilization
 #   (CPU, memory, disks, network) in Python; For more details on how this module works and last sources and documentation
 #   the link is here: https://pypi.python.org/pypi/psutil \n
@@ -35,8 +31,8 @@
 #   Anyway it is strongly suggested to install the psutils package also when working on different platforms.
 #
 #   \note The memory sampling mechanism can be called once. Multiple calls of the memory sampling api has no effect
-#   after the first call. If the mem_used() API is called but the memory sampling has not been initialised the call
-#   has no effect and no output is generated.
+#   after the first call, unless the sampling has been stopped: in this case the sampling is restarted. If the memory_usage() API is called but the memory sampling has not been initialised the
+#   call returns None. Reading the memory usage does not stop the sampling.
 #
 #   @section howto Using the profiler package
 #   To use the profiler package APIs the package should be installed and imported in the application. when the instance of
@@ -54,6 +50,46 @@
 #           ...
 #   \endcode
 #
+#   @section sampling Sampling mode
+#   The deterministic profiler records every function call, and its overhead grows with the number of calls. For
+#   always-on profiling in production the sampling mode captures the stacks of all the threads at a fixed rate, with
+#   an overhead depending on the sampling rate only:
+#   \code
+#   profiler = profile.Profile(True, mode="sampling", hz=100)
+#   \endcode
+#   The same reporting APIs are available in both the modes.
+#
+#   @section filtered Filtered mode
+#   When only some modules of the program are of interest, the filtered mode profiles the functions of those modules
+#   only. The other functions are not hooked at all and run at full speed, so the profiling overhead does not include
+#   the calls to the libraries:
+#   \code
+#   profiler = profile.Profile(True, mode="filtered", include=["mypackage"], exclude=["mypackage.vendor"])
+#   \endcode
+#   The functions are selected among the modules loaded when the profiler is enabled, and put back when it is
+#   disabled, see the filtered_profiler module.
+#
+#   @section triggers Triggered captures
+#   Instead of profiling all the time, the profiler can capture a short high-rate sampling profile of the moment a
+#   region gets slow, the memory grows or the event loop lags, writing it to a dump file:
+#   \code
+#   profiler = profile.Profile(True, filename="service.prof")
+#   profiler.trigger_on_latency(0.5, "request")
+#   profiler.trigger_on_memory(100, 60)
+#   \endcode
+#   The captures are rate limited and the number of dump files is bounded, see the triggers module.
+#
+#   @section async Async mode
+#   In the programs based on an asyncio event loop (the trollius package on Python 2) the async mode charges the time
+#   to the tasks and to their coroutines, separating the time a task runs from the time it is suspended, and measures
+#   the lag of the event loop and the slow callbacks blocking it:
+#   \code
+#   profiler = profile.Profile(True, mode="async")
+#   profiler.enable()
+#   loop.run_until_complete(main())
+#   profiler.stats()
+#   \endcode
+#
 #
 # This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the
 # implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.\n
@@ -77,13 +113,35 @@
 # @version 0.1.5
 # @version documentation version 0.5
 
+## Profile methods without arguments, bound to the shared C-level no-op when the profiling is disabled
+NULL_CALLS = ('disable', 'stop_memory', 'create_stats', 'print_stats', 'dump_stats', 'write_snapshot', 'close',
+              'stop_periodic', 'collect_children', 'after_fork', 'process_stats', 'stats', 'region_stats',
+              'stop_allocations', 'allocation_snapshot', 'attach_thread', 'detach_thread', 'wait_reports',
+              'stop_triggers', 'stop_line_timing')
+
+## Profile methods with arguments, bound to the shared no-op when the profiling is disabled
+NULL_METHODS = ('enable', 'sample_memory', 'memory_usage', 'stream_snapshots', 'start_periodic', 'window_stats',
+                'dump_columnar', 'dump_flamegraph', 'merge_stats', 'profile_module', 'profile_module_calls',
+                'dump_latencies', 'track_allocations', 'allocation_stats', 'allocation_diff', 'thread_stats',
+                'calibrate', 'background_reports', 'stats_index', 'top', 'group_stats', 'trigger_on_latency',
+                'trigger_on_memory', 'trigger_on_lag', 'configure_triggers', 'line_profile', 'line_memory')
+
+## Profile methods bound to the list constructor when the profiling is disabled, always returning an empty list
+EMPTY_LIST_METHODS = ('windows', 'process_reports', 'thread_snapshots', 'trigger_captures')
+
+## All the Profile methods bound to a no-op when the profiling is disabled
+BOUND_METHODS = NULL_CALLS + NULL_METHODS + EMPTY_LIST_METHODS + ('latencies', 'line_stats', 'region', 'profiled',
+                                                                  'line_profiled', 'runcall')
+
 ##
 # Class Profile is the main class managing the profiler framework
 #
 #   The Profiler class should be instantiated in the pythong sources to be profiled. The profiling features are based
 #   on the cProfiler Python native component and can be disabled at a source level. To minimze the impact of the
 #   profiler calls when the features are disabled empty functions are called at import level avoiding many conditional
-#   selections.
+#   selections. Moreover, the methods of a disabled instance are bound directly to shared no-op functions instead of
+#   calling the wrapper method and then the empty method: the methods without arguments are bound to a builtin no-op,
+#   costing about as much as an empty loop iteration (see the benchmark module).
 class Profile:
 
     ##  Profiler class instance, or dummy class depending on the is_enabled flag state
@@ -97,68 +155,608 @@ class Profile:
     #
     # @param is_enabled If set to false, the profiling is inactive
     # @param filename The (optional) name of the profiling results, when needed
-    def __init__(self, is_enabled = True, filename = ""):
+    # @param name The (optional) name identifying the profiler when the data of more profilers are merged
+    # @param mode The timing profiler: "deterministic" (cProfile, default), "sampling" for the low overhead
+    # statistical profiler sampling the stacks of all the threads, "filtered" for the deterministic profiler of the
+    # included modules only or "async" for the profiler of the asyncio tasks
+    # @param hz The sampling rate in samples per second, used in the sampling mode only
+    # @param include The modules and functions profiled in the "filtered" mode: module names, matching their
+    # submodules too, modules, functions or code objects. The functions are selected among the modules loaded when
+    # the profiling is enabled: the modules imported later are profiled from the next enable(). The generator
+    # functions are not profiled
+    # @param exclude The modules and functions not profiled in the "filtered" mode, also when included
+    # @param calibrate If true the profiler overhead is calibrated when the enabled profiler is created: by the
+    # constructor, or by the first set_enabled(True) call of a profiler created disabled. See calibrate()
+    def __init__(self, is_enabled = True, filename = "", name = None, mode = "deterministic", hz = 100,
+                 include = (), exclude = (), calibrate = False):
 
         self.profile_file = filename
+        ## The options of the enabled profiler, created the first time the profiling is enabled
+        self.options = (name, mode, hz, include, exclude, calibrate)
+        ## The enabled profiler, kept while the profiling is disabled by set_enabled()
+        self.enabled_profiler = None
+        ## The control channel server, started by control()
+        self.control_server = None
+        self.set_enabled(is_enabled)
 
+    ##
+    # Enable or disable the profiling of a running program
+    #
+    # When the profiling is disabled the timing collector, the memory sampling and the line timing are stopped and the
+    # methods are bound to the no-ops again, costing as much as in a profiler created disabled. The data collected so
+    # far are kept and the reports include them when the profiling is enabled again. The functions decorated by
+    # profiled() while the profiling was disabled are not timed.
+    #
+    # @param is_enabled If set to false, the profiling is inactive
+    def set_enabled(self, is_enabled):
         if is_enabled:
-            import enabled_profiler
-            self.profiler = enabled_profiler.EnabledProfiler(self.profile_file)
+            if self.enabled_profiler is None:
+                import enabled_profiler
+                self.enabled_profiler = enabled_profiler.EnabledProfiler(self.profile_file, *self.options)
+            self.profiler = self.enabled_profiler
+            # Back to the wrapper methods
+            for method in BOUND_METHODS:
+                self.__dict__.pop(method, None)
         else:
             import disabled_profiler
+            if self.enabled_profiler is not None:
+                if self.enabled_profiler.is_timing:
+                    self.enabled_profiler.disable()
+                self.enabled_profiler.stop_memory()
+                self.enabled_profiler.stop_line_timing()
             self.profiler = disabled_profiler.DisabledProfiler()
+            # Skip the wrapper methods, calling the no-ops directly
+            for method in NULL_CALLS:
+                setattr(self, method, disabled_profiler.null_call)
+            for method in NULL_METHODS:
+                setattr(self, method, disabled_profiler.null_method)
+            for method in EMPTY_LIST_METHODS:
+                setattr(self, method, list)
+            self.latencies = dict
+            self.line_stats = dict
+            self.region = disabled_profiler.null_region
+            self.profiled = disabled_profiler.null_decorator
+            self.line_profiled = disabled_profiler.null_decorator()
+            self.runcall = disabled_profiler.null_runcall
+
+    ## Return True if the profiling is enabled
+    def is_enabled(self):
+        return self.profiler is self.enabled_profiler
+
+    ##
+    # Return the default name of an output file: the profiling results file name with the extension, or a name
+    # after the process id when no file name has been given
+    #
+    # @param extension The extension of the output file, as '.svg'
+    def _output_name(self, extension):
+        import os
+        return (self.profile_file or 'profile.%d' % os.getpid()) + extension
+
+    ##
+    # Start the local control channel, to enable, disable and query the profiler from another process
+    #
+    # The commands are sent to a Unix socket, see the control module. The channel works also when the profiler has
+    # been created disabled. Must be called by the main thread.
+    #
+    # @param address The path of the control socket. If not specified a socket named after the process id is
+    # created in the temporary directory
+    # @param signum The signal used to run the commands in the main thread, None to run them in the control thread
+    # (sampling mode only)
+    # @return The path of the control socket
+    def control(self, address = None, signum = -1):
+        import control
+        if self.control_server is None:
+            self.control_server = control.ControlServer(self, address,
+                                                        control.DEFAULT_SIGNAL if signum == -1 else signum)
+        return self.control_server.address
+
+    ## Stop the control channel
+    def stop_control(self):
+        if self.control_server is not None:
+            self.control_server.close()
+            self.control_server = None
+
+    ##
+    # Start profiling the source
+    #
+    # By default only the calling thread is profiled. With all_threads set every thread started from now on is
+    # profiled too, with its own collector, and the threads already running can join calling attach_thread().
+    # The sampling and the filtered modes always profile all the threads.
+    #
+    # @param all_threads If true the threads started from now on are profiled too
+    def enable(self, all_threads = False):
+        self.profiler.enable(all_threads)
+
+    ##
+    # Start profiling the calling thread
+    #
+    # To be called by the threads started before enable(all_threads=True), as the workers of a thread pool.
+    def attach_thread(self):
+        self.profiler.attach_thread()
+
+    ## Stop profiling the calling thread, keeping its data
+    def detach_thread(self):
+        self.profiler.detach_thread()
+
+    ##
+    # Return the timing data of every thread profiled with enable(all_threads=True)
+    #
+    # The threads exited are merged in a single entry named '<finished threads>'.
+    #
+    # @return A list of (thread name, thread ident, statistics) tuples, the statistics in the pstats format
+    def thread_snapshots(self):
+        return self.profiler.thread_snapshots()
+
+    ##
+    # Generates the per-thread breakdown of the timing data: a table of the threads, or the statistics report of
+    # a single thread. The combined report of all the threads is generated by stats()
+    #
+    # @param name The name of the thread to report. If not specified the table of all the threads is generated
+    def thread_stats(self, name = None):
+        self.profiler.thread_statistics(name)
 
-    ## Start profiling the source
-    def enable(self):
-        self.profiler.enable()
+    ##
+    # Capture a profile when a region runs longer than a threshold
+    #
+    # A capture samples the stacks of all the threads at a high rate for a short time and writes the statistics to
+    # a dump file named after the profiling results file, or after the process id in the temporary directory. The
+    # triggers firing during a capture or its cool down period are ignored, see configure_triggers().
+    #
+    # @param threshold The wall time of the region, in seconds
+    # @param name The name of the region, any region if not specified
+    def trigger_on_latency(self, threshold, name = None):
+        self.profiler.trigger_on_latency(threshold, name)
+
+    ##
+    # Capture a profile when the memory usage grows more than a threshold within a time window
+    #
+    # The memory sampling is started if needed.
+    #
+    # @param growth The memory growth, in Mb
+    # @param window The time window, in seconds
+    # @param interval The memory sampling interval if the memory is not sampled yet, a tenth of the window up to one
+    # second by default
+    def trigger_on_memory(self, growth, window = 60, interval = None):
+        self.profiler.trigger_on_memory(growth, window, interval)
 
     ##
-    # Start sampling memory usage. Sampling frequency is fixed every 1 second
-    def sample_memory(self, comment = ''):
-        self.profiler.memory(1, comment)
+    # Capture a profile when the lag of the event loop exceeds a threshold, in the async mode only
+    #
+    # @param threshold The lag, in seconds
+    def trigger_on_lag(self, threshold):
+        self.profiler.trigger_on_lag(threshold)
+
+    ##
+    # Change the settings of the triggered captures
+    #
+    # @param duration The duration of a capture, in seconds
+    # @param hz The sampling rate of a capture, in samples per second
+    # @param cooldown The time after a capture during which the triggers are ignored, in seconds
+    # @param keep The number of capture dump files kept, the oldest ones are removed
+    def configure_triggers(self, duration = 1.0, hz = 1000, cooldown = 60.0, keep = 10):
+        self.profiler.configure_triggers(duration, hz, cooldown, keep)
+
+    ## Return the completed captures, as dictionaries with the reason, detail, start, end, samples and file keys
+    def trigger_captures(self):
+        return self.profiler.trigger_captures()
+
+    ## Remove all the triggers
+    def stop_triggers(self):
+        self.profiler.stop_triggers()
+
+    ##
+    # Start sampling memory usage in background. The default sampling frequency is every 1 second
+    #
+    # @param comment An optional comment stamped when the memory usage is shown
+    # @param interval The time in seconds between two memory samples
+    def sample_memory(self, comment = '', interval = 1):
+        self.profiler.memory(interval, comment)
+
+    ## Stop sampling memory usage
+    def stop_memory(self):
+        self.profiler.stop_memory()
 
-    ## Stop profiling the source
+    ## Stop profiling the source. The line timing of the decorated functions stops too, until enable() is called
     def disable(self):
         self.profiler.disable()
 
+    ##
+    # Calibrate the overhead of the deterministic profiler on this host
+    #
+    # The profiler hook adds a fixed cost to every call, charged partly to the called function and partly to the
+    # caller, inflating the times of the small functions called very often. Once calibrated, stats() reports the
+    # adjusted times side by side with the raw ones and the flame graphs are exported with the adjusted times. The
+    # calibration takes about a second and is cached per host, so it is measured only once.
+    #
+    # @param force If true the overhead is measured again, also when cached
+    # @return The (callee, caller) overhead per call in seconds, None if not in the deterministic mode or disabled
+    def calibrate(self, force = False):
+        return self.profiler.calibrate(force)
+
     ## Create statistic object internally to the profiled blocks
     def create_stats(self):
         self.profiler.create_stats()
 
-    ## Show the used memory in the requested block
-    def memory_usage(self):
-        self.profiler.mem_used()
+    ##
+    # Return the memory usage statistics collected so far
+    #
+    # The statistics are computed incrementally at every sample: the minimum, maximum, mean and last memory usage,
+    # the growth slope in Mb per hour, the windows with the highest memory usage and a downsampled series of the
+    # whole run, with the sampling overhead.
+    #
+    # @param as_json If true the statistics are returned as a JSON string
+    # @return The statistics dictionary or JSON string, None if the memory is not sampled
+    def memory_usage(self, as_json = False):
+        return self.profiler.mem_used(as_json)
 
     ## Print the statistics to the stdout
     def print_stats(self):
         self.profiler.print_stats()
 
     ##
-    # Dump the statistics to the file fname
+    # Dump the statistics to the profiling results file, or to profile.<pid>.prof if no file name has been given
     #
     # @todo ISSUE: The generated statistic file is not text readable.
     def dump_stats(self):
-        self.profiler.dump_stats(self.profile_file)
+        self.profiler.dump_stats(self.profile_file or self._output_name('.prof'))
+
+    ##
+    # Start streaming binary snapshots of the profiled statistics to a rotating file
+    #
+    # The snapshots are written by a background thread, the profiled program never waits for the disk. The file is
+    # rotated by size and by age, keeping a fixed number of old files.
+    #
+    # @param filename The name of the snapshots file. If not specified, the profiling results file name (profile.<pid>
+    # if not given) is used with the .snapshots extension
+    # @param max_bytes The file is rotated when it grows over this size
+    # @param max_age The file is rotated when it gets older than this number of seconds
+    # @param backups The number of rotated files to keep
+    def stream_snapshots(self, filename = None, max_bytes = 64 << 20, max_age = 24 * 3600, backups = 5):
+        if filename is None:
+            filename = self._output_name('.snapshots')
+        self.profiler.open_snapshots(filename, max_bytes, max_age, backups)
 
-    ## Profile the command parameter
+    ## Append a snapshot of the statistics collected so far to the snapshots file, without stopping the profiler
+    def write_snapshot(self):
+        self.profiler.write_snapshot()
+
+    ## Close the output files of the profiler
+    def close(self):
+        self.profiler.close()
+
+    ##
+    # Start reporting the profiled statistics per time window, without stopping nor resetting the profiler
+    #
+    # Every interval a snapshot of the profiler is taken and compared with the previous one: the differences of the
+    # calls, internal time and cumulative time of the functions are retained as a window. When the snapshots are
+    # streamed (see stream_snapshots()) every window is also written to the snapshots file, as a window record read
+    # back by stream_writer.read_windows().
+    #
+    # @param interval The length of the windows, in seconds
+    # @param windows The number of windows retained in memory
+    def start_periodic(self, interval, windows = 60):
+        self.profiler.start_periodic(interval, windows)
+
+    ## Stop reporting the profiled statistics per time window
+    def stop_periodic(self):
+        self.profiler.stop_periodic()
+
+    ## Return the list of the retained windows, as (start time, end time, statistics) tuples, oldest first
+    def windows(self):
+        return self.profiler.windows()
+
+    ##
+    # Generates a report with the profiled statistics of a single window
+    #
+    # @param index The index of the window, the last one by default
+    def window_stats(self, index = -1):
+        self.profiler.window_statistics(index)
+
+    ##
+    # Dump the statistics collected so far to the file fname in the compact columnar format
+    #
+    # The profiler is not stopped. Many columnar files and dumps can be merged with the columnar module tool:
+    # \code
+    # python columnar.py merge merged.prfc worker1.prfc worker2.prfc ...
+    # \endcode
+    #
+    # @param fname The name of the columnar file. If not specified, the profiling results file name (profile.<pid> if
+    # not given) is used with the .prfc extension
+    def dump_columnar(self, fname = None):
+        if fname is None:
+            fname = self._output_name('.prfc')
+        self.profiler.dump_columnar(fname)
+
+    ##
+    # Export the timing data collected so far as a flame graph
+    #
+    # The profiler is not stopped. The flame graph is a self-contained SVG image, or an HTML page, showing the time
+    # of every stack of the program. Any other file extension exports the collapsed stacks, one line per stack, for
+    # the external flame graph tools. Profile dumps and columnar files can be exported as well:
+    # \code
+    # python flamegraph.py profile.prof profile.svg
+    # \endcode
+    #
+    # @param fname The name of the output file. If not specified, the profiling results file name (profile.<pid> if
+    # not given) is used with the .svg extension
+    # @param threshold The fraction of the total time under which the stacks are pruned, deterministic modes only
+    def dump_flamegraph(self, fname = None, threshold = 0.001):
+        if fname is None:
+            fname = self._output_name('.svg')
+        self.profiler.dump_flamegraph(fname, threshold)
+
+    ##
+    # Start collecting the profiling data of the child processes
+    #
+    # The children created by the multiprocessing module (pools included) restart the profiler automatically and
+    # send their timing and memory data to this process when they exit. Children created directly with os.fork()
+    # should call after_fork() first.
+    def collect_children(self):
+        self.profiler.collect_children()
+
+    ##
+    # Restart the profiler in a child process created with os.fork(). It can also be used as a pool initializer
+    def after_fork(self):
+        self.profiler.after_fork()
+
+    ##
+    # Generates a report with the per-process breakdown of the child processes and the merged statistics of all the
+    # processes
+    def process_stats(self):
+        self.profiler.process_statistics()
+
+    ## Return the list of the data received from the child processes
+    def process_reports(self):
+        return self.profiler.process_reports()
+
+    ##
+    # Return a context manager timing a named region of code
+    #
+    # The number of executions, the wall time and the CPU time of the region are accumulated with a very low
+    # overhead. In a deep region the full timing profiler is also enabled while the region is executed:
+    # \code
+    # with profiler.region("request"):
+    #     ...
+    # \endcode
+    #
+    # @param name The name of the region
+    # @param deep If true the timing profiler is enabled inside the region
+    def region(self, name, deep = False):
+        return self.profiler.region(name, deep)
+
+    ##
+    # Return a decorator timing every call of the decorated function as a named region
+    # \code
+    # @profiler.profiled("handler")
+    # def handler(request):
+    #     ...
+    # \endcode
+    # When the profiling is disabled the function is returned unchanged.
+    #
+    # @param name The name of the region, the function name if not specified
+    # @param deep If true the timing profiler is enabled inside the function
+    def profiled(self, name = None, deep = False):
+        return self.profiler.profiled(name, deep)
+
+    ##
+    # Return a decorator timing the decorated function line by line
+    # \code
+    # @profiler.line_profiled
+    # def hot_function(data):
+    #     ...
+    # \endcode
+    # The hits and the time of every line are reported by stats() and profile_module(), after the function
+    # statistics. Only the selected functions are traced, the other functions run at full speed. When the profiling
+    # is disabled the function is returned unchanged.
+    def line_profiled(self, func):
+        return self.profiler.line_profiled(func)
+
+    ##
+    # Select functions for the line timing by name
+    #
+    # @param names The list of the dotted names of the functions, as 'package.module.function' or
+    # 'module.Class.method'
+    def line_profile(self, names):
+        self.profiler.line_profile(names)
+
+    ##
+    # Stop the line timing, putting back the functions selected by name. The collected timings are kept
+    #
+    # The decorated functions are timed again when the profiling is enabled again by enable().
+    def stop_line_timing(self):
+        self.profiler.stop_line_timing()
+
+    ##
+    # Measure the memory increment of every line of the functions selected for the line timing
+    #
+    # The increments are shown next to the line timings by stats() and profile_module(). They are measured with an
+    # allocation counter read at every line, much cheaper than reading the process memory: the bytes traced by
+    # tracemalloc when available, else the memory blocks allocated by the interpreter (Python 3.4+) or, in the plain
+    # Python 2.7, the objects tracked by the garbage collector. The objects are counted whatever their size, so the
+    # reports label these increments as objects rather than memory.
+    #
+    # @param enabled If false the memory increments are not measured anymore
+    def line_memory(self, enabled = True):
+        self.profiler.line_memory(enabled)
+
+    ##
+    # Return the line timings collected so far
+    #
+    # @return A dictionary mapping the (file name, line number, function name) labels of the functions to
+    # dictionaries mapping the line numbers to (hits, time in seconds, memory increment) tuples. In the plain Python
+    # 2.7 the increment is a number of objects, not a size, see line_memory()
+    def line_stats(self):
+        return self.profiler.line_stats()
+
+    ## Generates a report with the timings and the latency percentiles of the named regions
+    def region_stats(self):
+        self.profiler.region_statistics()
+
+    ##
+    # Return the latency percentiles of the named regions and of the profiled functions
+    #
+    # @return A dictionary mapping the region names to their number of calls, total CPU time and minimum, mean, 50th,
+    # 90th, 95th, 99th percentiles and maximum wall time, in seconds
+    def latencies(self):
+        return self.profiler.latencies()
+
+    ##
+    # Write the latency percentiles of the named regions and of the profiled functions to the file fname, as JSON
+    #
+    # @param fname The name of the file. If not specified, the profiling results file name (profile.<pid> if not
+    # given) is used with the .json extension
+    def dump_latencies(self, fname = None):
+        if fname is None:
+            fname = self._output_name('.json')
+        self.profiler.dump_latencies(fname)
+
+    ##
+    # Start tracking the memory allocation sites
+    #
+    # The allocations are traced by the tracemalloc module when available, else the objects tracked by the garbage
+    # collector are counted by type when a snapshot is taken: the types have no allocation site, and are not linked
+    # to the functions in the reports.
+    #
+    # @param frames The number of frames recorded for every allocation
+    def track_allocations(self, frames = 1):
+        self.profiler.track_allocations(frames)
+
+    ## Stop tracking the memory allocation sites
+    def stop_allocations(self):
+        self.profiler.stop_allocations()
+
+    ## Take a snapshot of the live allocations, used as baseline by allocation_diff(), and return its index
+    def allocation_snapshot(self):
+        return self.profiler.allocation_snapshot()
+
+    ##
+    # Generates a report with the top allocation sites by size or by number of blocks. Every site is shown with the
+    # timing statistics of the function containing it
+    #
+    # @param limit The number of sites reported
+    # @param key 'size' or 'count'
+    def allocation_stats(self, limit = 10, key = 'size'):
+        self.profiler.allocation_statistics(limit, key)
+
+    ##
+    # Generates a report with the allocation sites grown since a previous snapshot, to find the memory leaks. Every
+    # site is shown with the timing statistics of the function containing it
+    #
+    # @param limit The number of sites reported
+    # @param key 'size' or 'count'
+    # @param baseline The index of the snapshot to compare with, the first one by default
+    def allocation_diff(self, limit = 10, key = 'size', baseline = 0):
+        self.profiler.allocation_diff(limit, key, baseline)
+
+    ## Profile the command parameter, executed in the __main__ module environment
     def run(self, command):
         self.profiler.run(command)
 
     ## Profile the command via exec() specifying the global and local environmnet
-    def run(self, command, globals, locals):
-        self.profiler.run(command, globals, locals)
+    def runctx(self, command, globals, locals):
+        self.profiler.runctx(command, globals, locals)
 
-    ## Profile the specified function with arguments
-    def runcall(self, func, args, kwargs):
-        self.profiler.runcall(func, args, kwargs)
+    ##
+    # Profile the specified function with arguments and return its result
+    #
+    # The profiler is enabled during the call only, unless it was already enabled, also when the function raises an
+    # exception.
+    def runcall(self, func, *args, **kwargs):
+        return self.profiler.runcall(func, *args, **kwargs)
+
+    ##
+    # Call the specified function repeatedly with the same arguments, and return the latency percentiles
+    #
+    # The calls are timed without the profiler overhead and are not added to the statistics of the session, unless
+    # profile is set: then they are profiled as runcall() does, and the latencies include the profiler overhead.
+    #
+    # @param func The function to call
+    # @param number The number of calls
+    # @param args The positional arguments of the function
+    # @param kwargs The keyword arguments of the function
+    # @param profile If true the calls are added to the statistics of the session
+    # @return A dictionary with the number of calls and the minimum, mean, 50th, 90th, 95th, 99th percentiles and
+    # maximum latency of the calls, in seconds. None when the profiling is disabled
+    def runcall_many(self, func, number, args = (), kwargs = None, profile = False):
+        return self.profiler.runcall_many(func, number, args, kwargs, profile)
 
     ## Generates a report with the profiled statistics
-    # (Shows the global collected statistics)
+    # (Shows the global collected statistics, followed by the latency percentiles of the named regions and of the
+    # profiled functions)
     def stats(self):
         self.profiler.statistics()
 
+    ##
+    # Generate the reports in a background thread from now on, or in the calling thread again
+    #
+    # Building a report strips and sorts the whole function table, stalling the calling thread for a long time when
+    # the table is large. With the background reports stats(), profile_module() and profile_module_calls() only stop
+    # the profiler and take a frozen copy of its data: the report is generated and written by a background thread,
+    # which keeps the stripped names and the sort orders between the reports and updates only the changed functions.
+    #
+    # @param enabled If false the reports queued so far are written and the reports are generated by the calling
+    # thread again
+    def background_reports(self, enabled = True):
+        self.profiler.background_reports(enabled)
+
+    ## Wait until the reports generated in background so far have been written
+    def wait_reports(self):
+        self.profiler.wait_reports()
+
+    ##
+    # Return an index of the timing data collected so far, answering the queries without printing any report
+    #
+    # The profiler is not stopped. See the query module for the queries.
+    #
+    # @param max_age The last index is returned if built less than max_age seconds ago, else a new one is built
+    # @return The query.StatsIndex instance, None when the profiling is disabled
+    def stats_index(self, max_age = 0):
+        return self.profiler.stats_index(max_age)
+
+    ##
+    # Return the functions with the highest value of a metric, without sorting the whole function table
+    # \code
+    # for function in profiler.top('cumtime', 5, module="mypackage"):
+    #     print function['function'], function['cumtime']
+    # \endcode
+    #
+    # @param metric 'tottime', 'cumtime', 'calls', 'primitive', 'percall' or 'cumpercall'
+    # @param k The number of functions returned
+    # @param module A module name, matching the module and its submodules
+    # @param function A function name pattern, as 'get_*'
+    # @param filename A file name pattern, as '*/handlers/*.py'
+    # @param max_age The maximum age in seconds of the index queried: the programs polling the profiler can share
+    # the same index among many queries
+    # @return A list of dictionaries with the function, file, line, module, calls, primitive calls, tottime and
+    # cumtime of the functions, the highest value first. None when the profiling is disabled
+    def top(self, metric = 'tottime', k = 10, module = None, function = None, filename = None, max_age = 1.0):
+        return self.profiler.top_functions(metric, k, module, function, filename, max_age)
+
+    ##
+    # Return the totals of the functions grouped by file, module or top level package
+    #
+    # @param by 'file', 'module' or 'package'
+    # @param metric 'tottime', 'calls', 'primitive' or 'functions', the groups are sorted by
+    # @param k The number of groups returned, all the groups if None
+    # @param module A module name restricting the functions grouped
+    # @param max_age The maximum age in seconds of the index queried
+    # @return A list of dictionaries with the group name, the number of functions, calls, primitive calls and
+    # tottime, the highest value first. None when the profiling is disabled
+    def group_stats(self, by = 'module', metric = 'tottime', k = None, module = None, max_age = 1.0):
+        return self.profiler.group_statistics(by, metric, k, module, max_age)
+
+    ##
+    # Generates a report merging the statistics of more profilers instances, without stopping them
+    #
+    # @param names The names of the profilers to merge. If not specified all the enabled profilers are merged
+    def merge_stats(self, names = None):
+        self.profiler.merged_statistics(names)
+
     ##
     # Generates a report with the profiled statistics for the specific module
+    #
+    # The report is followed by the line timings, and the memory increments, of the functions of the module selected
+    # for the line timing.
     def profile_module(self, module = None):
         self.profiler.module_stats(module)
 
@@ -0,0 +1,198 @@
+## @file query.py
+# @package profiler
+# @brief Query API over the collected timing statistics: top functions, filters and groups
+#
+# The printed reports sort and format the whole function table. The stats index is built once from a snapshot of
+# the statistics and answers the queries of the programs polling the profiler, as the dashboards, without any
+# report:
+# <ul>
+# <li>top(): the functions with the highest value of a metric, selected with a heap in a time linear in the number
+# of functions instead of sorting them all</li>
+# <li>select(): the functions of a module, file or function name</li>
+# <li>groups(): the totals by file, module or top level package</li>
+# </ul>
+# The module of every function is found from its file name among the loaded modules, the functions of the files not
+# loaded as modules are in the module named after the file. The builtin functions are in the module "<builtin>".
+# The results are lists of dictionaries, ready to be converted to JSON.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.\n
+#
+# Copyright NXP PLMA.  All Rights Reserved.\n
+#
+# Licensed under the Apache License, Version 2.0 (the "License");\n
+# you may not use this file except in compliance with the License.\n
+# You may obtain a copy of the License at\n
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+# either express or implied.  See the License for the specific language
+# governing permissions and limitations under the License.
+#
+# @date March 2016
+# @author Enrico Miglino <enrico.miglino@gmail.com>
+# @version 0.1.5
+# @version documentation version 0.5
+
+import sys, os, time, heapq, fnmatch
+
+## Module of the builtin functions
+BUILTIN_MODULE = '<builtin>'
+
+## The metrics of the functions: metric name -> function of the (primitive calls, calls, tottime, cumtime) values
+METRICS = {
+    'calls': lambda cc, nc, tt, ct: nc,
+    'primitive': lambda cc, nc, tt, ct: cc,
+    'tottime': lambda cc, nc, tt, ct: tt,
+    'cumtime': lambda cc, nc, tt, ct: ct,
+    'percall': lambda cc, nc, tt, ct: tt / nc if nc else 0.0,
+    'cumpercall': lambda cc, nc, tt, ct: ct / cc if cc else 0.0,
+}
+
+## The metrics of the groups
+GROUP_METRICS = ('functions', 'calls', 'primitive', 'tottime')
+
+## The keys the functions can be grouped by
+GROUP_KEYS = ('file', 'module', 'package')
+
+## Return a table mapping the file names without extension of the loaded modules to the module names
+def module_files():
+    files = {}
+    for name, module in sys.modules.items():
+        filename = getattr(module, '__file__', None)
+        if filename:
+            files[os.path.splitext(os.path.abspath(filename))[0]] = name
+    return files
+
+##
+# StatsIndex class indexes a snapshot of the statistics for the queries
+class StatsIndex:
+
+    ##
+    # Constructor, building the index
+    #
+    # @param stats The statistics in the pstats format. They are not modified nor retained
+    def __init__(self, stats):
+        ## The time the index was built
+        self.created = time.time()
+        files = module_files()
+        modules = {}
+        ## The rows of the functions: (filename, line, function, module, primitive calls, calls, tottime, cumtime)
+        self.rows = []
+        ## The indices of the rows by module
+        self.by_module = {}
+        for (filename, line, name), stat in stats.iteritems():
+            module = modules.get(filename)
+            if module is None:
+                if filename == '~':
+                    module = BUILTIN_MODULE
+                else:
+                    base = os.path.splitext(os.path.abspath(filename))[0]
+                    module = files.get(base) or os.path.basename(base)
+                modules[filename] = module
+            self.by_module.setdefault(module, []).append(len(self.rows))
+            self.rows.append((filename, line, name, module) + tuple(stat[:4]))
+
+    ## Return the number of functions indexed
+    def __len__(self):
+        return len(self.rows)
+
+    ## Return the names of the modules indexed
+    def modules(self):
+        return sorted(self.by_module)
+
+    ##
+    # Return the rows matching the filters, scanning only the modules selected by the module filter
+    #
+    # @param module A module name, matching the module and its submodules
+    # @param function A function name pattern, as 'get_*'
+    # @param filename A file name pattern, matched with the full file name, as '*/handlers/*.py'
+    def _rows(self, module = None, function = None, filename = None):
+        if module is None:
+            rows = self.rows
+        else:
+            prefix = module + '.'
+            rows = [self.rows[index]
+                    for name, indices in self.by_module.iteritems() if name == module or name.startswith(prefix)
+                    for index in indices]
+        if function is not None:
+            rows = [row for row in rows if fnmatch.fnmatchcase(row[2], function)]
+        if filename is not None:
+            rows = [row for row in rows if fnmatch.fnmatchcase(row[0], filename)]
+        return rows
+
+    ##
+    # Return the functions with the highest value of a metric
+    #
+    # @param metric One of the METRICS: 'tottime', 'cumtime', 'calls', 'primitive', 'percall' or 'cumpercall'
+    # @param k The number of functions returned, all the functions if None
+    # @param module A module name, matching the module and its submodules
+    # @param function A function name pattern
+    # @param filename A file name pattern
+    # @return A list of dictionaries, one per function, with the highest value first
+    def top(self, metric = 'tottime', k = 10, module = None, function = None, filename = None):
+        value = METRICS.get(metric)
+        if value is None:
+            raise ValueError("Unknown metric %r" % (metric,))
+        key = lambda row: value(row[4], row[5], row[6], row[7])
+        rows = self._rows(module, function, filename)
+        if k is None:
+            rows = sorted(rows, key = key, reverse = True)
+        else:
+            rows = heapq.nlargest(k, rows, key = key)
+        return [_function(row) for row in rows]
+
+    ##
+    # Return the functions matching the filters, in no particular order
+    #
+    # @param module A module name, matching the module and its submodules
+    # @param function A function name pattern
+    # @param filename A file name pattern
+    # @return A list of dictionaries, one per function
+    def select(self, module = None, function = None, filename = None):
+        return [_function(row) for row in self._rows(module, function, filename)]
+
+    ##
+    # Return the totals of the functions grouped by file, module or top level package
+    #
+    # The cumulative times are not summed, as the time of the functions calling each other would be counted more
+    # than once.
+    #
+    # @param by One of the GROUP_KEYS: 'file', 'module' or 'package'
+    # @param metric The group metric the groups are sorted by, one of the GROUP_METRICS
+    # @param k The number of groups returned, all the groups if None
+    # @param module A module name restricting the functions grouped
+    # @return A list of dictionaries, one per group, with the highest value first
+    def groups(self, by = 'module', metric = 'tottime', k = None, module = None):
+        if by not in GROUP_KEYS:
+            raise ValueError("Unknown group key %r" % (by,))
+        if metric not in GROUP_METRICS:
+            raise ValueError("Unknown group metric %r" % (metric,))
+        totals = {}
+        for row in self._rows(module):
+            if by == 'file':
+                name = row[0]
+            elif by == 'module':
+                name = row[3]
+            else:
+                name = row[3].split('.', 1)[0]
+            group = totals.get(name)
+            if group is None:
+                group = totals[name] = {by: name, 'functions': 0, 'calls': 0, 'primitive': 0, 'tottime': 0.0}
+            group['functions'] += 1
+            group['calls'] += row[5]
+            group['primitive'] += row[4]
+            group['tottime'] += row[6]
+        key = lambda group: group[metric]
+        if k is None:
+            return sorted(totals.itervalues(), key = key, reverse = True)
+        return heapq.nlargest(k, totals.itervalues(), key = key)
+
+## Return the dictionary of a function row
+def _function(row):
+    filename, line, name, module, cc, nc, tt, ct = row
+    return {'function': name, 'file': filename, 'line': line, 'module': module, 'calls': nc, 'primitive': cc,
+            'tottime': tt, 'cumtime': ct}
@@ -0,0 +1,217 @@
+## @file regions.py
+# @package profiler
+# @brief Low overhead timers of named code regions
+#
+# A region is a named block of code, delimited with a with statement or by a function decorated as profiled. For
+# every region the number of executions, the total and maximum wall time and the total CPU time are accumulated in a
+# table of preallocated arrays, indexed by a slot assigned to the region name when the region is first used. The cost
+# of a region is a couple of clock readings and the update of the table, so regions can be left always active in the
+# hot paths of a program.\n\n
+# A region can also be deep: in this case the full timing collector of the profiler is enabled while the region is
+# executed, to get the detailed profile of that code only.\n\n
+# The CPU time is the time of the whole process as returned by time.clock() on Unix systems, so it includes the time
+# spent by the other threads while the region is executed.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.\n
+#
+# Copyright NXP PLMA.  All Rights Reserved.\n
+#
+# Licensed under the Apache License, Version 2.0 (the "License");\n
+# you may not use this file except in compliance with the License.\n
+# You may obtain a copy of the License at\n
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+# either express or implied.  See the License for the specific language
+# governing permissions and limitations under the License.
+#
+# @date March 2016
+# @author Enrico Miglino <enrico.miglino@gmail.com>
+# @version 0.1.5
+# @version documentation version 0.5
+
+import sys, os, time, threading, functools
+from array import array
+import histogram
+
+## Default number of region slots preallocated
+DEFAULT_CAPACITY = 256
+
+## Wall clock
+wall_clock = time.time
+
+##
+# Process CPU clock. On Windows time.clock() is a wall clock, the process times are used instead
+if sys.platform == 'win32':
+    def cpu_clock():
+        times = os.times()
+        return times[0] + times[1]
+else:
+    cpu_clock = time.clock
+
+##
+# RegionTable class accumulates the timings of the named regions
+#
+# The counters are kept in parallel arrays indexed by the region slot. The arrays are preallocated for the expected
+# number of regions and doubled when more regions are used. The wall time of every execution is also recorded in a
+# latency histogram of the region, for the percentiles.
+class RegionTable:
+
+    ##
+    # Constructor
+    #
+    # @param capacity The number of region slots to preallocate
+    def __init__(self, capacity = DEFAULT_CAPACITY):
+        self.capacity = capacity
+        ## The region names, by slot
+        self.names = []
+        ## Region name -> slot
+        self.slots = {}
+        ## Number of executions of the regions
+        self.calls = array('d', [0.0]) * capacity
+        ## Total wall time of the regions, in seconds
+        self.wall = array('d', [0.0]) * capacity
+        ## Maximum wall time of a single execution of the regions, in seconds
+        self.wall_max = array('d', [0.0]) * capacity
+        ## Total CPU time of the regions, in seconds
+        self.cpu = array('d', [0.0]) * capacity
+        ## The wall time latency histograms of the regions, by slot
+        self.histograms = []
+        ## Callables invoked with (slot, wall time, cpu time) at every region execution
+        self.listeners = []
+        self.lock = threading.Lock()
+
+    ## Return the slot of a region name, assigning a new slot to an unknown name
+    def slot(self, name):
+        slot = self.slots.get(name)
+        if slot is None:
+            with self.lock:
+                slot = self.slots.get(name)
+                if slot is None:
+                    slot = len(self.names)
+                    if slot == self.capacity:
+                        for column in (self.calls, self.wall, self.wall_max, self.cpu):
+                            column.extend(array('d', [0.0]) * self.capacity)
+                        self.capacity *= 2
+                    self.histograms.append(histogram.LatencyHistogram())
+                    self.names.append(name)
+                    self.slots[name] = slot
+        return slot
+
+    ##
+    # Accumulate an execution of a region
+    #
+    # @param slot The slot of the region
+    # @param wall The wall time of the execution, in seconds
+    # @param cpu The CPU time of the execution, in seconds
+    def record(self, slot, wall, cpu):
+        with self.lock:
+            self.calls[slot] += 1
+            self.wall[slot] += wall
+            self.cpu[slot] += cpu
+            if wall > self.wall_max[slot]:
+                self.wall_max[slot] = wall
+            self.histograms[slot].record(wall)
+        for listener in self.listeners:
+            listener(slot, wall, cpu)
+
+    ## Return the list of (name, calls, total wall time, maximum wall time, total CPU time) tuples of the regions
+    def rows(self):
+        with self.lock:
+            return [(name, int(self.calls[slot]), self.wall[slot], self.wall_max[slot], self.cpu[slot])
+                    for slot, name in enumerate(self.names)]
+
+    ##
+    # Return the latency summaries of the regions
+    #
+    # @return A dictionary mapping the region names to the summaries of their latency histograms, see the histogram
+    # module. The total CPU time of the region is added to every summary
+    def latencies(self):
+        with self.lock:
+            summaries = {}
+            for slot, name in enumerate(self.names):
+                summary = self.histograms[slot].summary()
+                summary['cpu'] = self.cpu[slot]
+                summaries[name] = summary
+            return summaries
+
+    ##
+    # Print the table of the regions, sorted by total wall time, with the latency percentiles
+    #
+    # @param stream The output stream
+    def print_table(self, stream):
+        rows = sorted(self.rows(), key = lambda row: row[2], reverse = True)
+        print >> stream, "%-40s %10s %12s %10s %10s %10s %10s %10s %12s" % (
+            "Region", "Calls", "Wall (s)", "Mean (ms)", "p50 (ms)", "p95 (ms)", "p99 (ms)", "Max (ms)", "CPU (s)")
+        for name, calls, wall, wall_max, cpu in rows:
+            mean = wall / calls * 1000 if calls else 0.0
+            p50, p95, p99 = self.histograms[self.slots[name]].percentiles((50, 95, 99))
+            print >> stream, "%-40s %10d %12.6f %10.3f %10.3f %10.3f %10.3f %10.3f %12.6f" % (
+                name, calls, wall, mean, p50 * 1000, p95 * 1000, p99 * 1000, wall_max * 1000, cpu)
+        print >> stream
+
+##
+# Region class is the context manager timing a single execution of a region
+class Region:
+
+    ##
+    # Constructor
+    #
+    # @param table The region table
+    # @param slot The slot of the region
+    # @param profiler The profiler to enable during the region execution, None for a normal region
+    def __init__(self, table, slot, profiler = None):
+        self.table = table
+        self.slot = slot
+        self.profiler = profiler
+        self.deep = False
+
+    def __enter__(self):
+        profiler = self.profiler
+        if profiler is not None and not profiler.is_timing:
+            profiler.enable()
+            self.deep = True
+        self.cpu = cpu_clock()
+        self.wall = wall_clock()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        wall = wall_clock() - self.wall
+        cpu = cpu_clock() - self.cpu
+        if self.deep:
+            self.profiler.disable()
+        self.table.record(self.slot, wall, cpu)
+        return False
+
+##
+# Return a decorator timing every call of the decorated function as a region
+#
+# @param table The region table
+# @param name The name of the region, the function name if not specified
+# @param profiler The profiler to enable during the function execution, None for a normal region
+def profiled(table, name = None, profiler = None):
+    def decorator(func):
+        slot = table.slot(name or func.__name__)
+        if profiler is not None:
+            @functools.wraps(func)
+            def deep_wrapper(*args, **kwargs):
+                with Region(table, slot, profiler):
+                    return func(*args, **kwargs)
+            return deep_wrapper
+
+        record = table.record
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            cpu = cpu_clock()
+            wall = wall_clock()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record(slot, wall_clock() - wall, cpu_clock() - cpu)
+        return wrapper
+    return decorator
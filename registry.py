@@ -0,0 +1,91 @@
+## @file registry.py
+# @package profiler
+# @brief Process wide registry of the enabled profilers
+#
+# Every enabled profiler owns its collector and registers itself here with a unique name. The registry keeps weak
+# references only, so a profiler is removed as soon as it is not used anymore by the application.\n\n
+# The registry merges the data collected by any set of registered profilers on demand, without stopping nor resetting
+# them: this way several subsystems of the same process can be profiled independently and reported together.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.\n
+#
+# Copyright NXP PLMA.  All Rights Reserved.\n
+#
+# Licensed under the Apache License, Version 2.0 (the "License");\n
+# you may not use this file except in compliance with the License.\n
+# You may obtain a copy of the License at\n
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+# either express or implied.  See the License for the specific language
+# governing permissions and limitations under the License.
+#
+# @date March 2016
+# @author Enrico Miglino <enrico.miglino@gmail.com>
+# @version 0.1.5
+# @version documentation version 0.5
+
+import threading, weakref
+import snapshot
+
+##
+# ProfilerRegistry class tracks the enabled profilers by name
+class ProfilerRegistry:
+
+    ##
+    # Constructor
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.profilers = weakref.WeakValueDictionary()
+        self.counter = 0
+
+    ##
+    # Register a profiler
+    #
+    # @param profiler The profiler to register. It should expose the snapshot() method
+    # @param name The name of the profiler. If not specified, or already used, a unique name is generated
+    # @return The name the profiler has been registered with
+    def register(self, profiler, name = None):
+        with self.lock:
+            self.counter += 1
+            if name is None:
+                name = 'profiler-%d' % self.counter
+            elif name in self.profilers:
+                name = '%s-%d' % (name, self.counter)
+            self.profilers[name] = profiler
+        return name
+
+    ## Remove the profiler registered with the name
+    def unregister(self, name):
+        with self.lock:
+            self.profilers.pop(name, None)
+
+    ## Return the sorted list of the registered names
+    def names(self):
+        with self.lock:
+            return sorted(self.profilers.keys())
+
+    ## Return the profiler registered with the name, or None if not found
+    def get(self, name):
+        return self.profilers.get(name)
+
+    ##
+    # Merge the current data of the registered profilers in a new snapshot
+    #
+    # The profilers keep running while their data are read.
+    #
+    # @param names The names of the profilers to merge. If not specified all the registered profilers are merged
+    def merge(self, names = None):
+        with self.lock:
+            if names is None:
+                profilers = self.profilers.values()
+            else:
+                profilers = [self.profilers[name] for name in names if name in self.profilers]
+        return snapshot.merge_snapshots([profiler.snapshot() for profiler in profilers])
+
+## The registry shared by all the profilers in the process
+registry = ProfilerRegistry()
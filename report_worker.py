@@ -0,0 +1,283 @@
+## @file report_worker.py
+# @package profiler
+# @brief Background rendering of the statistics reports, with stripped names and sort orders cached between reports
+#
+# Building a pstats report strips the directories from all the function names and sorts the whole function table
+# every time, on the thread asking for the report. With the report worker the calling thread only freezes the
+# collector data, as the cProfile entries or the snapshot of the other collectors, and queues the report: the worker
+# thread converts the data, updates the report cache and writes the report.\n\n
+# The report cache keeps the stripped statistics and one sorted order per sort keys between the reports. When a new
+# snapshot arrives only the functions whose counters changed are stripped again and moved in the sorted orders by
+# bisection, so a repeated report costs a scan of the function table plus the work on the changed functions. When
+# most of the functions changed the orders are sorted again from scratch.\n\n
+# The reports are written in the order they are queued, by a single daemon thread.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.\n
+#
+# Copyright NXP PLMA.  All Rights Reserved.\n
+#
+# Licensed under the Apache License, Version 2.0 (the "License");\n
+# you may not use this file except in compliance with the License.\n
+# You may obtain a copy of the License at\n
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+# either express or implied.  See the License for the specific language
+# governing permissions and limitations under the License.
+#
+# @date March 2016
+# @author Enrico Miglino <enrico.miglino@gmail.com>
+# @version 0.1.5
+# @version documentation version 0.5
+
+import sys, threading, traceback, bisect, Queue
+import cProfile, pstats
+import snapshot, sampling_profiler
+
+## Fraction of changed functions over which the sorted orders are rebuilt instead of updated
+RESORT_FRACTION = 0.25
+
+## Marker of the top level functions in the pstats format
+TOP_LEVEL = ("jprofile", 0, "profiler")
+
+##
+# Stop a collector and return its data, leaving the conversion to thaw()
+#
+# The cProfile collectors return their raw entries, the other collectors their snapshot.
+#
+# @param collector The timing collector
+def freeze(collector):
+    collector.disable()
+    if isinstance(collector, cProfile.Profile):
+        return collector.getstats()
+    return collector.snapshot()
+
+## Return the statistics in the pstats format of the data returned by freeze()
+def thaw(frozen):
+    if isinstance(frozen, dict):
+        return frozen
+    return snapshot.stats_from_entries(frozen)
+
+##
+# CachedStats class is a pstats.Stats built from the report cache, with no stripping and no sorting
+class CachedStats(pstats.Stats):
+
+    ##
+    # Constructor
+    #
+    # @param cache The report cache, already updated
+    # @param keys The sort keys of the report
+    # @param stream The output stream
+    def __init__(self, cache, keys, stream):
+        self.stream = stream
+        self.all_callees = None
+        self.files = []
+        self.stats = dict(cache.stripped)
+        self.fcn_list = cache.order(keys)
+        self.sort_type = cache.sort_type(keys)
+        self.sort_arg_dict = {}
+        self.total_calls = cache.total_calls
+        self.prim_calls = cache.prim_calls
+        self.total_tt = cache.total_tt
+        self.top_level = dict.fromkeys(cache.top_level)
+        self.max_name_len = cache.max_name_len()
+
+##
+# ReportCache class keeps the stripped statistics and their sorted orders between the reports of a collector
+class ReportCache:
+
+    def __init__(self):
+        ## Stripped name of every function seen
+        self.names = {}
+        ## The last statistics of every function, by full name
+        self.raw = {}
+        ## The full names of every stripped name
+        self.members = {}
+        ## The statistics with the stripped names, as built by pstats.Stats.strip_dirs()
+        self.stripped = {}
+        ## The length of the printed name of every stripped function
+        self.name_lengths = {}
+        self.longest = 0
+        ## The sorted orders by sort keys: a sorted list of (sort key, stripped name) pairs
+        self.orders = {}
+        ## The sort key of every stripped function, by sort keys
+        self.sort_keys = {}
+        self.total_calls = 0
+        self.prim_calls = 0
+        self.total_tt = 0
+        self.top_level = set()
+
+    ## Return the stripped name of a function, cached
+    def name(self, func):
+        name = self.names.get(func)
+        if name is None:
+            name = self.names[func] = pstats.func_strip_path(func)
+        return name
+
+    ##
+    # Update the cache with a new snapshot of the same collector
+    #
+    # @param stats The statistics in the pstats format
+    # @return The number of stripped functions changed
+    def update(self, stats):
+        raw = self.raw
+        known = len(raw)
+        dirty = set()
+        seen = 0
+        for func, stat in stats.iteritems():
+            previous = raw.get(func)
+            if previous is None:
+                self.members.setdefault(self.name(func), []).append(func)
+            else:
+                seen += 1
+                if previous[:4] == stat[:4]:
+                    continue
+            raw[func] = stat
+            dirty.add(self.names[func])
+        if seen < known:
+            # Functions gone from the collector, as after a reset
+            for func in [func for func in raw if func not in stats]:
+                del raw[func]
+                name = self.names[func]
+                self.members[name].remove(func)
+                dirty.add(name)
+        for name in dirty:
+            self._strip(name)
+        for keys in self.orders:
+            self._reorder(keys, dirty)
+        return len(dirty)
+
+    ## Rebuild the stripped statistics of a stripped name, summing the functions with the same stripped name
+    def _strip(self, name):
+        old = self.stripped.pop(name, None)
+        if old is not None:
+            self.total_calls -= old[1]
+            self.prim_calls -= old[0]
+            self.total_tt -= old[2]
+            self.top_level.discard(name)
+        members = self.members.get(name)
+        if not members:
+            self.members.pop(name, None)
+            if self.name_lengths.pop(name, 0) == self.longest:
+                self.longest = max(self.name_lengths.itervalues()) if self.name_lengths else 0
+            return
+        stat = None
+        for func in members:
+            cc, nc, tt, ct, callers = self.raw[func]
+            callers = dict((self.name(caller), value) for caller, value in callers.iteritems())
+            if stat is None:
+                stat = cc, nc, tt, ct, callers
+            else:
+                stat = pstats.add_func_stats(stat, (cc, nc, tt, ct, callers))
+        self.stripped[name] = stat
+        self.total_calls += stat[1]
+        self.prim_calls += stat[0]
+        self.total_tt += stat[2]
+        if TOP_LEVEL in stat[4]:
+            self.top_level.add(name)
+        if name not in self.name_lengths:
+            length = self.name_lengths[name] = len(pstats.func_std_string(name))
+            self.longest = max(self.longest, length)
+
+    ## Return the length of the longest printed name
+    def max_name_len(self):
+        return self.longest
+
+    ## Return the sort key of a stripped function for the sort keys, as compared by pstats
+    def _key(self, fields, name):
+        cc, nc, tt, ct = self.stripped[name][:4]
+        values = cc, nc, tt, ct, name[0], name[1], name[2], pstats.func_std_string(name)
+        return tuple(values[index] if direction > 0 else -values[index] for index, direction in fields) + (name,)
+
+    ## Return the (index, direction) fields of the sort keys, as defined by pstats
+    def _fields(self, keys):
+        definitions = pstats.Stats.sort_arg_dict_default
+        fields = []
+        for key in keys:
+            fields.extend(definitions[key][0])
+        return fields
+
+    ## Move the changed functions in the sorted order of the sort keys, or sort again when most of them changed
+    def _reorder(self, keys, dirty):
+        order = self.orders[keys]
+        known = self.sort_keys[keys]
+        fields = self._fields(keys)
+        if len(dirty) > len(order) * RESORT_FRACTION:
+            for name in dirty:
+                known.pop(name, None)
+                if name in self.stripped:
+                    known[name] = self._key(fields, name)
+            order[:] = sorted((key, name) for name, key in known.iteritems())
+            return
+        for name in dirty:
+            key = known.pop(name, None)
+            if key is not None:
+                del order[bisect.bisect_left(order, (key, name))]
+            if name in self.stripped:
+                key = known[name] = self._key(fields, name)
+                bisect.insort(order, (key, name))
+
+    ##
+    # Return the stripped functions sorted by the sort keys
+    #
+    # @param keys The tuple of the pstats sort keys, as 'module', 'name', 'time'
+    def order(self, keys):
+        if keys not in self.orders:
+            fields = self._fields(keys)
+            known = self.sort_keys[keys] = dict((name, self._key(fields, name)) for name in self.stripped)
+            self.orders[keys] = sorted((key, name) for name, key in known.iteritems())
+        return [name for key, name in self.orders[keys]]
+
+    ## Return the description of the sort keys printed in the reports
+    def sort_type(self, keys):
+        definitions = pstats.Stats.sort_arg_dict_default
+        return ", ".join(definitions[key][-1] for key in keys)
+
+##
+# ReportWorker class renders the reports in a background thread
+class ReportWorker:
+
+    ## Constructor, starting the worker thread
+    def __init__(self):
+        ## The cache of the reported statistics, used by the worker thread only
+        self.cache = ReportCache()
+        self.queue = Queue.Queue()
+        self.thread = threading.Thread(target = self._run, name = 'profiler-reports')
+        self.thread.daemon = True
+        self.thread.start()
+        sampling_profiler.ignore_thread(self.thread)
+
+    ##
+    # Queue a report. The call never blocks
+    #
+    # @param report The function writing the report, called with the report cache followed by the arguments
+    def submit(self, report, *args):
+        self.queue.put((report, args))
+
+    ## Wait until all the queued reports have been written
+    def wait(self):
+        self.queue.join()
+
+    ## Write the queued reports and stop the worker thread
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+
+    ## Loop executed by the worker thread. A failing report is printed to stderr and the worker goes on
+    def _run(self):
+        queue = self.queue
+        while True:
+            item = queue.get()
+            try:
+                if item is None:
+                    return
+                report, args = item
+                report(self.cache, *args)
+            except Exception:
+                traceback.print_exc(file = sys.stderr)
+            finally:
+                queue.task_done()
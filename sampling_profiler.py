@@ -0,0 +1,227 @@
+## @file sampling_profiler.py
+# @package profiler
+# @brief Statistical profiler sampling the stacks of all the threads
+#
+# The sampling profiler is an alternative timing collector to the deterministic cProfile. Instead of hooking every
+# function call, a background daemon thread wakes up at a fixed rate and captures the current stack of every thread
+# of the process via sys._current_frames(). The overhead depends only on the sampling rate and not on the number of
+# calls done by the program, so this profiler can be left running in production.\n\n
+# The captured stacks are aggregated in a compact table counting how many times every distinct stack has been seen.
+# When the statistics are requested the table is converted to the same format produced by cProfile, so the pstats
+# based reports work the same way with both the collectors. In the sampling reports the number of calls of a
+# function is the number of samples where the function was found on the stack, the internal time is estimated from
+# the samples where the function was running and the cumulative time from the samples where it was on the stack.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.\n
+#
+# Copyright NXP PLMA.  All Rights Reserved.\n
+#
+# Licensed under the Apache License, Version 2.0 (the "License");\n
+# you may not use this file except in compliance with the License.\n
+# You may obtain a copy of the License at\n
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+# either express or implied.  See the License for the specific language
+# governing permissions and limitations under the License.
+#
+# @date March 2016
+# @author Enrico Miglino <enrico.miglino@gmail.com>
+# @version 0.1.5
+# @version documentation version 0.5
+
+import sys, threading, time, marshal
+import cProfile, pstats
+
+## The background threads of the profiler, never sampled: thread ident -> thread
+internal_threads = {}
+
+##
+# Mark a started background thread of the profiler, so the sampling profilers do not sample it
+#
+# The entry of a thread is dropped once the thread is dead, as its ident may be reused by a new thread.
+#
+# @param thread The started thread
+def ignore_thread(thread):
+    for ident, other in internal_threads.items():
+        if not other.is_alive():
+            internal_threads.pop(ident, None)
+    internal_threads[thread.ident] = thread
+
+## Default sampling rate, in samples per second
+DEFAULT_RATE = 100
+
+## Default maximum number of frames captured for every stack
+DEFAULT_MAX_DEPTH = 128
+
+##
+# SamplingProfiler class is a timing collector with the same interface of cProfile.Profile
+#
+# The stacks are stored as tuples of code objects, from the outermost to the innermost frame, and converted to the
+# (file name, line number, function name) labels only when the statistics are created.
+class SamplingProfiler:
+
+    ##
+    # Constructor
+    #
+    # @param hz The sampling rate, in samples per second
+    # @param max_depth The maximum number of frames captured for every stack, starting from the innermost one
+    def __init__(self, hz = DEFAULT_RATE, max_depth = DEFAULT_MAX_DEPTH):
+        ## Sampling rate in samples per second
+        self.hz = hz
+        ## Maximum number of frames captured for every stack
+        self.max_depth = max_depth
+        ## The stack count table: stack tuple of code objects -> number of samples
+        self.stacks = {}
+        ## Number of sampling rounds done
+        self.ticks = 0
+        ## Wall time covered by the sampling rounds, in seconds
+        self.elapsed = 0.0
+        ## Time spent by the sampling thread doing actual work, in seconds
+        self.busy = 0.0
+        ## The statistics created by the last create_stats() call
+        self.stats = {}
+        ## Event set to stop the current sampling thread, None when the profiler is not running
+        self.stop_event = None
+        ## Idents of the threads not sampled, besides the sampling thread and the internal threads of the profiler
+        self.ignored = set()
+
+    ## Start sampling. Has no effect if the profiler is already running
+    def enable(self):
+        if self.stop_event is not None:
+            return
+        self.stop_event = threading.Event()
+        thread = threading.Thread(target = self._run, args = (self.stop_event,), name = 'profiler-stack-sampler')
+        thread.daemon = True
+        thread.start()
+        ignore_thread(thread)
+
+    ## Stop sampling. The samples already collected are kept
+    def disable(self):
+        if self.stop_event is not None:
+            self.stop_event.set()
+            self.stop_event = None
+
+    ## Return True if the sampling thread is active
+    def is_running(self):
+        return self.stop_event is not None
+
+    ##
+    # Change the sampling rate. The new rate is applied from the next sample
+    #
+    # @param hz The sampling rate, in samples per second
+    def set_rate(self, hz):
+        self.hz = hz
+
+    ##
+    # Sampling loop executed by the daemon thread
+    #
+    # The time covered by every round is measured, so the time estimates stay correct even when the thread wakes up
+    # late because of a busy interpreter.
+    def _run(self, stop_event):
+        own = threading.current_thread().ident
+        ignored = self.ignored
+        internal = internal_threads
+        stacks = self.stacks
+        current_frames = sys._current_frames
+        clock = time.time
+        sleep = time.sleep
+        last = clock()
+
+        while not stop_event.is_set():
+            sleep(1.0 / self.hz)
+            now = clock()
+            max_depth = self.max_depth
+            for ident, frame in current_frames().items():
+                if ident == own or ident in ignored:
+                    continue
+                thread = internal.get(ident)
+                if thread is not None:
+                    if thread.is_alive():
+                        continue
+                    internal.pop(ident, None)
+                stack = []
+                while frame is not None and len(stack) < max_depth:
+                    stack.append(frame.f_code)
+                    frame = frame.f_back
+                stack.reverse()
+                stack = tuple(stack)
+                stacks[stack] = stacks.get(stack, 0) + 1
+            self.ticks += 1
+            self.elapsed += now - last
+            last = clock()
+            self.busy += last - now
+
+    ## Return the average wall time represented by a single sample, in seconds
+    def sample_period(self):
+        if self.ticks == 0:
+            return 1.0 / self.hz
+        return self.elapsed / self.ticks
+
+    ## Return the fraction of time spent by the sampling thread doing actual work
+    def overhead(self):
+        if self.elapsed <= 0:
+            return 0.0
+        return self.busy / self.elapsed
+
+    ##
+    # Convert the stack count table to the pstats statistics format, without stopping the sampling
+    #
+    # Every function is charged once per stack, also when it is recursive, so the cumulative time never exceeds the
+    # sampled time.
+    def snapshot(self):
+        period = self.sample_period()
+        label = cProfile.label
+        labels = {}
+        inclusive = {}
+        internal = {}
+        edges = {}
+        edges_internal = {}
+
+        for stack, count in self.stacks.items():
+            if not stack:
+                continue
+            funcs = []
+            for code in stack:
+                func = labels.get(code)
+                if func is None:
+                    func = labels[code] = label(code)
+                funcs.append(func)
+            leaf = funcs[-1]
+            internal[leaf] = internal.get(leaf, 0) + count
+            for func in set(funcs):
+                inclusive[func] = inclusive.get(func, 0) + count
+            for edge in set(zip(funcs[:-1], funcs[1:])):
+                edges[edge] = edges.get(edge, 0) + count
+            if len(funcs) > 1:
+                edge = (funcs[-2], leaf)
+                edges_internal[edge] = edges_internal.get(edge, 0) + count
+
+        stats = {}
+        for func, count in inclusive.iteritems():
+            stats[func] = count, count, internal.get(func, 0) * period, count * period, {}
+        for (caller, callee), count in edges.iteritems():
+            stats[callee][4][caller] = count, count, edges_internal.get((caller, callee), 0) * period, count * period
+        return stats
+
+    ## Stop sampling and record the results internally as the current profile
+    def create_stats(self):
+        self.disable()
+        self.stats = self.snapshot()
+
+    ## Create a stats object based on the current profile and print the results to stdout
+    def print_stats(self, sort = -1):
+        pstats.Stats(self).strip_dirs().sort_stats(sort).print_stats()
+
+    ## Write the results of the current profile to file, in the same format of cProfile
+    def dump_stats(self, file):
+        f = open(file, 'wb')
+        try:
+            self.create_stats()
+            marshal.dump(self.stats, f)
+        finally:
+            f.close()
@@ -0,0 +1,136 @@
+## @file snapshot.py
+# @package profiler
+# @brief Helper methods taking and merging snapshots of the profiler collectors
+#
+# A snapshot is the dictionary of the profiled functions in the same format used by the pstats module: every function
+# is identified by the (file name, line number, function name) tuple and maps to the tuple
+# (primitive calls, total calls, internal time, cumulative time, callers).\n\n
+# Differently from the cProfile create_stats() method, taking a snapshot never stops the collector nor changes its
+# internal state, so a collector can be inspected while it is running and by more than one consumer.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.\n
+#
+# Copyright NXP PLMA.  All Rights Reserved.\n
+#
+# Licensed under the Apache License, Version 2.0 (the "License");\n
+# you may not use this file except in compliance with the License.\n
+# You may obtain a copy of the License at\n
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+# either express or implied.  See the License for the specific language
+# governing permissions and limitations under the License.
+#
+# @date March 2016
+# @author Enrico Miglino <enrico.miglino@gmail.com>
+# @version 0.1.5
+# @version documentation version 0.5
+
+import cProfile, pstats
+
+##
+# StatsSnapshot class wraps a snapshot dictionary so it can be loaded by pstats.Stats
+#
+# pstats.Stats accepts any object exposing the create_stats() method and the stats attribute, the same interface of
+# the cProfile collector.
+class StatsSnapshot:
+
+    ##
+    # Constructor
+    #
+    # @param stats The snapshot dictionary
+    def __init__(self, stats):
+        self.stats = stats
+
+    ## The snapshot is already complete, nothing to create
+    def create_stats(self):
+        pass
+
+##
+# Return the snapshot of a collector without stopping it
+#
+# cProfile collectors are read through getstats() as done by cProfile.Profile.snapshot_stats(), but the result is
+# returned instead of being stored in the collector. Any other collector should expose its own snapshot() method.
+#
+# @param collector The collector to read
+def take_snapshot(collector):
+    if not isinstance(collector, cProfile.Profile):
+        return collector.snapshot()
+    return stats_from_entries(collector.getstats())
+
+##
+# Return the statistics in the pstats format of the entries returned by the getstats() method of a cProfile collector
+#
+# @param entries The cProfile entries
+def stats_from_entries(entries):
+    stats = {}
+    callersdicts = {}
+    # call information
+    for entry in entries:
+        func = cProfile.label(entry.code)
+        nc = entry.callcount
+        cc = nc - entry.reccallcount
+        callers = {}
+        callersdicts[id(entry.code)] = callers
+        stats[func] = cc, nc, entry.inlinetime, entry.totaltime, callers
+    # subcall information
+    for entry in entries:
+        if entry.calls:
+            func = cProfile.label(entry.code)
+            for subentry in entry.calls:
+                try:
+                    callers = callersdicts[id(subentry.code)]
+                except KeyError:
+                    continue
+                nc = subentry.callcount
+                cc = nc - subentry.reccallcount
+                tt = subentry.inlinetime
+                ct = subentry.totaltime
+                if func in callers:
+                    prev = callers[func]
+                    nc += prev[0]
+                    cc += prev[1]
+                    tt += prev[2]
+                    ct += prev[3]
+                callers[func] = nc, cc, tt, ct
+    return stats
+
+##
+# Merge a sequence of snapshots into a new snapshot
+#
+# The timings and the calls of the functions found in more than one snapshot are summed, as done by
+# pstats.Stats.add(). The source snapshots are not modified.
+#
+# @param snapshots The snapshots to merge
+def merge_snapshots(snapshots):
+    merged = {}
+    for stats in snapshots:
+        for func, stat in stats.iteritems():
+            if func in merged:
+                merged[func] = pstats.add_func_stats(merged[func], stat)
+            else:
+                merged[func] = stat[:4] + (dict(stat[4]),)
+    return merged
+
+##
+# Return the difference between two snapshots of the same collector
+#
+# Only the functions whose counters changed are included in the result. The callers of the functions are not
+# compared: the returned snapshot has empty callers dictionaries.
+#
+# @param previous The older snapshot. Only the first four fields of every function are read
+# @param current The newer snapshot
+def diff_snapshots(previous, current):
+    delta = {}
+    for func, stat in current.iteritems():
+        cc, nc, tt, ct = stat[:4]
+        prev = previous.get(func)
+        if prev is None:
+            delta[func] = cc, nc, tt, ct, {}
+        elif prev[1] != nc or prev[2] != tt or prev[3] != ct:
+            delta[func] = cc - prev[0], nc - prev[1], tt - prev[2], ct - prev[3], {}
+    return delta
@@ -0,0 +1,224 @@
+## @file stream_writer.py
+# @package profiler
+# @brief Rotating binary writer of the profiler snapshots
+#
+# The snapshot writer appends the profiler snapshots to a binary file, for long running processes emitting periodic
+# profiles. The snapshots are queued by the calling thread and serialized, written and flushed by a background daemon
+# thread, so the profiled code never waits for the disk nor for the formatting of the data.\n\n
+# The file is kept open for the whole session and rotated when it grows over a maximum size or gets older than a
+# maximum age: the current file is renamed with the .1 suffix, the older ones are shifted up to the number of backups
+# to keep and the oldest is removed.\n\n
+# Every record in the file is made by a fixed size header, with the record marker, the length of the payload and the
+# timestamp of the snapshot, followed by the snapshot serialized with the marshal module (the same serialization used
+# by the cProfile dump_stats() method). The marker tells the kind of the record: a snapshot of the cumulative
+# statistics, or a window with the deltas of the statistics in an interval (see the periodic module). The records
+# can be read back with the read_records() function, or by kind with read_snapshots() and read_windows().
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.\n
+#
+# Copyright NXP PLMA.  All Rights Reserved.\n
+#
+# Licensed under the Apache License, Version 2.0 (the "License");\n
+# you may not use this file except in compliance with the License.\n
+# You may obtain a copy of the License at\n
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+# either express or implied.  See the License for the specific language
+# governing permissions and limitations under the License.
+#
+# @date March 2016
+# @author Enrico Miglino <enrico.miglino@gmail.com>
+# @version 0.1.5
+# @version documentation version 0.5
+
+import os, threading, time, marshal, struct, Queue
+import sampling_profiler
+
+## Kind of the records of the cumulative snapshots
+SNAPSHOT = 'snapshot'
+
+## Kind of the records of the per-window deltas
+WINDOW = 'window'
+
+## Marker starting the records of the cumulative snapshots
+RECORD_MARKER = 'PRFS'
+
+## Marker starting the records of the per-window deltas
+WINDOW_MARKER = 'PRFW'
+
+## The record markers by kind
+MARKERS = {SNAPSHOT: RECORD_MARKER, WINDOW: WINDOW_MARKER}
+
+## The record kinds by marker
+KINDS = dict((marker, kind) for kind, marker in MARKERS.items())
+
+## Record header: marker, payload length, snapshot timestamp
+RECORD_HEADER = struct.Struct('<4sId')
+
+## Default maximum size of a file before the rotation, in bytes
+DEFAULT_MAX_BYTES = 64 << 20
+
+## Default maximum age of a file before the rotation, in seconds
+DEFAULT_MAX_AGE = 24 * 3600
+
+## Default number of rotated files kept
+DEFAULT_BACKUPS = 5
+
+## Default maximum number of snapshots waiting to be written
+DEFAULT_QUEUE_SIZE = 64
+
+##
+# SnapshotWriter class writes the snapshots to a rotating file from a background thread
+class SnapshotWriter:
+
+    ##
+    # Constructor. The file is opened in append mode and the writing thread started
+    #
+    # @param filename The name of the file where the snapshots are written
+    # @param max_bytes The file is rotated when it grows over this size. Zero disables the size based rotation
+    # @param max_age The file is rotated when it gets older than this number of seconds. Zero disables the time based
+    # rotation
+    # @param backups The number of rotated files to keep
+    # @param queue_size The maximum number of snapshots waiting to be written. When the queue is full the new snapshots
+    # are dropped instead of blocking the caller
+    def __init__(self, filename, max_bytes = DEFAULT_MAX_BYTES, max_age = DEFAULT_MAX_AGE,
+                 backups = DEFAULT_BACKUPS, queue_size = DEFAULT_QUEUE_SIZE):
+        self.filename = filename
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.backups = backups
+        ## Number of snapshots dropped because the queue was full
+        self.dropped = 0
+        ## Number of snapshots written
+        self.written = 0
+        self.queue = Queue.Queue(queue_size)
+        self._open()
+        self.thread = threading.Thread(target = self._run, name = 'profiler-snapshot-writer')
+        self.thread.daemon = True
+        self.thread.start()
+        sampling_profiler.ignore_thread(self.thread)
+
+    ## Open the current file, appending to it if it already exists
+    def _open(self):
+        self.stream = open(self.filename, 'ab')
+        self.stream.seek(0, os.SEEK_END)
+        self.size = self.stream.tell()
+        self.opened = time.time()
+
+    ## Close the current file, shift the rotated files and open a new file
+    def _rotate(self):
+        self.stream.close()
+        if self.backups > 0:
+            for index in range(self.backups - 1, 0, -1):
+                source = '%s.%d' % (self.filename, index)
+                if os.path.exists(source):
+                    os.rename(source, '%s.%d' % (self.filename, index + 1))
+            os.rename(self.filename, self.filename + '.1')
+        else:
+            os.remove(self.filename)
+        self._open()
+
+    ##
+    # Queue a snapshot to be written. The call never blocks
+    #
+    # @param stats The snapshot to write. It should not be modified after this call
+    # @param timestamp The time the snapshot refers to, the current time by default
+    # @param kind The kind of the record: SNAPSHOT for the cumulative statistics, WINDOW for the deltas of a window
+    # @return False if the snapshot has been dropped because the queue is full
+    def write(self, stats, timestamp = None, kind = SNAPSHOT):
+        if timestamp is None:
+            timestamp = time.time()
+        try:
+            self.queue.put_nowait((timestamp, stats, MARKERS[kind]))
+        except Queue.Full:
+            self.dropped += 1
+            return False
+        return True
+
+    ## Writing loop executed by the daemon thread. The file is flushed every time the queue gets empty
+    def _run(self):
+        queue = self.queue
+        while True:
+            item = queue.get()
+            while item is not None:
+                self._write_record(*item)
+                try:
+                    item = queue.get_nowait()
+                except Queue.Empty:
+                    break
+            self.stream.flush()
+            if item is None:
+                self.stream.close()
+                return
+
+    ## Serialize a snapshot and write its record, rotating the file when needed
+    def _write_record(self, timestamp, stats, marker):
+        payload = marshal.dumps(stats)
+        record = RECORD_HEADER.pack(marker, len(payload), timestamp) + payload
+        if self.size > 0 and ((self.max_bytes and self.size + len(record) > self.max_bytes) or
+                              (self.max_age and timestamp - self.opened > self.max_age)):
+            self._rotate()
+        self.stream.write(record)
+        self.size += len(record)
+        self.written += 1
+
+    ##
+    # Write the queued snapshots and close the file
+    #
+    # @param timeout The maximum time in seconds to wait for the queued snapshots to be written
+    def close(self, timeout = None):
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join(timeout)
+            self.thread = None
+
+##
+# Read the records written in a file
+#
+# A truncated record at the end of the file, left by a process stopped while writing, is ignored.
+#
+# @param filename The name of the file to read
+# @return A generator of (kind, timestamp, snapshot) tuples, in the order they have been written
+def read_records(filename):
+    stream = open(filename, 'rb')
+    try:
+        while True:
+            header = stream.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                return
+            marker, length, timestamp = RECORD_HEADER.unpack(header)
+            kind = KINDS.get(marker)
+            if kind is None:
+                raise ValueError("%s: invalid snapshot record at offset %d" %
+                                 (filename, stream.tell() - RECORD_HEADER.size))
+            payload = stream.read(length)
+            if len(payload) < length:
+                return
+            yield kind, timestamp, marshal.loads(payload)
+    finally:
+        stream.close()
+
+##
+# Read the cumulative snapshots written in a file, skipping the windows
+#
+# @param filename The name of the file to read
+# @return A generator of (timestamp, snapshot) pairs, in the order they have been written
+def read_snapshots(filename):
+    for kind, timestamp, stats in read_records(filename):
+        if kind == SNAPSHOT:
+            yield timestamp, stats
+
+##
+# Read the per-window deltas written in a file, skipping the cumulative snapshots
+#
+# @param filename The name of the file to read
+# @return A generator of (window end time, delta) pairs, in the order they have been written
+def read_windows(filename):
+    for kind, timestamp, stats in read_records(filename):
+        if kind == WINDOW:
+            yield timestamp, stats
@@ -0,0 +1,131 @@
+## @file test_allocations.py
+# @brief Allocation sites: top and growth reports, linking to the functions and the garbage collector fallback
+#
+# Run from the package directory with: python -m unittest discover tests
+
+import os, sys, unittest
+from StringIO import StringIO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import allocations
+
+## Timing snapshot with two functions of the same file, in the pstats format
+STATS = {
+    ('/src/app.py', 10, 'load'): (3, 3, 0.5, 0.75, {}),
+    ('/src/app.py', 30, 'parse'): (7, 7, 0.25, 0.25, {}),
+}
+
+## Objects counted by the garbage collector fallback
+class Marker(object):
+    pass
+
+class ReportTest(unittest.TestCase):
+
+    def test_top(self):
+        sites = {('/src/app.py', 12): (4096, 2), ('/src/app.py', 31): (1024, 8), ('/src/app.py', 40): (2048, 1)}
+        self.assertEqual(allocations.top(sites, 2), [
+            (('/src/app.py', 12), 4096, 2), (('/src/app.py', 40), 2048, 1)])
+        self.assertEqual(allocations.top(sites, 1, 'count'), [(('/src/app.py', 31), 1024, 8)])
+
+    def test_compare(self):
+        old = {('/src/app.py', 12): (4096, 2), ('/src/app.py', 31): (1024, 8), ('/src/app.py', 40): (2048, 1)}
+        new = {('/src/app.py', 12): (4096, 2), ('/src/app.py', 31): (3072, 9), ('/src/app.py', 50): (512, 4)}
+        self.assertEqual(allocations.compare(old, new), [
+            (('/src/app.py', 31), 2048, 1, 3072, 9),
+            (('/src/app.py', 50), 512, 4, 512, 4),
+            (('/src/app.py', 40), -2048, -1, 0, 0),
+        ])
+        self.assertEqual(allocations.compare(old, new, 1, 'count')[0][0], ('/src/app.py', 50))
+
+    def test_function_index(self):
+        index = allocations.FunctionIndex(STATS)
+        self.assertEqual(index.find('/src/app.py', 12), ('/src/app.py', 10, 'load'))
+        self.assertEqual(index.find('/src/app.py', 30), ('/src/app.py', 30, 'parse'))
+        self.assertEqual(index.find('/src/app.py', 5), None)
+        self.assertEqual(index.find('/src/other.py', 12), None)
+
+    def test_print_top_links_functions(self):
+        stream = StringIO()
+        allocations.print_top(stream, [(('/src/app.py', 31), 2048, 4), (('/src/lib.py', 3), 1024, 1)], STATS)
+        lines = stream.getvalue().splitlines()
+        self.assertTrue('Allocation site' in lines[0])
+        self.assertEqual(lines[1].split(), ['2.0', '4', 'app.py:31', 'app.py:30(parse)', '7', '0.250'])
+        self.assertEqual(lines[2].split(), ['1.0', '1', 'lib.py:3', '-', '-', '-'])
+
+## Stand-in for the tracemalloc module, recording the start and stop calls
+class FakeTracemalloc:
+
+    def __init__(self, tracing):
+        self.tracing = tracing
+        self.calls = []
+
+    def is_tracing(self):
+        return self.tracing
+
+    def start(self, frames):
+        self.calls.append(('start', frames))
+        self.tracing = True
+
+    def stop(self):
+        self.calls.append(('stop',))
+        self.tracing = False
+
+class TrackerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.saved = allocations.tracemalloc
+
+    def tearDown(self):
+        allocations.tracemalloc = self.saved
+
+    def test_stops_own_tracing(self):
+        allocations.tracemalloc = FakeTracemalloc(False)
+        tracker = allocations.AllocationTracker(frames = 3)
+        tracker.start()
+        tracker.stop()
+        self.assertEqual(allocations.tracemalloc.calls, [('start', 3), ('stop',)])
+
+    def test_keeps_foreign_tracing(self):
+        allocations.tracemalloc = FakeTracemalloc(True)
+        tracker = allocations.AllocationTracker()
+        tracker.start()
+        self.assertTrue(tracker.started)
+        tracker.stop()
+        self.assertEqual(allocations.tracemalloc.calls, [])
+        self.assertTrue(allocations.tracemalloc.tracing)
+
+class GarbageCollectorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tracker = allocations.AllocationTracker()
+        self.tracker.tracing = False
+
+    def test_snapshot_by_type(self):
+        self.tracker.start()
+        old = self.tracker.snapshot()
+        objects = [Marker() for index in range(1000)]
+        new = self.tracker.snapshot()
+        self.tracker.stop()
+        self.assertFalse(self.tracker.started)
+        self.assertFalse(self.tracker.started_tracing)
+        self.assertEqual(new[('<Marker>', 0)][1], len(objects))
+        growth = allocations.compare(old, new, limit = 1, key = 'count')
+        self.assertEqual(growth[0][:3], (('<Marker>', 0), new[('<Marker>', 0)][0], len(objects)))
+
+    def test_print_without_sites(self):
+        stream = StringIO()
+        allocations.print_top(stream, [(('<list>', 0), 2048, 16)], STATS, sites = False)
+        lines = stream.getvalue().splitlines()
+        self.assertEqual(lines[0], allocations.NO_SITES)
+        self.assertTrue(lines[1].endswith('Object type'))
+        self.assertEqual(lines[2].split(), ['2.0', '16', '<list>'])
+
+        stream = StringIO()
+        allocations.print_compare(stream, [(('<dict>', 0), 1024, 2, 4096, 8)], STATS, sites = False)
+        lines = stream.getvalue().splitlines()
+        self.assertEqual(lines[0], allocations.NO_SITES)
+        self.assertEqual(lines[2].split(), ['+1.0', '+2', '4.0', '<dict>'])
+
+if __name__ == '__main__':
+    unittest.main()
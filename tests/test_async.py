@@ -0,0 +1,162 @@
+## @file test_async.py
+# @brief Event loop profiler, through a stub of the asyncio Handle and Task classes and with a real loop
+#
+# Run from the package directory with: python -m unittest discover tests
+
+import os, sys, time, types, unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import async_profiler
+
+## Callback handle run by the stub loop, with the _run() method patched by the profiler
+class StubHandle(object):
+
+    def __init__(self, callback, args):
+        self._callback = callback
+        self._args = args
+
+    def _run(self):
+        self._callback(*self._args)
+
+## Task stepping a generator, one step per handle
+class StubTask(object):
+
+    def __init__(self, loop, coro):
+        self._coro = coro
+        self._loop = loop
+        self._callbacks = []
+        self._done = False
+        loop.call_soon(self._step)
+
+    def done(self):
+        return self._done
+
+    def add_done_callback(self, callback):
+        self._callbacks.append(callback)
+
+    def _step(self):
+        try:
+            next(self._coro)
+        except StopIteration:
+            self._done = True
+            for callback in self._callbacks:
+                self._loop.call_soon(callback, self)
+        else:
+            self._loop.call_soon(self._step)
+
+## Loop running the ready handles, the timed ones run at the next round
+class StubLoop(object):
+
+    def __init__(self):
+        self.ready = []
+
+    def time(self):
+        return 0.0
+
+    def call_soon(self, callback, *args):
+        self.ready.append(StubHandle(callback, args))
+
+    def call_at(self, when, callback, *args):
+        self.call_soon(callback, *args)
+
+    def run(self, rounds):
+        for index in range(rounds):
+            handles, self.ready = self.ready, []
+            for handle in handles:
+                handle._run()
+
+def _steps(number):
+    for index in range(number):
+        yield
+
+def _callback():
+    pass
+
+class StubLoopTest(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = StubLoop()
+        stub = types.ModuleType('asyncio')
+        stub.Handle = StubHandle
+        stub.Task = StubTask
+        stub.get_event_loop = lambda: self.loop
+        self.asyncio = async_profiler.asyncio
+        async_profiler.asyncio = stub
+        self.profiler = async_profiler.AsyncProfiler()
+
+    def tearDown(self):
+        self.profiler.disable()
+        async_profiler.asyncio = self.asyncio
+
+    def test_tasks_and_callbacks_are_charged(self):
+        self.profiler.enable()
+        StubTask(self.loop, _steps(3))
+        self.loop.call_soon(_callback)
+        self.loop.run(10)
+        self.assertEqual(len(self.profiler.tasks), 0)
+        totals = dict((label[2], value) for label, value in self.profiler.coroutine_totals().items())
+        self.assertEqual(totals['_steps'][:2], [1, 4])
+        self.assertEqual(self.profiler.callbacks[async_profiler.cProfile.label(_callback.func_code)][0], 1)
+        self.assertTrue(self.profiler.lag.count > 0)
+
+    def test_disable_puts_back_the_handle(self):
+        original = StubHandle.__dict__['_run']
+        self.profiler.enable()
+        self.assertIsNot(StubHandle.__dict__['_run'], original)
+        self.profiler.disable()
+        self.assertIs(StubHandle.__dict__['_run'], original)
+
+    def test_task_finished_while_disabled(self):
+        self.profiler.enable()
+        StubTask(self.loop, _steps(3))
+        self.loop.run(1)
+        self.profiler.disable()
+        self.loop.run(10)
+        self.assertEqual(len(self.profiler.tasks), 0)
+        self.assertEqual(len(self.profiler.coroutines), 1)
+
+    def test_paused_time_is_not_charged(self):
+        def paused():
+            self.profiler.pause_thread()
+            time.sleep(0.05)
+            self.profiler.resume_thread()
+        self.profiler.enable()
+        self.loop.call_soon(paused)
+        self.loop.run(1)
+        running = self.profiler.callbacks[async_profiler.cProfile.label(paused.func_code)][1]
+        self.assertTrue(running < 0.04)
+
+    def test_single_heartbeat_after_enable_again(self):
+        self.profiler.enable()
+        self.profiler.disable()
+        self.profiler.enable()
+        self.loop.run(5)
+        self.assertEqual(len(self.loop.ready), 1)
+
+@unittest.skipIf(async_profiler.asyncio is None, "asyncio or trollius not available")
+class EventLoopTest(unittest.TestCase):
+
+    def test_coroutine_is_charged(self):
+        asyncio = async_profiler.asyncio
+
+        @asyncio.coroutine
+        def sleeper():
+            for index in range(3):
+                yield asyncio.From(asyncio.sleep(0.01)) if hasattr(asyncio, 'From') else asyncio.sleep(0.01)
+
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        profiler = async_profiler.AsyncProfiler()
+        try:
+            profiler.enable()
+            loop.run_until_complete(asyncio.Task(sleeper(), loop = loop))
+            profiler.disable()
+        finally:
+            loop.close()
+            asyncio.set_event_loop(None)
+        names = [label[2] for label in profiler.coroutine_totals()]
+        self.assertIn('sleeper', names)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+## @file test_benchmark.py
+# @brief Benchmarks of the profiler: loop timing, disabled call cost and the workload suite
+#
+# Run from the package directory with: python -m unittest discover tests
+
+import os, sys, threading, unittest
+from StringIO import StringIO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import benchmark
+
+def _workload():
+    total = 0
+    for index in xrange(1000):
+        total += index
+    return total
+
+class BenchmarkTest(unittest.TestCase):
+
+    def test_loop_times(self):
+        calls = []
+        times = benchmark.loop_times('append(_index)', {'append': calls.append}, number = 10, repeat = 3)
+        self.assertEqual(len(times), 3)
+        self.assertTrue(all(time >= 0 for time in times))
+        self.assertEqual(calls, range(10) * 3)
+
+    def test_disabled_call_cost(self):
+        result = benchmark.disabled_call_cost(number = 100, repeat = 2)
+        self.assertEqual(sorted(result), ['calls_ns', 'empty_loop_ns', 'noise_ns'])
+        self.assertEqual(len(result['calls_ns']), 5)
+        self.assertTrue(result['noise_ns'] >= 0)
+
+    def test_measure_workload(self):
+        threads = threading.active_count()
+        result = benchmark.measure_workload(_workload, repeat = 2)
+        self.assertEqual(sorted(result), sorted(benchmark.MODES + ('noise',)))
+        self.assertEqual(result['baseline']['ratio'], 1.0)
+        for mode in benchmark.MODES:
+            self.assertTrue(result[mode]['seconds'] > 0)
+            self.assertAlmostEqual(result[mode]['ratio'], result[mode]['seconds'] / result['baseline']['seconds'])
+        self.assertTrue(result['noise'] >= 0)
+        # The profilers of every run are stopped, with their sampling threads
+        for thread in threading.enumerate():
+            if thread.name in ('profiler-memory-sampler', 'profiler-stack-sampler'):
+                thread.join(1)
+        self.assertTrue(threading.active_count() <= threads)
+
+    def test_workload_suite(self):
+        for name, workload in benchmark.WORKLOADS:
+            workload()
+        result = benchmark.workload_suite(['tight_loop', 'small_calls'], repeat = 1)
+        self.assertEqual(sorted(result), ['small_calls', 'tight_loop'])
+        self.assertTrue(result['small_calls']['deterministic']['ratio'] > 1.0)
+
+    def test_unknown_workload(self):
+        stderr = sys.stderr
+        sys.stderr = StringIO()
+        try:
+            self.assertEqual(benchmark.main(['tight_loop', 'missing']), 2)
+            self.assertTrue('missing' in sys.stderr.getvalue())
+        finally:
+            sys.stderr = stderr
+
+if __name__ == '__main__':
+    unittest.main()
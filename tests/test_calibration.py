@@ -0,0 +1,54 @@
+## @file test_calibration.py
+# @brief Calibration of the cProfile overhead and adjusted times
+#
+# Run from the package directory with: python -m unittest discover tests
+
+import os, sys, shutil, tempfile, unittest, cProfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import calibration, snapshot
+
+def _square(value):
+    return value * value
+
+class AdjustTest(unittest.TestCase):
+
+    def test_bias_is_removed_along_the_call_graph(self):
+        caller = ('a.py', 1, 'caller')
+        callee = ('a.py', 10, 'callee')
+        stats = {
+            caller: (1, 1, 1.0, 2.0, {}),
+            callee: (10, 10, 1.0, 1.0, {caller: (10, 10, 1.0, 1.0)}),
+        }
+        adjusted = calibration.adjust(stats, (0.01, 0.02))
+        self.assertAlmostEqual(adjusted[callee][2], 0.9)
+        self.assertAlmostEqual(adjusted[callee][3], 0.9)
+        self.assertAlmostEqual(adjusted[caller][2], 0.79)
+        self.assertAlmostEqual(adjusted[caller][3], 1.69)
+        self.assertAlmostEqual(adjusted[callee][4][caller][2], 0.9)
+
+class CalibrationHookTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_calibration_while_timing(self):
+        collector = cProfile.Profile()
+        collector.enable()
+        bias = calibration.calibrate(True, os.path.join(self.directory, 'calibration.json'))
+        for index in range(100):
+            _square(index)
+        hooked = sys.getprofile() is collector
+        collector.disable()
+        self.assertTrue(hooked)
+        self.assertEqual(calibration.load(os.path.join(self.directory, 'calibration.json')), bias)
+        functions = dict((func[2], stat) for func, stat in snapshot.take_snapshot(collector).iteritems())
+        self.assertEqual(functions['_square'][1], 100)
+        self.assertNotIn('_empty', functions)
+
+if __name__ == '__main__':
+    unittest.main()
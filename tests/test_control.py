@@ -0,0 +1,77 @@
+## @file test_control.py
+# @brief Commands of the local control channel
+#
+# Run from the package directory with: python -m unittest discover tests
+
+import os, sys, signal, shutil, tempfile, threading, time, unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import profile, control
+
+@unittest.skipUnless(control.DEFAULT_SIGNAL is not None, "no signal available for the control channel")
+class ControlTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.address = os.path.join(self.directory, 'control.sock')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def server(self, profiler):
+        server = control.ControlServer(profiler, self.address)
+        self.addCleanup(server.close)
+        return server
+
+    ## Send a command from another thread, the main thread running the command while it sleeps
+    def send(self, command):
+        replies = []
+        client = threading.Thread(target = lambda: replies.append(control.send_command(self.address, command)))
+        client.start()
+        while client.is_alive():
+            time.sleep(0.01)
+        return replies[0]
+
+    def test_commands_through_the_socket(self):
+        profiler = profile.Profile(False, os.path.join(self.directory, 'report.txt'))
+        self.server(profiler)
+        self.assertEqual(self.send('status'), "ok enabled=0")
+        self.assertEqual(self.send('start'), "ok")
+        self.assertTrue(profiler.is_enabled())
+        self.assertEqual(self.send('stop'), "ok")
+        self.assertFalse(profiler.is_enabled())
+        self.assertTrue(self.send('bogus').startswith("error unknown command"))
+
+    def test_timed_out_command_is_not_run(self):
+        profiler = profile.Profile(False, os.path.join(self.directory, 'report.txt'))
+        server = self.server(profiler)
+        # The main thread does not run the queued commands until the handler is called below
+        signal.signal(server.signum, lambda signum, frame: None)
+        timeout, control.COMMAND_TIMEOUT = control.COMMAND_TIMEOUT, 0.05
+        try:
+            reply = server.submit('start')
+        finally:
+            control.COMMAND_TIMEOUT = timeout
+        self.assertTrue(reply.startswith("error timeout"))
+        server._handle_signal(server.signum, None)
+        self.assertFalse(profiler.is_enabled())
+
+    def test_wrong_rate_leaves_the_profiler_disabled(self):
+        profiler = profile.Profile(False, os.path.join(self.directory, 'report.txt'), mode = 'sampling')
+        server = self.server(profiler)
+        self.assertTrue(server.execute('rate fast').startswith("error"))
+        self.assertTrue(server.execute('rate 0').startswith("error"))
+        self.assertFalse(profiler.is_enabled())
+        self.assertEqual(server.execute('rate 50'), "ok")
+        self.assertEqual(profiler.enabled_profiler.hz, 50)
+        profiler.close()
+
+    def test_rate_of_the_deterministic_mode(self):
+        profiler = profile.Profile(False, os.path.join(self.directory, 'report.txt'))
+        server = self.server(profiler)
+        self.assertTrue(server.execute('rate 50').startswith("error"))
+        self.assertFalse(profiler.is_enabled())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+## @file test_filtered.py
+# @brief Filtered collector: only the selected functions are timed and the originals are put back
+#
+# Run from the package directory with: python -m unittest discover tests
+
+import os, sys, imp, unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import filtered_profiler
+
+## Source of the modules profiled by the tests
+SOURCE = '''
+import time
+
+def work():
+    helper()
+    time.sleep(0.01)
+
+def helper():
+    return 1
+
+def skipped():
+    return 2
+
+class Worker(object):
+
+    def run(self):
+        return helper()
+
+    @staticmethod
+    def build():
+        return Worker()
+'''
+
+## Create a module from SOURCE, registered in sys.modules
+def _module(name):
+    module = imp.new_module(name)
+    exec compile(SOURCE, '/filtered/%s.py' % name.replace('.', '/'), 'exec') in module.__dict__
+    sys.modules[name] = module
+    return module
+
+class FilteredProfilerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.app = _module('filtered_app')
+        self.vendor = _module('filtered_app.vendor')
+        self.other = _module('filtered_other')
+        # A module importing a function of the profiled module
+        self.client = imp.new_module('filtered_client')
+        self.client.work = self.app.work
+        sys.modules['filtered_client'] = self.client
+
+    def tearDown(self):
+        for name in ('filtered_app', 'filtered_app.vendor', 'filtered_other', 'filtered_client'):
+            sys.modules.pop(name, None)
+
+    def test_selection(self):
+        collector = filtered_profiler.FilteredProfiler(
+            include = ['filtered_app', self.other.helper], exclude = ['filtered_app.vendor', self.app.skipped])
+        collector.enable()
+        try:
+            self.assertTrue(self.app.work is not self.app.work._filtered_original)
+            self.assertTrue(self.client.work is self.app.work)
+            self.client.work()
+            self.app.skipped()
+            self.app.Worker.build().run()
+            self.vendor.work()
+            self.other.helper()
+            self.other.work()
+        finally:
+            collector.create_stats()
+
+        stats = dict((func[2], stat) for func, stat in collector.stats.items()
+                     if func[0] == '/filtered/filtered_app.py')
+        self.assertEqual(sorted(stats), ['build', 'helper', 'run', 'work'])
+        self.assertEqual(stats['work'][:2], (1, 1))
+        # The time of the functions not profiled, as time.sleep(), is internal time of the caller
+        self.assertTrue(stats['work'][3] >= stats['work'][2] >= 0.01)
+        self.assertEqual(stats['helper'][:2], (2, 2))
+        work = ('/filtered/filtered_app.py', 4, 'work')
+        run = ('/filtered/filtered_app.py', 16, 'run')
+        self.assertEqual(sorted(stats['helper'][4]), [work, run])
+        self.assertFalse(any(func[0] == '/filtered/filtered_app/vendor.py' for func in collector.stats))
+        other = [func[2] for func in collector.stats if func[0] == '/filtered/filtered_other.py']
+        self.assertEqual(other, ['helper'])
+
+    def test_restore(self):
+        work = self.app.work
+        run = vars(self.app.Worker)['run']
+        build = vars(self.app.Worker)['build']
+        collector = filtered_profiler.FilteredProfiler(include = ['filtered_app'])
+        collector.enable()
+        self.assertTrue(self.client.work is not work)
+        self.assertTrue(vars(self.app.Worker)['run'] is not run)
+        # A reference replaced by the program is left alone
+        replaced = lambda: None
+        self.app.helper = replaced
+        collector.disable()
+        self.assertFalse(collector.is_running())
+        self.assertTrue(self.app.work is work)
+        self.assertTrue(self.client.work is work)
+        self.assertTrue(vars(self.app.Worker)['run'] is run)
+        self.assertTrue(vars(self.app.Worker)['build'] is build)
+        self.assertTrue(self.app.helper is replaced)
+
+    def test_paused_thread(self):
+        collector = filtered_profiler.FilteredProfiler(include = ['filtered_app'])
+        collector.enable()
+        try:
+            collector.pause_thread()
+            self.app.helper()
+            collector.resume_thread()
+            self.app.helper()
+        finally:
+            collector.create_stats()
+        self.assertEqual(collector.stats[('/filtered/filtered_app.py', 8, 'helper')][:2], (1, 1))
+
+if __name__ == '__main__':
+    unittest.main()
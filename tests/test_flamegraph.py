@@ -0,0 +1,137 @@
+## @file test_flamegraph.py
+# @brief Flame graphs: collapsed stacks of the stack table and of the call graph, SVG drawing and export
+#
+# Run from the package directory with: python -m unittest discover tests
+
+import os, sys, shutil, tempfile, unittest
+from StringIO import StringIO
+from xml.etree import ElementTree
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cProfile
+import flamegraph
+import profile
+
+MAIN = ('/src/app.py', 1, 'main')
+LOAD = ('/src/app.py', 10, 'load')
+PARSE = ('/src/app.py', 20, 'parse;fast')
+BUILTIN = ('~', 0, '<len>')
+
+## Call graph: main calls load and parse, load calls parse, parse calls len
+STATS = {
+    MAIN: (1, 1, 0.1, 1.0, {}),
+    LOAD: (1, 1, 0.2, 0.6, {MAIN: (1, 1, 0.2, 0.6)}),
+    PARSE: (2, 2, 0.5, 0.7, {MAIN: (1, 1, 0.2, 0.3), LOAD: (1, 1, 0.3, 0.4)}),
+    BUILTIN: (2, 2, 0.2, 0.2, {PARSE: (2, 2, 0.2, 0.2)}),
+}
+
+def _outer():
+    return _inner()
+
+def _inner():
+    return 1
+
+def _busy():
+    total = 0
+    for index in xrange(100000):
+        total += index
+    return total
+
+class CollapsedTest(unittest.TestCase):
+
+    def test_frame_name(self):
+        self.assertEqual(flamegraph.frame_name(MAIN), 'main (app.py:1)')
+        self.assertEqual(flamegraph.frame_name(PARSE), 'parse:fast (app.py:20)')
+        self.assertEqual(flamegraph.frame_name(BUILTIN), '<len>')
+
+    def test_stack_table(self):
+        outer = _outer.__code__
+        inner = _inner.__code__
+        items = dict(flamegraph.collapsed_stacks({(outer, inner): 3, (outer,): 1, (): 2}))
+        outer_name = flamegraph.frame_name(cProfile.label(outer))
+        inner_name = flamegraph.frame_name(cProfile.label(inner))
+        self.assertEqual(items, {(outer_name, inner_name): 3, (outer_name,): 1})
+
+    def test_call_graph(self):
+        items = dict(flamegraph.collapsed_graph(STATS, threshold = 0))
+        main, load, parse, builtin = [flamegraph.frame_name(func) for func in (MAIN, LOAD, PARSE, BUILTIN)]
+        expected = {
+            (main,): 0.1,
+            (main, load): 0.2,
+            (main, load, parse): 0.4 * 5 / 7,
+            (main, load, parse, builtin): 0.4 * 2 / 7,
+            (main, parse): 0.3 * 5 / 7,
+            (main, parse, builtin): 0.3 * 2 / 7,
+        }
+        self.assertEqual(sorted(items), sorted(expected))
+        for frames, weight in expected.items():
+            self.assertAlmostEqual(items[frames], weight)
+        # The weights add up to the total internal time
+        self.assertAlmostEqual(sum(items.values()), 1.0)
+
+    def test_pruning(self):
+        items = dict(flamegraph.collapsed_graph(STATS, threshold = 0.12))
+        main, load, parse = [flamegraph.frame_name(func) for func in (MAIN, LOAD, PARSE)]
+        self.assertEqual(sorted(items), sorted([(main, load), (main, load, parse), (main, parse)]))
+        items = dict(flamegraph.collapsed_graph(STATS, threshold = 0, max_depth = 2))
+        self.assertTrue(all(len(frames) <= 2 for frames in items))
+
+    def test_recursion(self):
+        stats = {MAIN: (1, 3, 0.3, 0.3, {MAIN: (2, 2, 0.2, 0.2)})}
+        self.assertEqual(list(flamegraph.collapsed_graph(stats)), [((flamegraph.frame_name(MAIN),), 0.3)])
+
+    def test_write_collapsed(self):
+        stream = StringIO()
+        flamegraph.write_collapsed([(('a', 'b'), 0.0025), (('a',), 0.0000001), (('c',), 1)], stream, 1e6)
+        self.assertEqual(stream.getvalue(), 'a;b 2500\nc 1000000\n')
+
+class SvgTest(unittest.TestCase):
+
+    def test_frames(self):
+        stream = StringIO()
+        flamegraph.write_svg([(('main', 'load'), 3), (('main', 'parse <&>'), 1)], stream, title = 'Test')
+        root = ElementTree.fromstring(stream.getvalue())
+        namespace = '{http://www.w3.org/2000/svg}'
+        titles = [element.text for element in root.iter(namespace + 'title')]
+        self.assertEqual(sorted(titles), ['load (3 samples, 75.00%)', 'main (4 samples, 100.00%)',
+                                          'parse <&> (1 samples, 25.00%)'])
+        widths = dict((group.find(namespace + 'title').text.split()[0],
+                       float(group.find(namespace + 'rect').get('width'))) for group in root.iter(namespace + 'g'))
+        self.assertEqual(widths['main'], flamegraph.DEFAULT_WIDTH)
+        self.assertEqual(widths['load'], flamegraph.DEFAULT_WIDTH * 0.75)
+
+    def test_empty(self):
+        stream = StringIO()
+        flamegraph.write_svg([], stream, html = True)
+        self.assertTrue(stream.getvalue().startswith('<!DOCTYPE html>'))
+        self.assertTrue(stream.getvalue().endswith('</svg>\n</body></html>\n'))
+
+class ExportTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_dump_flamegraph(self):
+        prof = profile.Profile(True, os.path.join(self.directory, 'graph.prof'))
+        prof.enable()
+        try:
+            _busy()
+        finally:
+            prof.disable()
+        svg = os.path.join(self.directory, 'graph.svg')
+        collapsed = os.path.join(self.directory, 'graph.txt')
+        prof.dump_flamegraph(svg)
+        prof.dump_flamegraph(collapsed, threshold = 0)
+        ElementTree.parse(svg)
+        lines = open(collapsed).read().splitlines()
+        name = flamegraph.frame_name(cProfile.label(_busy.__code__))
+        self.assertTrue(any(line.rsplit(' ', 1)[0].endswith(name) for line in lines))
+        for line in lines:
+            self.assertTrue(int(line.rsplit(' ', 1)[1]) > 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+## @file test_formats.py
+# @brief Round trips of the output formats and the default names of the output files
+#
+# Run from the package directory with: python -m unittest discover tests
+
+import os, sys, shutil, tempfile, unittest
+import cProfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import profile, snapshot, stream_writer, columnar
+
+def _work(number):
+    return sum(_square(value) for value in xrange(number))
+
+def _square(value):
+    return value * value
+
+## Return the statistics in the pstats format of a short profiled run
+def _stats():
+    collector = cProfile.Profile()
+    collector.enable()
+    _work(1000)
+    collector.disable()
+    return snapshot.take_snapshot(collector)
+
+class FormatTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cwd = os.getcwd()
+        os.chdir(self.directory)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.directory)
+
+class SnapshotStreamTest(FormatTestCase):
+
+    def test_round_trip(self):
+        first, second = _stats(), _stats()
+        writer = stream_writer.SnapshotWriter('run.snapshots')
+        writer.write(first, 1.0)
+        writer.write(second, 2.0)
+        writer.close()
+        self.assertEqual(list(stream_writer.read_snapshots('run.snapshots')), [(1.0, first), (2.0, second)])
+
+    def test_record_kinds(self):
+        cumulative, delta = _stats(), _stats()
+        writer = stream_writer.SnapshotWriter('run.snapshots')
+        writer.write(cumulative, 1.0)
+        writer.write(delta, 2.0, stream_writer.WINDOW)
+        writer.write(cumulative, 3.0)
+        writer.close()
+        self.assertEqual([(kind, timestamp) for kind, timestamp, stats in stream_writer.read_records('run.snapshots')],
+                         [(stream_writer.SNAPSHOT, 1.0), (stream_writer.WINDOW, 2.0), (stream_writer.SNAPSHOT, 3.0)])
+        self.assertEqual(list(stream_writer.read_snapshots('run.snapshots')), [(1.0, cumulative), (3.0, cumulative)])
+        self.assertEqual(list(stream_writer.read_windows('run.snapshots')), [(2.0, delta)])
+
+    def test_periodic_windows(self):
+        profiler = profile.Profile(True, 'run.prof')
+        profiler.stream_snapshots()
+        profiler.enable()
+        profiler.start_periodic(60)
+        _work(100)
+        profiler.enabled_profiler.periodicProf.step()
+        profiler.stop_periodic()
+        profiler.write_snapshot()
+        profiler.disable()
+        profiler.close()
+        kinds = [kind for kind, timestamp, stats in stream_writer.read_records('run.prof.snapshots')]
+        self.assertEqual(kinds, [stream_writer.WINDOW, stream_writer.SNAPSHOT])
+
+    def test_truncated_record_ignored(self):
+        stats = _stats()
+        writer = stream_writer.SnapshotWriter('run.snapshots')
+        writer.write(stats, 1.0)
+        writer.write(stats, 2.0)
+        writer.close()
+        size = os.path.getsize('run.snapshots')
+        with open('run.snapshots', 'r+b') as stream:
+            stream.truncate(size - 10)
+        self.assertEqual(list(stream_writer.read_snapshots('run.snapshots')), [(1.0, stats)])
+
+class ColumnarTest(FormatTestCase):
+
+    def test_round_trip(self):
+        stats = _stats()
+        table = columnar.ColumnarStats()
+        table.add_stats(stats)
+        table.save('run.prfc')
+        self.assertTrue(columnar.is_columnar('run.prfc'))
+        self.assertEqual(columnar.load('run.prfc').to_stats(), stats)
+
+    def test_merge_sums_counters(self):
+        stats = _stats()
+        for name in ('first.prfc', 'second.prfc'):
+            table = columnar.ColumnarStats()
+            table.add_stats(stats)
+            table.save(name)
+        merged = columnar.merge_files(['first.prfc', 'second.prfc']).to_stats()
+        label = cProfile.label(_square.func_code)
+        self.assertEqual(merged[label][1], 2 * stats[label][1])
+
+class DefaultNamesTest(FormatTestCase):
+
+    def test_names_without_filename(self):
+        profiler = profile.Profile(True)
+        profiler.stream_snapshots()
+        profiler.enable()
+        _work(100)
+        profiler.disable()
+        profiler.write_snapshot()
+        profiler.dump_columnar()
+        profiler.dump_flamegraph()
+        profiler.dump_latencies()
+        profiler.close()
+        base = 'profile.%d' % os.getpid()
+        for extension in ('.snapshots', '.prfc', '.svg', '.json'):
+            self.assertTrue(os.path.exists(base + extension), base + extension)
+        self.assertEqual([name for name in os.listdir('.') if name.startswith('.')], [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+## @file test_histogram.py
+# @brief Latency histograms: bucket accuracy, percentiles, merging and the latencies of the regions
+#
+# Run from the package directory with: python -m unittest discover tests
+
+import os, sys, json, math, random, shutil, tempfile, unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import histogram
+import profile
+
+## Relative error of the bucket values, half the width of a sub-bucket
+ERROR = 1.0 / (2 * histogram.SUB_BUCKETS)
+
+## Return the exact value at a percentile of a sorted list, with the same rank definition of the histogram
+def _exact(values, percentile):
+    return values[max(1, int(math.ceil(percentile / 100.0 * len(values)))) - 1]
+
+class LatencyHistogramTest(unittest.TestCase):
+
+    def test_empty(self):
+        latencies = histogram.LatencyHistogram()
+        self.assertEqual(latencies.summary(), {'calls': 0})
+        self.assertEqual(latencies.percentiles((50, 99)), [0.0, 0.0])
+
+    def test_percentiles(self):
+        generator = random.Random(7)
+        values = [generator.lognormvariate(-7, 1.5) for index in range(10000)]
+        latencies = histogram.LatencyHistogram()
+        for value in values:
+            latencies.record(value)
+        values.sort()
+        percentiles = (1, 25, 50, 90, 95, 99, 99.9, 100)
+        for percentile, value in zip(percentiles, latencies.percentiles(percentiles)):
+            exact = _exact(values, percentile)
+            self.assertTrue(abs(value - exact) <= exact * ERROR, (percentile, value, exact))
+        summary = latencies.summary()
+        self.assertEqual(summary['calls'], len(values))
+        self.assertEqual((summary['min'], summary['max']), (values[0], values[-1]))
+        self.assertAlmostEqual(summary['mean'], sum(values) / len(values))
+        self.assertEqual(summary['p50'], latencies.percentile(50))
+
+    def test_clipped_to_the_recorded_range(self):
+        latencies = histogram.LatencyHistogram()
+        latencies.record(0.003)
+        self.assertEqual(latencies.percentiles((1, 50, 100)), [0.003, 0.003, 0.003])
+        # Out of range values are counted in the first and last buckets
+        for value in (0.0, 1e-9, 1e6):
+            latencies.record(value)
+        self.assertEqual(latencies.counts[0], 2)
+        self.assertEqual(latencies.counts[histogram.BUCKETS - 1], 1)
+        self.assertEqual(latencies.percentile(25), histogram.bucket_value(0))
+        self.assertEqual(latencies.percentile(100), histogram.bucket_value(histogram.BUCKETS - 1))
+        self.assertEqual((latencies.min, latencies.max), (0.0, 1e6))
+
+    def test_add(self):
+        first = histogram.LatencyHistogram()
+        second = histogram.LatencyHistogram()
+        both = histogram.LatencyHistogram()
+        for index in range(1, 200):
+            value = index * 1e-4
+            (first if index % 3 else second).record(value)
+            both.record(value)
+        first.add(second)
+        self.assertEqual(first.counts, both.counts)
+        summary = first.summary()
+        expected = both.summary()
+        self.assertAlmostEqual(summary.pop('mean'), expected.pop('mean'))
+        self.assertEqual(summary, expected)
+
+class RegionLatenciesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.profiler = profile.Profile(True, os.path.join(self.directory, 'latencies'))
+
+    def tearDown(self):
+        self.profiler.close()
+        shutil.rmtree(self.directory)
+
+    def test_region_latencies(self):
+        @self.profiler.profiled('handler')
+        def handler(value):
+            return value * 2
+
+        for index in range(100):
+            handler(index)
+        with self.profiler.region('request'):
+            handler(0)
+        latencies = self.profiler.latencies()
+        self.assertEqual(latencies['handler']['calls'], 101)
+        self.assertEqual(latencies['request']['calls'], 1)
+        for name in ('handler', 'request'):
+            summary = latencies[name]
+            self.assertTrue(summary['min'] <= summary['p50'] <= summary['p99'] <= summary['max'])
+
+        filename = os.path.join(self.directory, 'latencies.json')
+        self.profiler.dump_latencies(filename)
+        with open(filename) as stream:
+            self.assertEqual(json.load(stream)['handler']['calls'], 101)
+
+if __name__ == '__main__':
+    unittest.main()
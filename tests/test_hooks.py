@@ -0,0 +1,168 @@
+## @file test_hooks.py
+# @brief Profile and trace hooks left behind when the profiler is disabled
+#
+# Run from the package directory with: python -m unittest discover tests
+
+import os, sys, shutil, tempfile, threading, time, unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import profile
+
+def _square(value):
+    return value * value
+
+## Worker thread calling _square() until stopped
+class Worker(threading.Thread):
+
+    def __init__(self):
+        threading.Thread.__init__(self)
+        self.done = threading.Event()
+        self.hooked = []
+
+    def run(self):
+        while not self.done.is_set():
+            _square(2)
+            self.hooked.append(sys.getprofile() is not None)
+            time.sleep(0.001)
+
+class ThreadHooksTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.profiler = profile.Profile(True, os.path.join(self.directory, 'report.txt'))
+
+    def tearDown(self):
+        self.profiler.close()
+        shutil.rmtree(self.directory)
+
+    def calls(self):
+        # Read from the enabled profiler, still holding the statistics after set_enabled(False)
+        return sum(stat[1] for name, ident, stats in self.enabled.thread_snapshots()
+                   for func, stat in stats.iteritems() if func[2] == '_square')
+
+    def run_worker(self, stop):
+        worker = Worker()
+        self.profiler.enable(True)
+        self.enabled = self.profiler.profiler
+        worker.start()
+        try:
+            time.sleep(0.05)
+            stop()
+            time.sleep(0.02)
+            calls = self.calls()
+            self.assertTrue(calls > 0)
+            self.assertFalse(worker.hooked[-1])
+            time.sleep(0.05)
+            self.assertEqual(self.calls(), calls)
+        finally:
+            worker.done.set()
+            worker.join()
+        self.assertIsNone(sys.getprofile())
+        return calls
+
+    def test_disable_stops_the_worker_threads(self):
+        self.run_worker(self.profiler.disable)
+
+    def test_set_enabled_stops_the_worker_threads(self):
+        self.run_worker(lambda: self.profiler.set_enabled(False))
+
+    def test_finished_threads_are_merged(self):
+        self.profiler.enable(True)
+        self.enabled = self.profiler.profiler
+        threads = [threading.Thread(target = _square, args = (2,)) for index in range(20)]
+        for thread in threads:
+            thread.start()
+            thread.join()
+        self.profiler.disable()
+        snapshots = self.profiler.thread_snapshots()
+        self.assertEqual(len(snapshots), 2)
+        self.assertEqual(snapshots[-1][0], '<finished threads>')
+        self.assertEqual(self.calls(), 20)
+
+    @unittest.skipUnless(hasattr(os, 'fork'), "os.fork() not available")
+    def test_child_profiles_the_threads(self):
+        self.profiler.enable(True)
+        read, write = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            try:
+                self.profiler.after_fork()
+                thread = threading.Thread(target = _square, args = (2,))
+                thread.start()
+                thread.join()
+                os.write(write, '\n'.join(name for name, ident, stats in self.profiler.thread_snapshots()))
+            finally:
+                os._exit(0)
+        os.close(write)
+        names = os.read(read, 1024).splitlines()
+        os.close(read)
+        os.waitpid(pid, 0)
+        self.profiler.disable()
+        self.assertIn('<finished threads>', names)
+
+class IndependentProfilersTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.first = profile.Profile(True, os.path.join(self.directory, 'first.txt'))
+        self.second = profile.Profile(True, os.path.join(self.directory, 'second.txt'))
+
+    def tearDown(self):
+        self.first.close()
+        self.second.close()
+        shutil.rmtree(self.directory)
+
+    def test_finished_threads_keep_the_hook_of_another_profiler(self):
+        self.first.enable(True)
+        thread = threading.Thread(target = _square, args = (2,))
+        thread.start()
+        thread.join()
+        self.first.disable()
+        self.second.enable()
+        # Drops the collector of the exited thread
+        self.first.thread_snapshots()
+        for index in range(100):
+            _square(index)
+        hooked = sys.getprofile() is not None
+        self.second.disable()
+        self.assertTrue(hooked)
+        stats = self.second.profiler.snapshot()
+        self.assertEqual(sum(stat[1] for func, stat in stats.iteritems() if func[2] == '_square'), 100)
+
+class LineHooksTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.profiler = profile.Profile(True, os.path.join(self.directory, 'report.txt'))
+        self.traces = []
+
+        def traced(value):
+            self.traces.append(sys.gettrace() is not None)
+            return value * value
+        self.traced = self.profiler.line_profiled(traced)
+
+    def tearDown(self):
+        self.profiler.close()
+        shutil.rmtree(self.directory)
+
+    def test_disable_stops_the_line_timing(self):
+        self.profiler.enable()
+        self.traced(2)
+        self.profiler.disable()
+        self.traced(2)
+        self.profiler.enable()
+        self.traced(2)
+        self.profiler.disable()
+        self.assertEqual(self.traces, [True, False, True])
+
+    def test_set_enabled_stops_the_line_timing(self):
+        self.profiler.enable()
+        self.traced(2)
+        self.profiler.set_enabled(False)
+        self.traced(2)
+        self.assertEqual(self.traces, [True, False])
+        self.assertIsNone(sys.gettrace())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+## @file test_line_timing.py
+# @brief Line timing of the functions selected by decorator and by name, with the memory increments
+#
+# Run from the package directory with: python -m unittest discover tests
+
+import os, sys, gc, inspect, unittest, cProfile
+from StringIO import StringIO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import line_timing
+
+class Base:
+
+    def method(self):
+        return 1
+
+class Derived(Base):
+
+    def own(self):
+        return 2
+
+    @staticmethod
+    def static():
+        return 3
+
+def _raising():
+    try:
+        raise ValueError("line")
+    except ValueError:
+        pass
+    return 0
+
+def _allocating():
+    kept = [[index] for index in range(1000)]
+    return len(kept)
+
+## Return the line number of a statement in the source of a function
+def _line(func, text):
+    source, first = inspect.getsourcelines(func)
+    for index, line in enumerate(source):
+        if text in line:
+            return first + index
+    raise ValueError(text)
+
+class LineTimerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.timer = line_timing.LineTimer()
+
+    def tearDown(self):
+        self.timer.restore()
+
+    def test_decorated_function_is_timed(self):
+        timed = self.timer.wrap(_raising)
+        for index in range(3):
+            timed()
+        lines = self.timer.snapshot()[cProfile.label(_raising.func_code)]
+        self.assertEqual(lines[_line(_raising, 'return 0')][0], 3)
+
+    def test_exception_line_counted_once(self):
+        self.timer.wrap(_raising)()
+        lines = self.timer.lines[_raising.func_code]
+        self.assertEqual(lines[_line(_raising, 'raise ValueError')][0], 1)
+        self.assertEqual(lines[_line(_raising, 'pass')][0], 1)
+
+    def test_restore_the_functions_selected_by_name(self):
+        own = vars(Derived)['own']
+        static = vars(Derived)['static']
+        self.timer.add_names([__name__ + '.Derived.own', __name__ + '.Derived.static', __name__ + '.Derived.method'])
+        self.assertEqual(Derived().own(), 2)
+        self.assertEqual(Derived.static(), 3)
+        self.assertEqual(Derived().method(), 1)
+        self.assertIn('method', vars(Derived))
+        self.timer.restore()
+        self.assertIs(vars(Derived)['own'], own)
+        self.assertIs(vars(Derived)['static'], static)
+        # The inherited method is not copied into the derived class
+        self.assertNotIn('method', vars(Derived))
+        self.assertEqual(Derived().method(), 1)
+
+class LineMemoryTest(unittest.TestCase):
+
+    def setUp(self):
+        if hasattr(sys, 'getallocatedblocks'):
+            self.skipTest("the garbage collector fallback is used by the plain Python 2.7 only")
+        self.tracemalloc = line_timing.tracemalloc
+        line_timing.tracemalloc = None
+        self.timer = line_timing.LineTimer()
+
+    def tearDown(self):
+        self.timer.stop_memory()
+        line_timing.tracemalloc = self.tracemalloc
+
+    def test_object_counter(self):
+        counter, unit, started = line_timing.memory_counter()
+        self.assertEqual((unit, started), ('objects', False))
+        # The counter follows the allocations less the deallocations, the pending cyclic garbage is freed first
+        gc.collect()
+        before = counter()
+        kept = [[index] for index in range(5000)]
+        self.assertTrue(counter() - before >= len(kept) * 0.9)
+
+    def test_increments_labelled_as_objects(self):
+        self.timer.start_memory()
+        self.assertEqual(self.timer.memory_unit, 'objects')
+        gc.collect()
+        self.assertEqual(self.timer.wrap(_allocating)(), 1000)
+        lines = self.timer.snapshot()[cProfile.label(_allocating.func_code)]
+        self.assertTrue(lines[_line(_allocating, 'kept = ')][2] >= 900)
+
+        stream = StringIO()
+        self.timer.print_lines(stream)
+        report = stream.getvalue().splitlines()
+        self.assertIn("objects increment", report[0])
+        self.assertIn("not bytes", report[0])
+        self.assertTrue(report[1].split()[-3:] == ['Objects', 'Line', 'contents'])
+        self.assertNotIn("Mem (", stream.getvalue())
+
+if __name__ == '__main__':
+    unittest.main()
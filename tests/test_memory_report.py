@@ -0,0 +1,78 @@
+## @file test_memory_report.py
+# @brief Incremental memory report: statistics, peak windows, downsampled series and the memory_usage() API
+#
+# Run from the package directory with: python -m unittest discover tests
+
+import os, sys, json, shutil, tempfile, time, unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import memory_report
+import profile
+
+class MemoryReportTest(unittest.TestCase):
+
+    def test_empty(self):
+        report = memory_report.MemoryReport('empty')
+        self.assertEqual(report.to_dict(), {'comment': 'empty', 'samples': 0})
+        self.assertEqual(report.slope(), None)
+
+    def test_statistics(self):
+        report = memory_report.MemoryReport('run')
+        for index, value in enumerate([10.0, 12.0, 8.0, 14.0]):
+            report.add(1000.0 + index, value)
+        result = report.to_dict()
+        self.assertEqual(result['comment'], 'run')
+        self.assertEqual(result['samples'], 4)
+        self.assertEqual((result['start'], result['end']), (1000.0, 1003.0))
+        self.assertEqual((result['min_mb'], result['max_mb'], result['last_mb']), (8.0, 14.0, 14.0))
+        self.assertAlmostEqual(result['mean_mb'], 11.0)
+        # Least squares slope of 10, 12, 8, 14 over 0..3 seconds is 0.8 Mb per second
+        self.assertAlmostEqual(result['slope_mb_per_hour'], 0.8 * 3600)
+
+    def test_peak_windows(self):
+        report = memory_report.MemoryReport(window = 10.0, peaks = 2)
+        for second, value in [(0, 5.0), (5, 7.0), (10, 20.0), (20, 1.0), (30, 9.0), (35, 3.0)]:
+            report.add(float(second), value)
+        windows = report.to_dict()['peak_windows']
+        self.assertEqual(windows, [{'start': 10.0, 'end': 20.0, 'peak_mb': 20.0},
+                                   {'start': 30.0, 'end': 40.0, 'peak_mb': 9.0}])
+
+    def test_series_downsampling(self):
+        report = memory_report.MemoryReport(points = 4)
+        for index in range(9):
+            report.add(float(index), float(index))
+        series = report.to_dict()['series']
+        # The series is halved at the fourth point and again at the fourth point of two samples each
+        self.assertEqual(series['samples_per_point'], 4)
+        self.assertEqual(series['time'], [0.0, 4.0, 8.0])
+        self.assertEqual(series['mean_mb'], [1.5, 5.5, 8.0])
+        self.assertEqual(series['max_mb'], [3.0, 7.0, 8.0])
+        self.assertTrue(len(series['time']) <= 4)
+
+class MemoryUsageTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_memory_usage(self):
+        prof = profile.Profile(True, os.path.join(self.directory, 'memory.prof'))
+        self.assertEqual(prof.memory_usage(), None)
+        prof.sample_memory('test run', 0.01)
+        try:
+            time.sleep(0.2)
+            result = prof.memory_usage()
+            text = prof.memory_usage(as_json = True)
+        finally:
+            prof.stop_memory()
+        self.assertEqual(result['comment'], 'test run')
+        self.assertTrue(result['samples'] > 0)
+        self.assertTrue(0 < result['min_mb'] <= result['mean_mb'] <= result['max_mb'])
+        self.assertTrue('overhead' in result)
+        self.assertEqual(json.loads(text)['comment'], 'test run')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+## @file test_memory_sampler.py
+# @brief Ring buffer and overhead of the memory sampler
+#
+# Run from the package directory with: python -m unittest discover tests
+
+import os, sys, atexit, threading, time, weakref, unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import memory_sampler
+
+## Reader returning 1, 2, 3... and stopping the sampler after a number of samples
+class CountingReader:
+
+    def __init__(self, stop_event, number):
+        self.stop_event = stop_event
+        self.number = number
+        self.value = 0
+
+    def read(self):
+        self.value += 1
+        if self.value == self.number:
+            self.stop_event.set()
+        return float(self.value)
+
+    def close(self):
+        pass
+
+class MemorySamplerTest(unittest.TestCase):
+
+    def sample(self, sampler, number):
+        stop_event = threading.Event()
+        sampler._run(CountingReader(stop_event, number), stop_event)
+
+    def test_ring_buffer_keeps_the_last_samples(self):
+        sampler = memory_sampler.MemorySampler(interval = 0, size = 4)
+        self.sample(sampler, 3)
+        self.assertEqual(list(sampler.samples()[1]), [1.0, 2.0, 3.0])
+        self.sample(sampler, 6)
+        timestamps, values = sampler.samples()
+        self.assertEqual(list(values), [3.0, 4.0, 5.0, 6.0])
+        self.assertEqual(list(timestamps), sorted(timestamps))
+        self.assertEqual(sampler.count, 9)
+        self.assertEqual(sampler.last(), 6.0)
+
+    def test_overhead_since_the_last_start(self):
+        sampler = memory_sampler.MemorySampler(interval = 0.01)
+        sampler.busy = 10.0
+        sampler.start()
+        time.sleep(0.05)
+        sampler.stop()
+        self.assertTrue(0.0 < sampler.overhead() < 0.5)
+
+    def test_single_exit_hook(self):
+        handlers = len(atexit._exithandlers)
+        samplers = [memory_sampler.MemorySampler(interval = 0.01) for index in range(3)]
+        self.assertEqual(len(atexit._exithandlers), handlers)
+        for sampler in samplers:
+            sampler.start()
+        memory_sampler._stop_all()
+        self.assertFalse(any(sampler.is_running() for sampler in samplers))
+
+    def test_exit_hook_does_not_keep_the_samplers(self):
+        sampler = memory_sampler.MemorySampler()
+        reference = weakref.ref(sampler)
+        del sampler
+        self.assertIsNone(reference())
+
+if __name__ == '__main__':
+    unittest.main()
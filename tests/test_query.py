@@ -0,0 +1,119 @@
+## @file test_query.py
+# @brief Queries of the timing data: top functions, filters, groups and the Profile query API
+#
+# Run from the package directory with: python -m unittest discover tests
+
+import os, sys, imp, shutil, tempfile, unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import query
+import profile
+
+## Modules the statistics below belong to, registered while the tests run: name -> file name
+MODULES = {
+    'app': '/virtual/app/__init__.py',
+    'app.handlers': '/virtual/app/handlers.py',
+    'app.models': '/virtual/app/models.py',
+}
+
+## Statistics in the pstats format
+STATS = {
+    ('/virtual/app/__init__.py', 1, 'main'): (1, 1, 0.1, 2.0, {}),
+    ('/virtual/app/handlers.py', 10, 'get_user'): (5, 5, 0.5, 1.0, {}),
+    ('/virtual/app/handlers.py', 20, 'get_items'): (2, 4, 0.75, 0.75, {}),
+    ('/virtual/app/handlers.py', 30, 'post_item'): (1, 1, 0.05, 0.05, {}),
+    ('/virtual/app/models.py', 5, 'load'): (20, 20, 0.3, 0.4, {}),
+    ('/elsewhere/tools.py', 3, 'helper'): (100, 100, 0.2, 0.2, {}),
+    ('~', 0, '<len>'): (50, 50, 0.01, 0.01, {}),
+}
+
+def _square(value):
+    return value * value
+
+class StatsIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        for name, filename in MODULES.items():
+            module = sys.modules[name] = imp.new_module(name)
+            module.__file__ = filename
+        self.index = query.StatsIndex(STATS)
+
+    def tearDown(self):
+        for name in MODULES:
+            sys.modules.pop(name, None)
+
+    def test_modules(self):
+        self.assertEqual(len(self.index), len(STATS))
+        self.assertEqual(self.index.modules(), [query.BUILTIN_MODULE, 'app', 'app.handlers', 'app.models', 'tools'])
+
+    def test_top(self):
+        top = self.index.top('tottime', 2)
+        self.assertEqual([row['function'] for row in top], ['get_items', 'get_user'])
+        self.assertEqual(top[0], {'function': 'get_items', 'file': '/virtual/app/handlers.py', 'line': 20,
+                                  'module': 'app.handlers', 'calls': 4, 'primitive': 2, 'tottime': 0.75,
+                                  'cumtime': 0.75})
+        self.assertEqual([row['function'] for row in self.index.top('calls', 3)], ['helper', '<len>', 'load'])
+        self.assertEqual([row['function'] for row in self.index.top('cumpercall', 1)], ['main'])
+        self.assertEqual(len(self.index.top('percall', None)), len(STATS))
+        self.assertRaises(ValueError, self.index.top, 'time')
+
+    def test_filters(self):
+        functions = lambda rows: sorted(row['function'] for row in rows)
+        self.assertEqual(functions(self.index.top('tottime', None, module = 'app')),
+                         ['get_items', 'get_user', 'load', 'main', 'post_item'])
+        self.assertEqual(functions(self.index.select(module = 'app.models')), ['load'])
+        self.assertEqual(functions(self.index.select(module = 'ap')), [])
+        self.assertEqual(functions(self.index.select(function = 'get_*')), ['get_items', 'get_user'])
+        self.assertEqual(functions(self.index.select(module = 'app', filename = '*/handlers.py',
+                                                     function = '*_item*')), ['get_items', 'post_item'])
+
+    def test_groups(self):
+        groups = self.index.groups('module')
+        self.assertEqual([group['module'] for group in groups][:2], ['app.handlers', 'app.models'])
+        self.assertEqual(groups[0]['functions'], 3)
+        self.assertEqual(groups[0]['calls'], 10)
+        self.assertEqual(groups[0]['primitive'], 8)
+        self.assertAlmostEqual(groups[0]['tottime'], 1.3)
+
+        packages = dict((group['package'], group) for group in self.index.groups('package'))
+        self.assertEqual(sorted(packages), [query.BUILTIN_MODULE, 'app', 'tools'])
+        self.assertEqual(packages['app']['functions'], 5)
+
+        top = self.index.groups('file', 'calls', 1)
+        self.assertEqual([group['file'] for group in top], ['/elsewhere/tools.py'])
+        self.assertEqual(len(self.index.groups('module', module = 'app.handlers')), 1)
+        self.assertRaises(ValueError, self.index.groups, 'class')
+        self.assertRaises(ValueError, self.index.groups, 'module', 'cumtime')
+
+class ProfileQueryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.profiler = profile.Profile(True, os.path.join(self.directory, 'query.prof'))
+
+    def tearDown(self):
+        self.profiler.close()
+        shutil.rmtree(self.directory)
+
+    def test_top_without_stopping(self):
+        self.profiler.enable()
+        try:
+            for index in range(10):
+                _square(index)
+            top = self.profiler.top('calls', 1, function = '_square', max_age = 0)
+            self.assertEqual(top[0]['calls'], 10)
+            self.assertEqual(top[0]['module'], __name__)
+            for index in range(5):
+                _square(index)
+        finally:
+            self.profiler.disable()
+        index = self.profiler.stats_index(60)
+        self.assertTrue(index is self.profiler.stats_index(60))
+        self.assertEqual(self.profiler.top('calls', 1, function = '_square', max_age = 60)[0]['calls'], 10)
+        self.assertEqual(self.profiler.top('calls', 1, function = '_square', max_age = 0)[0]['calls'], 15)
+        modules = [group['module'] for group in self.profiler.group_stats('module', 'calls', max_age = 0)]
+        self.assertTrue(__name__ in modules)
+
+if __name__ == '__main__':
+    unittest.main()
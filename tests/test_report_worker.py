@@ -0,0 +1,139 @@
+## @file test_report_worker.py
+# @brief Background reports: the report cache against pstats, the worker thread and the background statistics
+#
+# Run from the package directory with: python -m unittest discover tests
+
+import os, sys, shutil, tempfile, threading, unittest
+from StringIO import StringIO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pstats
+import report_worker
+import profile
+
+## Statistics in the pstats format, with two functions sharing the same stripped name
+STATS = {
+    ('/src/a/app.py', 1, 'main'): (1, 1, 0.5, 4.0, {report_worker.TOP_LEVEL: (1, 1, 0.5, 4.0)}),
+    ('/src/a/app.py', 10, 'load'): (3, 3, 1.0, 2.0, {('/src/a/app.py', 1, 'main'): (3, 3, 1.0, 2.0)}),
+    ('/src/a/util.py', 5, 'parse'): (6, 8, 0.25, 0.75, {('/src/a/app.py', 10, 'load'): (6, 8, 0.25, 0.75)}),
+    ('/src/b/util.py', 5, 'parse'): (2, 2, 0.125, 0.125, {('/src/a/app.py', 1, 'main'): (2, 2, 0.125, 0.125)}),
+    ('~', 0, '<len>'): (9, 9, 0.0625, 0.0625, {('/src/a/util.py', 5, 'parse'): (9, 9, 0.0625, 0.0625)}),
+}
+
+## Collector handing fixed statistics to pstats.Stats
+class Collector:
+
+    def __init__(self, stats):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+## Return the report printed by pstats, stripping and sorting from scratch
+def _pstats_report(stats, keys, method = 'print_stats'):
+    stream = StringIO()
+    getattr(pstats.Stats(Collector(stats), stream = stream).strip_dirs().sort_stats(*keys), method)()
+    return stream.getvalue()
+
+## Return the report printed from the report cache
+def _cached_report(cache, keys, method = 'print_stats'):
+    stream = StringIO()
+    getattr(report_worker.CachedStats(cache, keys, stream), method)()
+    return stream.getvalue()
+
+class ReportCacheTest(unittest.TestCase):
+
+    def test_same_report_as_pstats(self):
+        cache = report_worker.ReportCache()
+        self.assertEqual(cache.update(STATS), 4)
+        self.assertEqual(cache.stripped[('util.py', 5, 'parse')][:4], (8, 10, 0.375, 0.875))
+        for keys in (('module', 'name', 'time'), ('cumulative',), ('calls', 'name')):
+            self.assertEqual(_cached_report(cache, keys), _pstats_report(STATS, keys))
+        keys = ('time',)
+        self.assertEqual(_cached_report(cache, keys, 'print_callers'), _pstats_report(STATS, keys, 'print_callers'))
+
+    def test_incremental_update(self):
+        stats = dict(STATS)
+        for index in range(20):
+            stats[('/src/c/gen.py', index + 1, 'gen%d' % index)] = (1, 1, index * 0.01, index * 0.01, {})
+        cache = report_worker.ReportCache()
+        cache.update(stats)
+        keys = ('time', 'name')
+        cache.order(keys)
+
+        # A single changed function is moved in the kept order
+        stats[('/src/a/app.py', 10, 'load')] = (4, 4, 3.0, 4.0, {('/src/a/app.py', 1, 'main'): (4, 4, 3.0, 4.0)})
+        self.assertEqual(cache.update(dict(stats)), 1)
+        self.assertEqual(cache.order(keys)[0], ('app.py', 10, 'load'))
+        self.assertEqual(_cached_report(cache, keys), _pstats_report(stats, keys))
+
+        # Unchanged statistics change nothing
+        self.assertEqual(cache.update(dict(stats)), 0)
+
+        # The functions gone from the collector are dropped
+        del stats[('/src/b/util.py', 5, 'parse')]
+        del stats[('/src/c/gen.py', 20, 'gen19')]
+        self.assertEqual(cache.update(dict(stats)), 2)
+        self.assertFalse(('gen.py', 20, 'gen19') in cache.order(keys))
+        self.assertEqual(cache.stripped[('util.py', 5, 'parse')][:4], (6, 8, 0.25, 0.75))
+        self.assertEqual(_cached_report(cache, keys), _pstats_report(stats, keys))
+
+class ReportWorkerTest(unittest.TestCase):
+
+    def test_order_and_failures(self):
+        written = []
+        threads = []
+        def report(cache, value):
+            threads.append(threading.current_thread())
+            if value is None:
+                raise ValueError("failing report")
+            written.append(value)
+        worker = report_worker.ReportWorker()
+        stderr = sys.stderr
+        sys.stderr = StringIO()
+        try:
+            for value in (1, 2, None, 3):
+                worker.submit(report, value)
+            worker.wait()
+            self.assertTrue('failing report' in sys.stderr.getvalue())
+        finally:
+            sys.stderr = stderr
+        self.assertEqual(written, [1, 2, 3])
+        self.assertEqual(set(threads), set([worker.thread]))
+        worker.submit(report, 4)
+        worker.close()
+        self.assertEqual(written, [1, 2, 3, 4])
+        self.assertFalse(worker.thread.is_alive())
+
+def _square(value):
+    return value * value
+
+class BackgroundReportsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'report.txt')
+        self.profiler = profile.Profile(True, self.filename)
+
+    def tearDown(self):
+        self.profiler.close()
+        shutil.rmtree(self.directory)
+
+    def test_background_statistics(self):
+        self.profiler.background_reports()
+        for repetition in range(2):
+            self.profiler.enable()
+            _square(2)
+            self.profiler.disable()
+            self.profiler.stats()
+        self.profiler.wait_reports()
+        self.profiler.background_reports(False)
+        with open(self.filename) as stream:
+            report = stream.read()
+        self.assertEqual(report.count("Ordered by: file name, function name, internal time"), 2)
+        lines = [line.split() for line in report.splitlines() if '(_square)' in line]
+        self.assertEqual([line[0] for line in lines], ['1', '2'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+## @file test_reports.py
+# @brief Reports of the profiler, with and without timing data
+#
+# Run from the package directory with: python -m unittest discover tests
+
+import os, sys, shutil, tempfile, unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import profile
+
+def _square(value):
+    return value * value
+
+class EmptyCollectorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'report.txt')
+        self.profiler = profile.Profile(True, self.filename)
+
+    def tearDown(self):
+        self.profiler.close()
+        shutil.rmtree(self.directory)
+
+    def report(self):
+        with open(self.filename) as stream:
+            return stream.read()
+
+    def test_statistics_without_timing_data(self):
+        with self.profiler.region('request'):
+            _square(2)
+        self.profiler.stats()
+        report = self.report()
+        self.assertIn("No timing data collected", report)
+        # The sections following the statistics are still printed
+        self.assertIn("request", report)
+
+    def test_module_reports_without_timing_data(self):
+        self.profiler.profile_module('test_reports')
+        self.profiler.profile_module_calls('test_reports')
+        self.profiler.merge_stats(['missing'])
+        self.assertEqual(self.report().count("No timing data collected"), 3)
+
+    def test_background_statistics_without_timing_data(self):
+        self.profiler.background_reports()
+        self.profiler.stats()
+        self.profiler.wait_reports()
+        self.profiler.background_reports(False)
+        self.assertIn("No timing data collected", self.report())
+
+    def test_statistics_with_timing_data(self):
+        self.profiler.enable()
+        _square(2)
+        self.profiler.disable()
+        self.profiler.stats()
+        self.assertIn("_square", self.report())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+## @file test_runcall.py
+# @brief Repeated timing of a function with runcall_many(), with and without the session profilers
+#
+# Run from the package directory with: python -m unittest discover tests
+
+import os, sys, shutil, tempfile, threading, time, unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import profile
+
+def _square(value):
+    return value * value
+
+def _cube(value):
+    return value * value * value
+
+def _step():
+    _square(2)
+    time.sleep(0.001)
+
+## Worker thread calling _cube() until stopped, counting its calls
+class Worker(threading.Thread):
+
+    def __init__(self):
+        threading.Thread.__init__(self)
+        self.done = threading.Event()
+        self.calls = 0
+
+    def run(self):
+        while not self.done.is_set():
+            _cube(2)
+            self.calls += 1
+            time.sleep(0.001)
+
+class RuncallManyTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def profiler(self, **options):
+        profiler = profile.Profile(True, os.path.join(self.directory, 'report.txt'), **options)
+        self.addCleanup(profiler.close)
+        return profiler
+
+    def calls(self, profiler, name):
+        return sum(stat[1] for func, stat in profiler.profiler.snapshot().iteritems() if func[2] == name)
+
+    def test_summary_of_the_calls(self):
+        profiler = self.profiler()
+        summary = profiler.runcall_many(_square, 100, (3,))
+        self.assertEqual(summary['calls'], 100)
+
+    def test_calls_are_not_profiled_by_the_session(self):
+        profiler = self.profiler()
+        profiler.enable()
+        profiler.runcall_many(_square, 100, (3,))
+        _square(3)
+        profiler.disable()
+        self.assertEqual(self.calls(profiler, '_square'), 1)
+
+    def test_calls_are_profiled_on_request(self):
+        profiler = self.profiler()
+        profiler.runcall_many(_square, 100, (3,), profile = True)
+        self.assertEqual(self.calls(profiler, '_square'), 100)
+
+    def test_filtered_mode_keeps_profiling_the_other_threads(self):
+        profiler = self.profiler(mode = 'filtered', include = [_square, _cube])
+        profiler.enable()
+        worker = Worker()
+        worker.start()
+        try:
+            profiler.runcall_many(_step, 50)
+        finally:
+            worker.done.set()
+            worker.join()
+        profiler.disable()
+        self.assertEqual(self.calls(profiler, '_square'), 0)
+        self.assertEqual(self.calls(profiler, '_cube'), worker.calls)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+## @file test_sampling.py
+# @brief Stack sampling collector: stack table conversion, sampled threads and ignored threads
+#
+# Run from the package directory with: python -m unittest discover tests
+
+import os, sys, threading, time, unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cProfile
+import sampling_profiler
+
+def _outer():
+    return _inner()
+
+def _inner():
+    return 1
+
+def _busy(seconds):
+    end = time.time() + seconds
+    while time.time() < end:
+        pass
+
+def _hidden(stop):
+    while not stop.is_set():
+        pass
+
+class SnapshotTest(unittest.TestCase):
+
+    def test_stack_table(self):
+        outer = _outer.__code__
+        inner = _inner.__code__
+        collector = sampling_profiler.SamplingProfiler(hz = 10)
+        collector.stacks = {(outer, inner): 3, (outer,): 1}
+        collector.ticks = 4
+        collector.elapsed = 0.4
+        stats = collector.snapshot()
+
+        outer_stats = stats[cProfile.label(outer)]
+        inner_stats = stats[cProfile.label(inner)]
+        self.assertEqual(outer_stats[:2], (4, 4))
+        self.assertAlmostEqual(outer_stats[2], 0.1)
+        self.assertAlmostEqual(outer_stats[3], 0.4)
+        self.assertEqual(inner_stats[:2], (3, 3))
+        self.assertAlmostEqual(inner_stats[2], 0.3)
+        self.assertAlmostEqual(inner_stats[3], 0.3)
+        edge = inner_stats[4][cProfile.label(outer)]
+        self.assertEqual(edge[:2], (3, 3))
+        self.assertAlmostEqual(edge[3], 0.3)
+
+    def test_recursion_counted_once(self):
+        outer = _outer.__code__
+        collector = sampling_profiler.SamplingProfiler(hz = 10)
+        collector.stacks = {(outer, outer, outer): 2}
+        collector.ticks = 2
+        collector.elapsed = 0.2
+        stats = collector.snapshot()
+        self.assertEqual(stats[cProfile.label(outer)][:2], (2, 2))
+        self.assertAlmostEqual(stats[cProfile.label(outer)][3], 0.2)
+
+class SamplingTest(unittest.TestCase):
+
+    def test_busy_function_sampled(self):
+        collector = sampling_profiler.SamplingProfiler(hz = 200)
+        collector.enable()
+        try:
+            self.assertTrue(collector.is_running())
+            _busy(0.3)
+        finally:
+            collector.create_stats()
+        self.assertFalse(collector.is_running())
+        self.assertTrue(collector.ticks > 0)
+        busy = collector.stats.get(cProfile.label(_busy.__code__))
+        self.assertTrue(busy is not None)
+        self.assertTrue(busy[0] > 0)
+        self.assertTrue(busy[3] > 0)
+
+    def test_internal_threads_ignored(self):
+        stop = threading.Event()
+        thread = threading.Thread(target = _hidden, args = (stop,))
+        thread.daemon = True
+        thread.start()
+        sampling_profiler.ignore_thread(thread)
+        collector = sampling_profiler.SamplingProfiler(hz = 200)
+        collector.enable()
+        try:
+            _busy(0.3)
+        finally:
+            collector.create_stats()
+            stop.set()
+            thread.join()
+        self.assertTrue(cProfile.label(_busy.__code__) in collector.stats)
+        self.assertFalse(cProfile.label(_hidden.__code__) in collector.stats)
+        self.assertFalse(cProfile.label(sampling_profiler.SamplingProfiler._run.__code__) in collector.stats)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,143 @@
+## @file test_triggers.py
+# @brief Triggered captures: the thresholds, the rate limiting, the capture files and a slow region firing a capture
+#
+# Run from the package directory with: python -m unittest discover tests
+
+import os, sys, collections, marshal, shutil, tempfile, time, unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cProfile
+import triggers
+import profile
+
+def _busy(seconds):
+    end = time.time() + seconds
+    while time.time() < end:
+        pass
+
+## Wait until the manager has completed a number of captures, up to a timeout
+def _wait_captures(captures, number, timeout = 5.0):
+    end = time.time() + timeout
+    while len(captures()) < number and time.time() < end:
+        time.sleep(0.01)
+    return captures()
+
+## Trigger manager recording the fired triggers instead of running the captures
+class RecordingManager(triggers.TriggerManager):
+
+    def __init__(self):
+        triggers.TriggerManager.__init__(self, 'unused')
+        self.fired = []
+
+    def fire(self, reason, detail = ''):
+        self.fired.append((reason, detail))
+        return True
+
+class ThresholdTest(unittest.TestCase):
+
+    def test_latency(self):
+        manager = RecordingManager()
+        manager.region_names = ['fast', 'slow']
+        manager.region_thresholds[1] = 0.5
+        manager.region_sample(0, 10.0, 0.0)
+        manager.region_sample(1, 0.25, 0.0)
+        self.assertEqual(manager.fired, [])
+        manager.region_sample(1, 0.75, 0.0)
+        self.assertEqual(manager.fired, [('latency', 'region slow took 750.000 ms')])
+        manager.any_region = 1.0
+        manager.region_sample(0, 2.0, 0.0)
+        self.assertEqual(manager.fired[-1], ('latency', 'region fast took 2000.000 ms'))
+
+    def test_memory_growth(self):
+        manager = RecordingManager()
+        manager.memory_triggers.append((10.0, 5.0, collections.deque()))
+        # Slow growth: never 10 Mb within 5 seconds
+        for second in range(20):
+            manager.memory_sample(float(second), 100.0 + second)
+        self.assertEqual(manager.fired, [])
+        # A jump from the minimum of the window
+        manager.memory_sample(20.0, 90.0)
+        manager.memory_sample(22.0, 101.0)
+        self.assertEqual(manager.fired, [('memory', 'grown 11.0 Mb in 2.0 s')])
+        # The window restarts after a capture
+        manager.memory_sample(23.0, 102.0)
+        self.assertEqual(len(manager.fired), 1)
+
+    def test_lag(self):
+        manager = RecordingManager()
+        manager.lag_sample(10.0)
+        manager.lag_threshold = 0.1
+        manager.lag_sample(0.05)
+        manager.lag_sample(0.2)
+        self.assertEqual(manager.fired, [('lag', 'event loop lag 200.000 ms')])
+
+class CaptureTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_rate_limiting(self):
+        manager = triggers.TriggerManager(os.path.join(self.directory, 'app'), duration = 0.05, hz = 200,
+                                          cooldown = 60.0)
+        self.assertTrue(manager.fire('manual', 'first'))
+        self.assertFalse(manager.fire('manual', 'while running'))
+        captures = _wait_captures(manager.capture_list, 1)
+        self.assertFalse(manager.fire('manual', 'cooling down'))
+        self.assertEqual(manager.suppressed, 2)
+        self.assertEqual(len(captures), 1)
+        self.assertEqual(captures[0]['reason'], 'manual')
+        self.assertEqual(captures[0]['detail'], 'first')
+        self.assertEqual(captures[0]['file'], os.path.join(self.directory, 'app.trigger-1-manual.prof'))
+        self.assertTrue(captures[0]['end'] >= captures[0]['start'] + 0.05)
+
+    def test_kept_files(self):
+        manager = triggers.TriggerManager(os.path.join(self.directory, 'app'), duration = 0.01, hz = 200,
+                                          cooldown = 0.0, keep = 2)
+        for number in range(1, 4):
+            self.assertTrue(manager.fire('manual'))
+            end = time.time() + 5.0
+            while time.time() < end and not any(capture['file'].endswith('app.trigger-%d-manual.prof' % number)
+                                                for capture in manager.capture_list()):
+                time.sleep(0.01)
+        files = [capture['file'] for capture in manager.capture_list()]
+        self.assertEqual([os.path.basename(name) for name in files],
+                         ['app.trigger-2-manual.prof', 'app.trigger-3-manual.prof'])
+        self.assertEqual(sorted(os.listdir(self.directory)),
+                         ['app.trigger-2-manual.prof', 'app.trigger-3-manual.prof'])
+
+class SlowRegionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.profiler = profile.Profile(True, os.path.join(self.directory, 'app'))
+
+    def tearDown(self):
+        self.profiler.stop_triggers()
+        self.profiler.close()
+        shutil.rmtree(self.directory)
+
+    def test_slow_region_captures(self):
+        self.profiler.configure_triggers(duration = 0.3, hz = 200, cooldown = 60.0)
+        self.profiler.trigger_on_latency(0.05, 'request')
+        with self.profiler.region('request'):
+            pass
+        self.assertEqual(self.profiler.trigger_captures(), [])
+        with self.profiler.region('request'):
+            time.sleep(0.1)
+        # Sampled by the capture started at the end of the slow region
+        _busy(0.4)
+        captures = _wait_captures(self.profiler.trigger_captures, 1)
+        self.assertEqual(len(captures), 1)
+        self.assertEqual(captures[0]['reason'], 'latency')
+        self.assertTrue(captures[0]['detail'].startswith('region request took'))
+        self.assertTrue(captures[0]['samples'] > 0)
+        with open(captures[0]['file'], 'rb') as stream:
+            stats = marshal.load(stream)
+        self.assertTrue(cProfile.label(_busy.__code__) in stats)
+
+if __name__ == '__main__':
+    unittest.main()
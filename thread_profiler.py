@@ -0,0 +1,292 @@
+## @file thread_profiler.py
+# @package profiler
+# @brief Deterministic profiler of all the threads, with a collector per thread
+#
+# The cProfile collector hooks only the thread enabling it. The thread profiler installs a bootstrap hook with
+# threading.setprofile(), so every thread started by the threading module after the profiler is enabled creates its
+# own cProfile collector as its first action. Every thread records its calls in its own collector, with no locking
+# and no data shared with the other threads: the collectors are merged only when the statistics are requested, or
+# reported one by one for the per-thread breakdown.\n\n
+# Python 2 can not install a profile hook in a thread already running: the threads started before the profiler is
+# enabled, as the workers of a thread pool, should call attach_thread() themselves, for example from the pool
+# initializer. Likewise a thread stopped by disable() is profiled again only when it calls attach_thread(), the
+# threads started after the profiler is enabled again excepted.\n\n
+# The collectors of the threads exited are merged into a single statistics set when a thread is started or the
+# statistics are requested, so the memory used is bounded by the number of live threads.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.\n
+#
+# Copyright NXP PLMA.  All Rights Reserved.\n
+#
+# Licensed under the Apache License, Version 2.0 (the "License");\n
+# you may not use this file except in compliance with the License.\n
+# You may obtain a copy of the License at\n
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+# either express or implied.  See the License for the specific language
+# governing permissions and limitations under the License.
+#
+# @date March 2016
+# @author Enrico Miglino <enrico.miglino@gmail.com>
+# @version 0.1.5
+# @version documentation version 0.5
+
+import sys, thread, threading, time, platform, marshal
+import cProfile, pstats
+import snapshot
+
+## Name of the pseudo thread holding the merged statistics of the threads exited so far
+FINISHED_THREADS = '<finished threads>'
+
+##
+# Scale of the timer stopping a thread: the CPython 2 collector multiplies the float results of a timer by 2**32,
+# its builtin timer counts the microseconds of gettimeofday() on Unix
+TIMER_SCALE = 1000000 / 4294967296.0
+
+##
+# True if disable() can stop the other threads. The timer stopping them must count in the unit of the builtin timer,
+# known for CPython on Unix only: on Windows the builtin timer counts the ticks of the performance counter
+STOP_THREADS = platform.python_implementation() == 'CPython' and sys.platform != 'win32'
+
+##
+# ThreadEntry class holds the collector of a profiled thread
+class ThreadEntry:
+
+    ##
+    # Constructor
+    #
+    # @param thread The profiled thread
+    # @param collector The cProfile collector of the thread
+    def __init__(self, thread, collector):
+        self.thread = thread
+        self.name = thread.name
+        self.ident = thread.ident
+        self.collector = collector
+        ## True while the collector hooks the thread
+        self.attached = False
+        ## True if the collector has been unhooked by disable(): its pending calls are never closed
+        self.stopped = False
+        ## The statistics of the collectors of the thread stopped by disable()
+        self.retired = {}
+        ## True while the collector waits to be stopped by its own thread
+        self.stopping = False
+        ## The timer stopping the collector from its own thread, created once and kept referenced
+        self.stopper = None
+
+    ## Return the statistics of the thread collected so far, without stopping the collector
+    def snapshot(self):
+        stats = snapshot.take_snapshot(self.collector)
+        if self.retired:
+            return snapshot.merge_snapshots([self.retired, stats])
+        return stats
+
+##
+# ThreadProfiler class is a timing collector with the same interface of cProfile.Profile, profiling all the threads
+class ThreadProfiler:
+
+    ##
+    # Constructor
+    #
+    # @param current The collector already used by the calling thread, kept as the collector of that thread
+    def __init__(self, current = None):
+        self.local = threading.local()
+        ## The profiled threads still alive, as ThreadEntry objects in creation order
+        self.threads = []
+        ## The merged statistics of the threads exited so far
+        self.finished = {}
+        ## The number of threads exited so far
+        self.finished_count = 0
+        self.lock = threading.Lock()
+        ## True while the threads are profiled
+        self.active = False
+        ## The statistics created by the last create_stats() call
+        self.stats = {}
+        if current is not None:
+            self._register(current)
+
+    ## Register a collector as the collector of the calling thread
+    def _register(self, collector):
+        entry = self.local.entry = ThreadEntry(threading.current_thread(), collector)
+        with self.lock:
+            self._prune()
+            self.threads.append(entry)
+        return entry
+
+    ## Return the entry of the calling thread, creating it at the first call
+    def _entry(self):
+        try:
+            return self.local.entry
+        except AttributeError:
+            return self._register(cProfile.Profile())
+
+    ## Return the collector of the calling thread, creating it at the first call
+    def collector(self):
+        return self._entry().collector
+
+    ##
+    # Merge the statistics of the exited threads into the finished threads statistics and drop their collectors
+    #
+    # Called with the lock held, so the number of collectors kept is bounded by the number of live threads.
+    def _prune(self):
+        alive = []
+        dead = []
+        collectors = []
+        for entry in self.threads:
+            if entry.thread.is_alive():
+                alive.append(entry)
+            else:
+                self._cancel_stop(entry)
+                dead.append(entry.snapshot())
+                collectors.append(entry.collector)
+        if dead:
+            self.finished = snapshot.merge_snapshots([self.finished] + dead)
+            self.finished_count += len(dead)
+            self.threads = alive
+            # Started with the thread module, so the new thread is not hooked by the profiler
+            thread.start_new_thread(_release, (collectors,))
+
+    ## Start profiling the calling thread and the threads started from now on
+    def enable(self):
+        self.active = True
+        threading.setprofile(self._bootstrap)
+        with self.lock:
+            for entry in self.threads:
+                if entry.attached:
+                    self._cancel_stop(entry)
+        self.attach_thread()
+
+    ##
+    # Stop profiling all the threads and stop hooking the new threads
+    #
+    # The calling thread is detached at once. The cProfile hook can be removed only by the thread it hooks, so the
+    # collectors of the other threads get a timer stopping them at their next event: a thread waiting on a lock is
+    # stopped when it wakes up, its last call recorded as still pending. The timer depends on the internals of the
+    # CPython 2 collector: where STOP_THREADS is False, as on Windows, the other threads are stopped only by
+    # detach_thread() or when they exit.
+    def disable(self):
+        self.active = False
+        threading.setprofile(None)
+        self.detach_thread()
+        if not STOP_THREADS:
+            return
+        with self.lock:
+            for entry in self.threads:
+                if entry.attached and not entry.stopping:
+                    if entry.stopper is None:
+                        entry.stopper = self._stopper(entry)
+                    entry.stopping = True
+                    entry.collector.__init__(entry.stopper)
+
+    ##
+    # Create the timer stopping the collector of a thread at its next event
+    #
+    # The timer runs in the thread hooked by the collector, inside the collector callback: it removes the hook and
+    # puts back the builtin timer, but it can not disable the collector, that would free the call being recorded. The
+    # time is returned in the unit of the builtin timer on Unix, the microsecond of the wall clock, scaled as the
+    # collector scales the float results.
+    def _stopper(self, entry):
+        clock = time.time
+        def stop():
+            now = clock() * TIMER_SCALE
+            if not self.active:
+                sys.setprofile(None)
+                entry.attached = False
+                entry.stopped = True
+            entry.stopping = False
+            entry.collector.__init__()
+            return now
+        return stop
+
+    ## Cancel the stop of a thread requested by disable() and not done yet
+    def _cancel_stop(self, entry):
+        if entry.stopping:
+            entry.stopping = False
+            entry.collector.__init__()
+
+    ## Return True if the threads are profiled
+    def is_running(self):
+        return self.active
+
+    ##
+    # Start profiling the calling thread, used by the threads started before the profiler was enabled
+    #
+    # The threads stopped by disable() are profiled again by this call only. Their collector has pending calls
+    # never closed, so its statistics are kept apart and the collector is cleared before it is used again.
+    def attach_thread(self):
+        entry = self._entry()
+        self._cancel_stop(entry)
+        if entry.stopped:
+            entry.retired = entry.snapshot()
+            entry.collector.clear()
+            entry.stopped = False
+        entry.attached = True
+        entry.collector.enable()
+
+    ## Stop profiling the calling thread. Its data are kept
+    def detach_thread(self):
+        entry = getattr(self.local, 'entry', None)
+        if entry is not None:
+            self._cancel_stop(entry)
+            entry.attached = False
+            if not entry.stopped:
+                entry.collector.disable()
+
+    ## Profile hook of the new threads: replaced by the cProfile hook of the thread collector at the first event
+    def _bootstrap(self, frame, event, arg):
+        if self.active:
+            self.attach_thread()
+        else:
+            sys.setprofile(None)
+
+    ##
+    # Return the statistics of every thread collected so far, without stopping the collectors
+    #
+    # The threads exited are merged in a single entry named FINISHED_THREADS, with ident 0.
+    #
+    # @return A list of (thread name, thread ident, statistics) tuples, the statistics in the pstats format
+    def thread_snapshots(self):
+        with self.lock:
+            self._prune()
+            threads = list(self.threads)
+            finished = self.finished
+        result = [(entry.name, entry.ident, entry.snapshot()) for entry in threads]
+        if finished:
+            result.append((FINISHED_THREADS, 0, finished))
+        return result
+
+    ## Return the statistics of all the threads merged, in the pstats format, without stopping the collectors
+    def snapshot(self):
+        return snapshot.merge_snapshots([stats for name, ident, stats in self.thread_snapshots()])
+
+    ## Stop profiling the calling thread and record the merged results internally as the current profile
+    def create_stats(self):
+        self.disable()
+        self.stats = self.snapshot()
+
+    ## Create a stats object based on the current profile and print the results to stdout
+    def print_stats(self, sort = -1):
+        pstats.Stats(self).strip_dirs().sort_stats(sort).print_stats()
+
+    ## Write the merged results of the current profile to file, in the same format of cProfile
+    def dump_stats(self, file):
+        f = open(file, 'wb')
+        try:
+            self.create_stats()
+            marshal.dump(self.stats, f)
+        finally:
+            f.close()
+
+##
+# Disable the collectors of the exited threads, run by a thread of its own
+#
+# A cProfile collector dropped while flagged as enabled removes the profile hook of the thread deallocating it, and
+# its disable() call removes the hook of the calling thread: both are done here, where no profiler is hooked.
+def _release(collectors):
+    for collector in collectors:
+        collector.disable()
+    del collectors[:]
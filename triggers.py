@@ -0,0 +1,207 @@
+## @file triggers.py
+# @package profiler
+# @brief Profiling captures triggered by slow regions, memory growth or event loop lag
+#
+# Profiling all the time with the deterministic profiler costs too much in production, but when a request gets slow
+# or the memory jumps the profile of that moment is the most useful one. The triggers watch the cheap measures the
+# profiler already takes and start a capture when a threshold is crossed:
+# <ul>
+# <li>latency: a named region, or any region, runs longer than a threshold (region table listener)</li>
+# <li>memory: the memory usage grows more than a threshold within a time window (memory sampler listener)</li>
+# <li>lag: the lag of the asyncio event loop exceeds a threshold (async profiler heartbeat, async mode only)</li>
+# </ul>
+# A capture runs a high-rate sampling profiler on all the threads for a short time, then writes its statistics to a
+# dump file in the cProfile format and stops. The sampling profiler is used rather than cProfile because the triggers
+# fire from any thread, the memory sampler thread included, while cProfile can profile only the thread enabling it.
+# The captures are bounded: a fixed duration and rate, and a fixed number of dump files, the oldest removed first.\n\n
+# The triggers are rate limited so they can not cascade, as a capture slowing the program down enough to trip the
+# latency trigger again: a trigger firing while a capture runs, or within the cool down period after it, is
+# counted as suppressed and ignored.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.\n
+#
+# Copyright NXP PLMA.  All Rights Reserved.\n
+#
+# Licensed under the Apache License, Version 2.0 (the "License");\n
+# you may not use this file except in compliance with the License.\n
+# You may obtain a copy of the License at\n
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+# either express or implied.  See the License for the specific language
+# governing permissions and limitations under the License.
+#
+# @date March 2016
+# @author Enrico Miglino <enrico.miglino@gmail.com>
+# @version 0.1.5
+# @version documentation version 0.5
+
+import os, time, threading, collections, marshal
+import sampling_profiler
+
+## Default duration of a capture, in seconds
+DEFAULT_DURATION = 1.0
+
+## Default sampling rate of the captures, in samples per second
+DEFAULT_RATE = 1000
+
+## Default time after a capture during which the triggers are ignored, in seconds
+DEFAULT_COOLDOWN = 60.0
+
+## Default number of capture dump files kept
+DEFAULT_KEEP = 10
+
+##
+# TriggerManager class watches the thresholds and runs the captures
+class TriggerManager:
+
+    ##
+    # Constructor
+    #
+    # @param prefix The prefix of the capture dump file names, completed with the capture number and reason
+    # @param duration The duration of a capture, in seconds
+    # @param hz The sampling rate of the captures, in samples per second
+    # @param cooldown The time after a capture during which the triggers are ignored, in seconds
+    # @param keep The number of capture dump files kept
+    def __init__(self, prefix, duration = DEFAULT_DURATION, hz = DEFAULT_RATE, cooldown = DEFAULT_COOLDOWN,
+                 keep = DEFAULT_KEEP):
+        self.prefix = prefix
+        self.configure(duration, hz, cooldown, keep)
+        ## The latency thresholds by region slot
+        self.region_thresholds = {}
+        ## The latency threshold of any region, None if not set
+        self.any_region = None
+        ## The memory growth triggers, as (growth in Mb, window in seconds, sliding window minimum deque) tuples
+        self.memory_triggers = []
+        ## The event loop lag threshold, None if not set
+        self.lag_threshold = None
+        ## The names of the regions by slot, the names list of the region table
+        self.region_names = []
+        ## The completed captures, as dictionaries, oldest first
+        self.captures = collections.deque()
+        ## Number of triggers ignored by the rate limiting
+        self.suppressed = 0
+        ## Number of captures started
+        self.count = 0
+        ## The running capture as (sampling profiler, reason, detail, start time), None when no capture runs
+        self.running = None
+        ## End time of the last capture
+        self.last_end = None
+        self.lock = threading.Lock()
+
+    ##
+    # Change the capture settings, applied from the next capture
+    #
+    # @param duration The duration of a capture, in seconds
+    # @param hz The sampling rate of the captures, in samples per second
+    # @param cooldown The time after a capture during which the triggers are ignored, in seconds
+    # @param keep The number of capture dump files kept
+    def configure(self, duration = DEFAULT_DURATION, hz = DEFAULT_RATE, cooldown = DEFAULT_COOLDOWN,
+                  keep = DEFAULT_KEEP):
+        self.duration = duration
+        self.hz = hz
+        self.cooldown = cooldown
+        self.keep = keep
+
+    ## Forget the capture running in the parent process, called in a child process after a fork
+    def reset(self):
+        self.running = None
+        self.lock = threading.Lock()
+
+    ##
+    # Region table listener, firing the latency triggers
+    #
+    # @param slot The slot of the region
+    # @param wall The wall time of the execution, in seconds
+    # @param cpu The CPU time of the execution, in seconds
+    def region_sample(self, slot, wall, cpu):
+        threshold = self.region_thresholds.get(slot, self.any_region)
+        if threshold is not None and wall > threshold:
+            self.fire('latency', 'region %s took %.3f ms' % (self.region_names[slot], wall * 1000))
+
+    ##
+    # Memory sampler listener, firing the memory growth triggers
+    #
+    # The minimum memory usage of every window is kept in a monotonic deque, so every sample costs a constant time.
+    #
+    # @param timestamp The time of the sample
+    # @param value The memory usage, in Mb
+    def memory_sample(self, timestamp, value):
+        for growth, window, minimum in self.memory_triggers:
+            while minimum and minimum[-1][1] >= value:
+                minimum.pop()
+            minimum.append((timestamp, value))
+            while minimum[0][0] < timestamp - window:
+                minimum.popleft()
+            if value - minimum[0][1] >= growth:
+                if self.fire('memory', 'grown %.1f Mb in %.1f s' % (value - minimum[0][1], timestamp - minimum[0][0])):
+                    minimum.clear()
+                    minimum.append((timestamp, value))
+
+    ##
+    # Event loop heartbeat listener, firing the lag trigger
+    #
+    # @param lag The lag of the heartbeat, in seconds
+    def lag_sample(self, lag):
+        if self.lag_threshold is not None and lag > self.lag_threshold:
+            self.fire('lag', 'event loop lag %.3f ms' % (lag * 1000))
+
+    ##
+    # Start a capture, unless a capture is running or the cool down period is not over
+    #
+    # @param reason The kind of trigger: 'latency', 'memory', 'lag' or any other name
+    # @param detail The description of the crossed threshold
+    # @return True if the capture has been started
+    def fire(self, reason, detail = ''):
+        now = time.time()
+        with self.lock:
+            if self.running is not None or (self.last_end is not None and now - self.last_end < self.cooldown):
+                self.suppressed += 1
+                return False
+            collector = sampling_profiler.SamplingProfiler(self.hz)
+            self.running = collector, reason, detail, now
+            self.count += 1
+            number = self.count
+        thread = threading.Thread(target = self._capture, args = (collector, number, self.duration),
+                                  name = 'profiler-trigger-capture')
+        thread.daemon = True
+        thread.start()
+        sampling_profiler.ignore_thread(thread)
+        return True
+
+    ## Run a capture, executed by the capture thread which is not sampled
+    def _capture(self, collector, number, duration):
+        collector.ignored.add(threading.current_thread().ident)
+        collector.enable()
+        time.sleep(duration)
+        self._finish(number)
+
+    ## Stop the running capture and write its dump file
+    def _finish(self, number):
+        with self.lock:
+            if self.running is None:
+                return
+            collector, reason, detail, start = self.running
+            collector.disable()
+            self.running = None
+            self.last_end = time.time()
+        filename = '%s.trigger-%d-%s.prof' % (self.prefix, number, reason)
+        out = open(filename, 'wb')
+        try:
+            marshal.dump(collector.snapshot(), out)
+        finally:
+            out.close()
+        self.captures.append({'reason': reason, 'detail': detail, 'start': start, 'end': self.last_end,
+                              'samples': collector.ticks, 'file': filename})
+        while len(self.captures) > self.keep:
+            oldest = self.captures.popleft()['file']
+            if os.path.exists(oldest):
+                os.remove(oldest)
+
+    ## Return the completed captures, as dictionaries with the reason, detail, start, end, samples and file keys
+    def capture_list(self):
+        return list(self.captures)